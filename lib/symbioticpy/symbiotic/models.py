@@ -0,0 +1,122 @@
+#!/usr/bin/python
+
+import os
+
+from . utils import dbg
+
+
+def _parse_model_path(relpath):
+    """
+    Split the path of a model relative to the lib/ directory
+    into (category, tool, symbol). The tool is None for generic models.
+    """
+    parts = relpath.split('/')
+    name = parts[-1]
+    symbol = name[:name.rfind('.')]
+    if len(parts) == 2:
+        return parts[0], None, symbol
+    if len(parts) == 3:
+        return parts[0], parts[1], symbol
+    return None, None, None
+
+
+class ModelIndex(object):
+    """
+    Index of the models of undefined functions. The models are either
+    precompiled bitcode files (listed in llvm-X/lib{,32}/models.index that is
+    generated by scripts/precompile_bitcode_files.sh) or C files in lib/.
+    The index stores also the undefined symbols of every model, so that
+    we can compute what models the linked models need without linking them.
+    """
+
+    def __init__(self, symbiotic_dir, llvm_version, is32bit):
+        # (category, tool) -> {symbol -> path}, the tool is None for generic models
+        self._models = {}
+        # path -> undefined symbols of the model
+        self._deps = {}
+        # cache of resolved symbols for (categories, tool)
+        self._resolved = {}
+
+        # add the sources first, so that the precompiled files take precedence
+        self._scan_sources(os.path.join(symbiotic_dir, 'lib'))
+
+        libdir = os.path.join(symbiotic_dir, 'llvm-{0}'.format(llvm_version),
+                              'lib32' if is32bit else 'lib')
+        index = os.path.join(libdir, 'models.index')
+        if os.path.isfile(index):
+            self._load_index(libdir, index)
+        else:
+            dbg("No index of precompiled models: '{0}'".format(index))
+
+    def _add(self, relpath, path):
+        category, tool, symbol = _parse_model_path(relpath)
+        if category is None:
+            return
+        self._models.setdefault((category, tool), {})[symbol] = path
+
+    def _scan_sources(self, libdir):
+        if not os.path.isdir(libdir):
+            return
+
+        for root, _, files in os.walk(libdir):
+            for f in files:
+                if not f.endswith('.c'):
+                    continue
+                path = os.path.abspath(os.path.join(root, f))
+                self._add(os.path.relpath(path, libdir), path)
+
+    def _load_index(self, libdir, index):
+        # the lines have the format 'path: undefined symbols of the model',
+        # older indices contain only the paths
+        with open(index, 'r') as f:
+            for line in f:
+                relpath, sep, deps = line.partition(':')
+                relpath = relpath.strip()
+                if not relpath:
+                    continue
+                path = os.path.abspath(os.path.join(libdir, relpath))
+                self._add(relpath, path)
+                if sep:
+                    self._deps[path] = deps.split()
+
+    def deps(self, path):
+        """
+        Return the undefined symbols of the model in path
+        or None if we do not know them
+        """
+        return self._deps.get(path)
+
+    def set_deps(self, path, deps):
+        self._deps[path] = list(deps)
+
+    def resolve(self, categories, tool):
+        """
+        Return a dictionary that maps undefined symbols to the files
+        with their models. The categories are searched in the given order,
+        models specific for the tool take precedence over the generic ones.
+        """
+        key = (tuple(categories), tool)
+        models = self._resolved.get(key)
+        if models is not None:
+            return models
+
+        models = {}
+        # fill the dictionary from the lowest priority,
+        # so that the models with higher priority overwrite the others
+        for category in reversed(categories):
+            models.update(self._models.get((category, None), {}))
+            models.update(self._models.get((category, tool), {}))
+
+        self._resolved[key] = models
+        return models
+
+
+_indices = {}
+
+def get_model_index(symbiotic_dir, llvm_version, is32bit):
+    key = (symbiotic_dir, llvm_version, is32bit)
+    index = _indices.get(key)
+    if index is None:
+        index = ModelIndex(symbiotic_dir, llvm_version, is32bit)
+        _indices[key] = index
+    return index
@@ -108,6 +108,26 @@ class SymbioticOptions(object):
         self.save_files = False
         self.working_dir_prefix = '/tmp'
         self.unroll_count = 0
+        # number of parallel jobs (0 means the number of CPUs)
+        self.jobs = 0
+        # fuse consecutive runs of opt into a single run
+        self.fuse_opt = True
+        # run the verifiers of the target concurrently
+        self.parallel_portfolio = False
+        # write the whole output of verifiers into compressed files
+        self.spill_tool_output = False
+        # convert the tests into the test-suite while KLEE is running
+        self.live_test_export = False
+        # write the test-suite also into this zip archive
+        self.test_suite_zip = None
+        # remove tests that do not increase the coverage
+        self.minimize_test_suite = False
+        # persistent cache of the outputs of symbiotic-cc stages
+        self.cache_dir = None
+        # maximal size of the cache in MB
+        self.cache_size = 1024
+        # prepare the unsliced file in the background while slicing
+        self.speculative_unsliced = True
 
 def _remove_linkundef(options, what):
     try:
@@ -202,7 +222,7 @@ def parse_command_line():
     options = SymbioticOptions()
 
     try:
-        opts, args = getopt.getopt(argv[1:], '',
+        opts, args = getopt.getopt(argv[1:], 'j:',
                                    ['no-slice', '32', '64', 'prp=', 'no-optimize',
                                     'debug=', 'timeout=','slicer-timeout=',
                                     'instrumentation-timeout=', 'version', 'help',
@@ -223,7 +243,11 @@ def parse_command_line():
                                     'overflow-with-clang', 'gen-ll', 'gen-c', 'test-suite=',
                                     'search-include-paths', 'replay-error', 'cc',
                                     'report=',
-                                    'unroll=', 'full-instrumentation', 'target-settings='])
+                                    'unroll=', 'full-instrumentation', 'target-settings=',
+                                    'cache-dir=', 'cache-size=', 'no-fuse-opt', 'jobs=',
+                                    'parallel-portfolio', 'spill-tool-output',
+                                    'live-test-export', 'test-suite-zip=',
+                                    'minimize-test-suite', 'no-speculative-unsliced'])
                                    # add klee-params
     except getopt.GetoptError as e:
         err('{0}'.format(str(e)))
@@ -382,6 +406,11 @@ def parse_command_line():
         elif opt == '--save-files':
             options.save_files = True
             options.generate_ll = True
+            # keep the intermediate file of every step
+            options.fuse_opt = False
+        elif opt == '--no-fuse-opt':
+            dbg('Will run every opt stage separately')
+            options.fuse_opt = False
         elif opt == '--working-dir-prefix':
             wdr = os.path.abspath(arg)
             if not os.path.isdir(wdr):
@@ -413,6 +442,34 @@ def parse_command_line():
             options.full_instrumentation = True
         elif opt == '--test-suite':
             options.testsuite_output = os.path.abspath(arg)
+        elif opt == '--jobs' or opt == '-j':
+            try:
+                options.jobs = int(arg)
+            except ValueError:
+                err('Invalid numerical argument for jobs: {0}'.format(arg))
+        elif opt == '--spill-tool-output':
+            options.spill_tool_output = True
+        elif opt == '--live-test-export':
+            options.live_test_export = True
+        elif opt == '--test-suite-zip':
+            options.test_suite_zip = os.path.abspath(arg)
+            # the tests are put into the archive as they are exported
+            options.live_test_export = True
+        elif opt == '--minimize-test-suite':
+            options.minimize_test_suite = True
+        elif opt == '--no-speculative-unsliced':
+            options.speculative_unsliced = False
+        elif opt == '--parallel-portfolio':
+            dbg('Will run the verifiers in parallel')
+            options.parallel_portfolio = True
+        elif opt == '--cache-dir':
+            options.cache_dir = os.path.abspath(os.path.expanduser(arg))
+            dbg('Will cache the outputs of stages in {0}'.format(options.cache_dir))
+        elif opt == '--cache-size':
+            try:
+                options.cache_size = int(arg)
+            except ValueError:
+                err('Invalid numerical argument for cache size: {0}'.format(arg))
 
     return options, args
 
@@ -495,6 +552,10 @@ where OPTS can be following:
     --verifier-params=STR     Pass parameters directly to the verifier
     --save-files              Do not remove working files after running.
                               The files will be stored in the symbiotic_files directory.
+                              Implies --no-fuse-opt.
+    --no-fuse-opt             Run every opt stage separately instead of fusing
+                              consecutive stages into one run of opt (for debugging,
+                              with --gen-ll you get the .ll file of every stage)
     --no-link                 Do not link missing functions from the given category
                               (libc, svcomp, verifier, posix, kernel). The argument
                               is a comma-separated list of values.
@@ -509,14 +570,40 @@ where OPTS can be following:
     --statistics              Dump statistics about bitcode
     --working-dir-prefix      Where to create the temporary directory (defaults to /tmp)
     --replay-error            Try replaying a found error on non-sliced code
+    --no-speculative-unsliced Do not prepare the non-sliced code (for replaying errors
+                              and as the fallback) in the background while slicing,
+                              prepare it only when it is needed
     --search-include-paths    Try automatically finding paths with standard include directories
     --sv-comp                 Shortcut for SV-COMP settings (malloc-never-fails, etc.)
     --test-comp               Shortcut for TEST-COMP settings
     --test-suite              Output for tests if --test-comp options is on
+    --live-test-export        With --test-comp, convert the tests into the test-suite
+                              while KLEE is still running, so that the test-suite
+                              is complete up to the last test even on timeout
+    --test-suite-zip=FILE     With --test-comp, write the test-suite (metadata and tests)
+                              also into the zip archive FILE while KLEE is running
+                              (implies --live-test-export)
+    --minimize-test-suite     With --test-comp and the coverage property, replay the tests
+                              natively with coverage instrumentation (needs clang)
+                              and keep only tests that are needed for the coverage
     --full-instrumentation    Tranform checking errors to reachability problem, i.e.
                               instrument tracking of the state of the program directly
                               into the program.
     --require-slicer          Abort if slicing fails/timeouts
+    -j N, --jobs=N            Run at most N jobs (e.g., compilations) in parallel,
+                              the default is the number of CPUs
+    --parallel-portfolio      Run the independent verifiers of the target (e.g., KLEE
+                              and slowbeast with --sv-comp) concurrently, each on its
+                              own copy of the bitcode, and take the first true/false
+                              answer, the fallbacks run one by one afterwards
+    --spill-tool-output       Write the whole output of the verifier into a gzipped
+                              file in the working directory (use with --save-files),
+                              only the relevant part of the output is kept in memory
+    --cache-dir=DIR           Cache the outputs of compilation, instrumentation,
+                              optimizations, linking and slicing in DIR and reuse
+                              them when running on the same input again
+    --cache-size=MB           Maximal size of the cache in MB (default 1024),
+                              the least recently used entries are evicted
 
     The sources can be LLVM bitcode, C code, or both mixed together.
     C files are compiled into LLVM bitcode and all the input files are linked
@@ -33,18 +33,32 @@ class Symbiotic(object):
 
         # tool to use
         self._tool = tool
+        # the compiler, it may prepare the unsliced file in the background
+        self._cc = None
+
+    def _cancel_background(self):
+        if self._cc:
+            self._cc.cancel_preparing_unsliced_file()
 
     def terminate(self):
+        self._cancel_background()
         pr = ProcessRunner()
         if pr.hasProcess():
             pr.terminate()
 
     def kill(self):
+        self._cancel_background()
         pr = ProcessRunner()
         if pr.hasProcess():
             pr.kill()
 
     def kill_wait(self):
+        self._cancel_background()
+        self._kill_wait()
+        if self._cc:
+            self._cc.stop_preparing_unsliced_file()
+
+    def _kill_wait(self):
         pr = ProcessRunner()
         if not pr.hasProcess():
             return
@@ -54,10 +68,11 @@ class Symbiotic(object):
             while pr.exitStatus() is None:
                 pr.kill()
 
-                print('Waiting for the child process to terminate')
+                print('Waiting for the child processes to terminate')
                 sleep(0.5)
 
-            print('Killed the child process')
+            print('Killed the child processes')
+        pr.reap()
 
     def replay_nonsliced(self, tool, cc):
         bitcode = cc.prepare_unsliced_file()
@@ -80,6 +95,7 @@ class Symbiotic(object):
     def _run_symbiotic(self):
         options = self.options
         cc = SymbioticCC(self.sources, self._tool, options, self.env)
+        self._cc = cc
         bitcode = cc.run()
 
         if options.no_verification:
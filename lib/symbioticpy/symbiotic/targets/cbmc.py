@@ -32,6 +32,7 @@ except ImportError:
 
 from symbiotic.utils.process import runcmd
 from symbiotic.utils.watch import DbgWatch
+from symbiotic.utils.matcher import OutputMatcher
 from . tool import SymbioticBaseTool
 
 try:
@@ -40,6 +41,18 @@ except ImportError:
     # the default version
     llvm_version='8.0.1'
 
+# the last line of the output in SV-COMP mode
+_svcomp_matcher = OutputMatcher([
+    (result.RESULT_TRUE_PROP, r'\s*(TRUE|VERIFICATION SUCCESSFUL)\s*$'),
+    (result.RESULT_FALSE_MEMTRACK, r'\s*FALSE\(valid-memtrack\)\s*$'),
+    (result.RESULT_FALSE_DEREF, r'\s*FALSE\(valid-deref\)\s*$'),
+    (result.RESULT_FALSE_FREE, r'\s*FALSE\(valid-free\)\s*$'),
+    (result.RESULT_FALSE_OVERFLOW, r'\s*FALSE\(no-overflow\)\s*$'),
+    (result.RESULT_FALSE_MEMCLEANUP, r'\s*FALSE\(valid-memcleanup\)\s*$'),
+    (result.RESULT_FALSE_REACH, '.*FALSE'),
+    (result.RESULT_UNKNOWN, r'\s*UNKNOWN\s*$'),
+])
+
 class SymbioticTool(BaseTool, SymbioticBaseTool):
     """
     Tool info for CBMC (http://www.cprover.org/cbmc/).
@@ -142,25 +155,7 @@ class SymbioticTool(BaseTool, SymbioticBaseTool):
                 status = self.parse_XML(output, returncode, isTimeout)
             elif len(output) > 0:
                 # SV-COMP mode
-                result_str = output[-1].strip()
-
-                if result_str == 'TRUE' or result_str == b'VERIFICATION SUCCESSFUL':
-                    status = result.RESULT_TRUE_PROP
-                elif b'FALSE' in result_str:
-                    if result_str == 'FALSE(valid-memtrack)':
-                        status = result.RESULT_FALSE_MEMTRACK
-                    elif result_str == 'FALSE(valid-deref)':
-                        status = result.RESULT_FALSE_DEREF
-                    elif result_str == 'FALSE(valid-free)':
-                        status = result.RESULT_FALSE_FREE
-                    elif result_str == 'FALSE(no-overflow)':
-                        status = result.RESULT_FALSE_OVERFLOW
-                    elif result_str == 'FALSE(valid-memcleanup)':
-                        status = result.RESULT_FALSE_MEMCLEANUP
-                    else:
-                        status = result.RESULT_FALSE_REACH
-                elif 'UNKNOWN' in output:
-                    status = result.RESULT_UNKNOWN
+                status = _svcomp_matcher.match(output[-1]) or status
 
         elif returncode == 64 and 'Usage error!\n' in output:
             status = 'INVALID ARGUMENTS'
@@ -167,7 +167,6 @@ class SymbioticTool(BaseTool, SymbioticBaseTool):
         status = None
 
         for line in output:
-            line = line.decode('ascii')
             if 'java.lang.OutOfMemoryError' in line:
                 status = 'OUT OF JAVA MEMORY'
             elif isOutOfNativeMemory(line):
@@ -17,11 +17,20 @@ except ImportError:
     import symbiotic.benchexec.result as result
     from symbiotic.benchexec.tools.template import BaseTool
 
+from symbiotic.utils.matcher import OutputMatcher
 from . tool import SymbioticBaseTool
 
 
 SOFTTIMELIMIT = 'timelimit'
 
+_output_matcher = OutputMatcher([
+    (result.RESULT_FALSE_FREE, '.*error: double free'),
+    (result.RESULT_FALSE_DEREF, '.*error: buffer overflow'),
+    (result.RESULT_FALSE_REACH, '.*error: assertion never holds'),
+    (result.RESULT_TRUE_PROP, '.*The program is SAFE'),
+    (result.RESULT_UNKNOWN, '.*The program is potentially UNSAFE'),
+])
+
 class SymbioticTool(BaseTool, SymbioticBaseTool):
     """
     Tool info for CPAchecker.
@@ -59,21 +68,12 @@ class SymbioticTool(BaseTool, SymbioticBaseTool):
 
         return [executable] + options + opts + tasks
 
+    def classify_output_line(self, line):
+        return _output_matcher.match(line)
+
     def determine_result(self, returncode, returnsignal, output, isTimeout):
         # TODO: fixme for memsafety
-        for line in output:
-            if 'error: double free' in line:
-                return result.RESULT_FALSE_FREE
-            elif 'error: buffer overflow' in line:
-                return result.RESULT_FALSE_DEREF
-            elif 'error: assertion never holds' in line:
-                return result.RESULT_FALSE_REACH
-            elif 'The program is SAFE' in line:
-                return result.RESULT_TRUE_PROP
-            elif 'The program is potentially UNSAFE' in line:
-                return result.RESULT_UNKNOWN
-
-        return result.RESULT_ERROR
+        return _output_matcher.first(output) or result.RESULT_ERROR
 
     def llvm_version(self):
         """
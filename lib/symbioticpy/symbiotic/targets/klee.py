@@ -19,8 +19,6 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-import re
-
 try:
     import benchexec.util as util
     import benchexec.result as result
@@ -29,6 +27,7 @@ except ImportError:
     import symbiotic.benchexec.util as util
     import symbiotic.benchexec.result as result
 
+from symbiotic.utils.matcher import OutputMatcher
 from . kleebase import SymbioticTool as KleeBase
 
 class KleeToolFullInstrumentation(KleeBase):
@@ -40,42 +39,40 @@ class KleeToolFullInstrumentation(KleeBase):
         KleeBase.__init__(self, opts)
 
         # define and compile regular expressions for parsing klee's output
-        self._patterns = [
-            ('EDOUBLEFREE', re.compile('.*ASSERTION FAIL: 0 && "double free".*')),
-            ('EINVALFREE', re.compile(
-                '.*ASSERTION FAIL: 0 && "free on non-allocated memory".*')),
-            ('EMEMLEAK', re.compile('.*ASSERTION FAIL: 0 && "memory leak detected".*')),
-            ('ASSERTIONFAILED', re.compile('.*ASSERTION FAIL:.*')),
-            ('ESTPTIMEOUT', re.compile('.*query timed out (resolve).*')),
-            ('EKLEETIMEOUT', re.compile('.*HaltTimer invoked.*')),
-            ('EEXTENCALL', re.compile('.*failed external call*')),
-            ('ELOADSYM', re.compile('.*ERROR: unable to load symbol.*')),
-            ('EINVALINST', re.compile('.*LLVM ERROR: Code generator does not support.*')),
-            ('EKLEEASSERT', re.compile('.*klee: .*Assertion .* failed.*')),
-            ('EINITVALS', re.compile('.*unable to compute initial values.*')),
-            ('ESYMSOL', re.compile('.*unable to get symbolic solution.*')),
-            ('ESILENTLYCONCRETIZED', re.compile('.*silently concretizing.*')),
-            ('EEXTRAARGS', re.compile('.*calling .* with extra arguments.*')),
-            ('EPTRCMP', re.compile('.*WARNING.*: comparison of two pointers.*')),
-            ('EMALLOC', re.compile('.*found huge malloc, returning 0.*')),
-            ('ESKIPFORK', re.compile('.*skipping fork.*')),
-            ('EKILLSTATE', re.compile('.*killing.*states \(over memory cap\).*')),
-            ('EMEMALLOC', re.compile('.*KLEE: WARNING: Allocating memory failed.*')),
-            ('EROSYMB', re.compile('.*cannot make readonly object symbolic.*')),
-            ('ESTACKOVFLW', re.compile('.*WARNING: Maximum stack size reached.*')),
-            ('EMEMERROR', re.compile('.*memory error: out of bound pointer.*')),
-            ('EFUNMODEL', re.compile('.*: unsupported function model.*')),
-            ('EMAKESYMBOLIC', re.compile(
-                '.*memory error: invalid pointer: make_symbolic.*')),
-            ('EVECTORUNSUP', re.compile('.*XXX vector instructions unhandled.*')),
-            ('EFREE', re.compile('.*memory error: invalid pointer: free.*')),
-            ('EASM', re.compile('.*ERROR:.*inline assembly is unsupported.*')),
-            ('EGLOBLFREE', re.compile('.*ERROR:.*free of global.*')),
-            ('EUNREACH', re.compile('.*reached "unreachable" instruction.*')),
-            ('ECMP', re.compile('.*Comparison other than (in)equality is not implemented.*')),
-            ('ERESOLV', re.compile('.*Failed resolving.*segment.*')),
-            ('ERESOLV', re.compile('.*ERROR:.*Could not resolve.*'))
-        ]
+        self._matcher = OutputMatcher([
+            ('EDOUBLEFREE', '.*ASSERTION FAIL: 0 && "double free".*'),
+            ('EINVALFREE', '.*ASSERTION FAIL: 0 && "free on non-allocated memory".*'),
+            ('EMEMLEAK', '.*ASSERTION FAIL: 0 && "memory leak detected".*'),
+            ('ASSERTIONFAILED', '.*ASSERTION FAIL:.*'),
+            ('ESTPTIMEOUT', '.*query timed out (resolve).*'),
+            ('EKLEETIMEOUT', '.*HaltTimer invoked.*'),
+            ('EEXTENCALL', '.*failed external call*'),
+            ('ELOADSYM', '.*ERROR: unable to load symbol.*'),
+            ('EINVALINST', '.*LLVM ERROR: Code generator does not support.*'),
+            ('EKLEEASSERT', '.*klee: .*Assertion .* failed.*'),
+            ('EINITVALS', '.*unable to compute initial values.*'),
+            ('ESYMSOL', '.*unable to get symbolic solution.*'),
+            ('ESILENTLYCONCRETIZED', '.*silently concretizing.*'),
+            ('EEXTRAARGS', '.*calling .* with extra arguments.*'),
+            ('EPTRCMP', '.*WARNING.*: comparison of two pointers.*'),
+            ('EMALLOC', '.*found huge malloc, returning 0.*'),
+            ('ESKIPFORK', '.*skipping fork.*'),
+            ('EKILLSTATE', '.*killing.*states \(over memory cap\).*'),
+            ('EMEMALLOC', '.*KLEE: WARNING: Allocating memory failed.*'),
+            ('EROSYMB', '.*cannot make readonly object symbolic.*'),
+            ('ESTACKOVFLW', '.*WARNING: Maximum stack size reached.*'),
+            ('EMEMERROR', '.*memory error: out of bound pointer.*'),
+            ('EFUNMODEL', '.*: unsupported function model.*'),
+            ('EMAKESYMBOLIC', '.*memory error: invalid pointer: make_symbolic.*'),
+            ('EVECTORUNSUP', '.*XXX vector instructions unhandled.*'),
+            ('EFREE', '.*memory error: invalid pointer: free.*'),
+            ('EASM', '.*ERROR:.*inline assembly is unsupported.*'),
+            ('EGLOBLFREE', '.*ERROR:.*free of global.*'),
+            ('EUNREACH', '.*reached "unreachable" instruction.*'),
+            ('ECMP', '.*Comparison other than (in)equality is not implemented.*'),
+            ('ERESOLV', '.*Failed resolving.*segment.*'),
+            ('ERESOLV', '.*ERROR:.*Could not resolve.*')
+        ])
 
     def passes_after_slicing(self):
         """
@@ -120,7 +117,7 @@ class KleeToolFullInstrumentation(KleeBase):
         """
         Compose the command line to execute from the name of the executable
         """
-        cmd = [executable, '--max-memory=8000',
+        cmd = [executable, '--max-memory={0}'.format(self.max_memory(rlimits)),
                '-dump-states-on-halt=0', '-silent-klee-assume=1',
                '-output-stats=0', '--optimize=false', '-only-output-states-covering-new=1',
                '-max-time={0}'.format(self._options.timeout),
@@ -131,27 +128,34 @@ class KleeToolFullInstrumentation(KleeBase):
 
         return cmd + options + tasks + self._options.argv
 
-    def _parse_klee_output_line(self, line):
-        for (key, pattern) in self._patterns:
-            if pattern.match(line):
-                if key == 'ASSERTIONFAILED':
-                    if self._options.property.memsafety():
-                        return result.RESULT_FALSE_DEREF
-                    elif self._options.property.signedoverflow():
-                        return result.RESULT_FALSE_OVERFLOW
-                    elif self._options.property.termination():
-                        return result.RESULT_FALSE_TERMINATION
-                    elif self._options.property.memcleanup():
-                        return result.RESULT_FALSE_MEMCLEANUP
-                    return result.RESULT_FALSE_REACH
-                elif self._options.property.memsafety():
-                    if key == 'EDOUBLEFREE' or key == 'EINVALFREE':
-                        return result.RESULT_FALSE_FREE
-                    if key == 'EMEMLEAK':
-                        return result.RESULT_FALSE_MEMTRACK
-                return key
+    def classify_output_line(self, line):
+        """
+        Return the class of the line of KLEE's output
+        or None if the line is not interesting
+        """
+        return self._matcher.match(line)
 
-        return None
+    def _parse_klee_output_line(self, line):
+        key = self._matcher.match(line)
+        if key is None:
+            return None
+
+        if key == 'ASSERTIONFAILED':
+            if self._options.property.memsafety():
+                return result.RESULT_FALSE_DEREF
+            elif self._options.property.signedoverflow():
+                return result.RESULT_FALSE_OVERFLOW
+            elif self._options.property.termination():
+                return result.RESULT_FALSE_TERMINATION
+            elif self._options.property.memcleanup():
+                return result.RESULT_FALSE_MEMCLEANUP
+            return result.RESULT_FALSE_REACH
+        elif self._options.property.memsafety():
+            if key == 'EDOUBLEFREE' or key == 'EINVALFREE':
+                return result.RESULT_FALSE_FREE
+            if key == 'EMEMLEAK':
+                return result.RESULT_FALSE_MEMTRACK
+        return key
 
     def determine_result(self, returncode, returnsignal, output, isTimeout):
         if isTimeout:
@@ -198,47 +202,46 @@ class SymbioticTool(KleeBase):
             self.FullInstr = KleeToolFullInstrumentation(opts)
 
         # define and compile regular expressions for parsing klee's output
-        self._patterns = [
-            ('ASSERTIONFAILED', re.compile('.*ASSERTION FAIL:.*')),
-            ('ASSERTIONFAILED2', re.compile('.Assertion .* failed.*')),
-            ('ESTPTIMEOUT', re.compile('.*query timed out (resolve).*')),
-            ('EKLEETIMEOUT', re.compile('.*HaltTimer invoked.*')),
-            ('EEXTENCALL', re.compile('.*failed external call.*')),
-            ('EEXTENCALLDIS', re.compile('.*external calls disallowed.*')),
-            ('ELOADSYM', re.compile('.*ERROR: unable to load symbol.*')),
-            ('EINVALINST', re.compile('.*LLVM ERROR: Code generator does not support.*')),
-            ('EINITVALS', re.compile('.*unable to compute initial values.*')),
-            ('ESYMSOL', re.compile('.*unable to get symbolic solution.*')),
-            ('ESILENTLYCONCRETIZED', re.compile('.*silently concretizing.*')),
-            ('EEXTRAARGS', re.compile('.*calling .* with extra arguments.*')),
-            ('EPTRCMP', re.compile('.*WARNING.*: comparison of two pointers.*')),
-            ('EMALLOC', re.compile('.*found huge malloc, returning 0.*')),
-            ('ESKIPFORK', re.compile('.*skipping fork.*')),
-            ('EKILLSTATE', re.compile('.*killing.*states \(over memory cap\).*')),
-            ('EMEMERROR', re.compile('.*memory error: out of bound pointer.*')),
-            ('EMAKESYMBOLIC', re.compile(
-                '.*memory error: invalid pointer: make_symbolic.*')),
-            ('EVECTORUNSUP', re.compile('.*XXX vector instructions unhandled.*')),
-            ('EFREE', re.compile('.*memory error: invalid pointer: free.*')),
-            ('EASM', re.compile('.*ERROR:.*inline assembly is unsupported.*')),
-            ('EGLOBLFREE', re.compile('.*ERROR:.*free of global.*')),
-            ('EMEMALLOC', re.compile('.*KLEE: WARNING: Allocating memory failed.*')),
-            ('ESTACKOVFLW', re.compile('.*WARNING: Maximum stack size reached.*')),
-            ('EROSYMB', re.compile('.*cannot make readonly object symbolic.*')),
-            ('EFUNMODEL', re.compile('.*: unsupported function model.*')),
-            ('EMEMLEAK', re.compile('.*memory error: memory leak detected.*')),
-            ('EMEMCLEANUP', re.compile('.*memory error: memory not cleaned up.*')),
-            ('EFREEALLOCA', re.compile('.*ERROR:.*free of alloca.*')),
-            ('EINVREALLOC', re.compile('.*memory error:.*invalid pointer:.*realloc.*')),
-            ('EROREALLOC', re.compile('.*memory error:.*realloc of read-only object.*')),
-            ('EROREALLOC', re.compile('.*memory error:.*realloc on local object.*')),
-            ('EROREALLOC', re.compile('.*memory error:.*realloc on global object.*')),
-            ('ERESOLVMEMCLN', re.compile('.*Failed resolving segment in memcleanup check.*')),
-            ('ERESOLVMEMCLN2', re.compile('.*Cannot resolve non-constant segment in memcleanup check.*')),
-            ('ECMP', re.compile('.*Comparison other than (in)equality is not implemented.*')),
-            ('ERESOLV', re.compile('.*Failed resolving.*segment.*')),
-            ('ERESOLV', re.compile('.*ERROR:.*Could not resolve.*'))
-        ]
+        self._matcher = OutputMatcher([
+            ('ASSERTIONFAILED', '.*ASSERTION FAIL:.*'),
+            ('ASSERTIONFAILED2', '.Assertion .* failed.*'),
+            ('ESTPTIMEOUT', '.*query timed out (resolve).*'),
+            ('EKLEETIMEOUT', '.*HaltTimer invoked.*'),
+            ('EEXTENCALL', '.*failed external call.*'),
+            ('EEXTENCALLDIS', '.*external calls disallowed.*'),
+            ('ELOADSYM', '.*ERROR: unable to load symbol.*'),
+            ('EINVALINST', '.*LLVM ERROR: Code generator does not support.*'),
+            ('EINITVALS', '.*unable to compute initial values.*'),
+            ('ESYMSOL', '.*unable to get symbolic solution.*'),
+            ('ESILENTLYCONCRETIZED', '.*silently concretizing.*'),
+            ('EEXTRAARGS', '.*calling .* with extra arguments.*'),
+            ('EPTRCMP', '.*WARNING.*: comparison of two pointers.*'),
+            ('EMALLOC', '.*found huge malloc, returning 0.*'),
+            ('ESKIPFORK', '.*skipping fork.*'),
+            ('EKILLSTATE', '.*killing.*states \(over memory cap\).*'),
+            ('EMEMERROR', '.*memory error: out of bound pointer.*'),
+            ('EMAKESYMBOLIC', '.*memory error: invalid pointer: make_symbolic.*'),
+            ('EVECTORUNSUP', '.*XXX vector instructions unhandled.*'),
+            ('EFREE', '.*memory error: invalid pointer: free.*'),
+            ('EASM', '.*ERROR:.*inline assembly is unsupported.*'),
+            ('EGLOBLFREE', '.*ERROR:.*free of global.*'),
+            ('EMEMALLOC', '.*KLEE: WARNING: Allocating memory failed.*'),
+            ('ESTACKOVFLW', '.*WARNING: Maximum stack size reached.*'),
+            ('EROSYMB', '.*cannot make readonly object symbolic.*'),
+            ('EFUNMODEL', '.*: unsupported function model.*'),
+            ('EMEMLEAK', '.*memory error: memory leak detected.*'),
+            ('EMEMCLEANUP', '.*memory error: memory not cleaned up.*'),
+            ('EFREEALLOCA', '.*ERROR:.*free of alloca.*'),
+            ('EINVREALLOC', '.*memory error:.*invalid pointer:.*realloc.*'),
+            ('EROREALLOC', '.*memory error:.*realloc of read-only object.*'),
+            ('EROREALLOC', '.*memory error:.*realloc on local object.*'),
+            ('EROREALLOC', '.*memory error:.*realloc on global object.*'),
+            ('ERESOLVMEMCLN', '.*Failed resolving segment in memcleanup check.*'),
+            ('ERESOLVMEMCLN2', '.*Cannot resolve non-constant segment in memcleanup check.*'),
+            ('ECMP', '.*Comparison other than (in)equality is not implemented.*'),
+            ('ERESOLV', '.*Failed resolving.*segment.*'),
+            ('ERESOLV', '.*ERROR:.*Could not resolve.*')
+        ])
 
     def passes_after_slicing(self):
         if self.FullInstr:
@@ -265,9 +268,12 @@ class SymbioticTool(KleeBase):
                '-external-calls=pure',
                #'--output-istats=0',
                '-output-dir={0}'.format(opts.testsuite_output),
-               '-write-testcases',
                '-malloc-symbolic-contents',
-               '-max-memory=8000']
+               '-max-memory={0}'.format(self.max_memory(rlimits))]
+
+        if not opts.live_test_export:
+            # otherwise we convert the tests by ourselves
+            cmd.append('-write-testcases')
 
         if opts.property.errorcall():
             cmd.append('-exit-on-error-type=Assert')
@@ -311,7 +317,8 @@ class SymbioticTool(KleeBase):
                '-only-output-states-covering-new=1',
                '-use-forked-solver=0',
                '-max-time={0}'.format(opts.timeout),
-               '-external-calls=pure', '-max-memory=8000']
+               '-external-calls=pure',
+               '-max-memory={0}'.format(self.max_memory(rlimits))]
         if prop.memsafety():
             if opts.sv_comp:
                 cmd.append('-check-leaks')
@@ -358,32 +365,91 @@ class SymbioticTool(KleeBase):
 
         return cmd + options + tasks + self._options.argv
 
+    def classify_output_line(self, line):
+        """
+        Return the class of the line of KLEE's output
+        or None if the line is not interesting
+        """
+        if self.FullInstr:
+            return self.FullInstr.classify_output_line(line)
+        return self._matcher.match(line)
+
     def _parse_klee_output_line(self, line):
         opts = self._options
 
-        for (key, pattern) in self._patterns:
-            if pattern.match(line):
-                # return True so that we know we should terminate
-                if key.startswith('ASSERTIONFAILED'):
-                    if opts.property.signedoverflow():
-                        return result.RESULT_FALSE_OVERFLOW
-                    elif opts.property.termination():
-                        return result.RESULT_FALSE_TERMINATION
-                    else:
-                        return result.RESULT_FALSE_REACH
-                elif key == 'EFREE' or key == 'EFREEALLOCA' or key=='EGLOBLFREE':
-                    return result.RESULT_FALSE_FREE
-                elif key in ('EMEMERROR', 'EINVREALLOC', 'EROREALLOC'):
-                    return result.RESULT_FALSE_DEREF
-                elif key == 'EMEMLEAK':
-                    return result.RESULT_FALSE_MEMTRACK
-                elif key == 'EMEMCLEANUP':
-                    return result.RESULT_FALSE_MEMCLEANUP
-
-                return key
+        key = self._matcher.match(line)
+        if key is None:
+            return None
+
+        if key.startswith('ASSERTIONFAILED'):
+            if opts.property.signedoverflow():
+                return result.RESULT_FALSE_OVERFLOW
+            elif opts.property.termination():
+                return result.RESULT_FALSE_TERMINATION
+            else:
+                return result.RESULT_FALSE_REACH
+        elif key == 'EFREE' or key == 'EFREEALLOCA' or key=='EGLOBLFREE':
+            return result.RESULT_FALSE_FREE
+        elif key in ('EMEMERROR', 'EINVREALLOC', 'EROREALLOC'):
+            return result.RESULT_FALSE_DEREF
+        elif key == 'EMEMLEAK':
+            return result.RESULT_FALSE_MEMTRACK
+        elif key == 'EMEMCLEANUP':
+            return result.RESULT_FALSE_MEMCLEANUP
+
+        return key
+
+    def _sought_error(self, f):
+        """
+        Return the result if 'f' (the output of _parse_klee_output_line)
+        is the error that we seek for, otherwise return None
+        """
+        opts = self._options
+        prop = opts.property
+
+        FALSE_REACH = result.RESULT_FALSE_REACH
+        FALSE_OVERFLOW = result.RESULT_FALSE_OVERFLOW
+        FALSE_FREE = result.RESULT_FALSE_FREE
+        FALSE_DEREF = result.RESULT_FALSE_DEREF
+        FALSE_MEMTRACK = result.RESULT_FALSE_MEMTRACK
+        FALSE_MEMCLEANUP = result.RESULT_FALSE_MEMCLEANUP
+        FALSE_TERMINATION = result.RESULT_FALSE_TERMINATION
+        FALSE_UNDEF = 'false(def-behavior)'
+
+        if f == FALSE_REACH and prop.unreachcall():
+            return f
+        elif f == FALSE_REACH and prop.undefinedness():
+            return FALSE_UNDEF
+        elif f == FALSE_OVERFLOW and prop.signedoverflow():
+            return f
+        elif f in (FALSE_FREE, FALSE_DEREF, FALSE_MEMTRACK)\
+            and prop.memsafety():
+            return f
+        elif f == FALSE_MEMCLEANUP and\
+            (prop.memcleanup() or prop.memsafety() and not opts.sv_comp):
+            return f
+        elif f == FALSE_TERMINATION and prop.termination():
+            return f
+        elif f == FALSE_DEREF and prop.nullderef():
+            return f
 
         return None
 
+    def final_result(self, line):
+        """
+        Return the result if the line of the output determines it
+        (KLEE found the error that we seek for and is going to exit),
+        otherwise return None
+        """
+        opts = self._options
+        if not opts.exit_on_error or opts.test_comp or self.FullInstr:
+            return None
+
+        fnd = self._parse_klee_output_line(line)
+        if fnd:
+            return self._sought_error(fnd)
+        return None
+
     def determine_result(self, returncode, returnsignal, output, isTimeout):
         opts = self._options
         prop = opts.property
@@ -395,7 +461,7 @@ class SymbioticTool(KleeBase):
             if prop.errorcall():
                 found = []
                 for line in output:
-                    fnd = self._parse_klee_output_line(str(line))
+                    fnd = self._parse_klee_output_line(line)
                     if fnd == result.RESULT_FALSE_REACH:
                         return result.RESULT_DONE
 
@@ -418,7 +484,7 @@ class SymbioticTool(KleeBase):
 
         found = []
         for line in output:
-            fnd = self._parse_klee_output_line(str(line))
+            fnd = self._parse_klee_output_line(line)
             if fnd:
                 found.append(fnd)
 
@@ -432,33 +498,10 @@ class SymbioticTool(KleeBase):
             if 'EINITVALS' in found: # EINITVALS would break the validity of the found error
                 return "{0}({1})".format(result.RESULT_UNKNOWN, " ".join(found))
 
-            FALSE_REACH = result.RESULT_FALSE_REACH
-            FALSE_OVERFLOW = result.RESULT_FALSE_OVERFLOW
-            FALSE_FREE = result.RESULT_FALSE_FREE
-            FALSE_DEREF = result.RESULT_FALSE_DEREF
-            FALSE_MEMTRACK = result.RESULT_FALSE_MEMTRACK
-            FALSE_MEMCLEANUP = result.RESULT_FALSE_MEMCLEANUP
-            FALSE_TERMINATION = result.RESULT_FALSE_TERMINATION
-            FALSE_UNDEF = 'false(def-behavior)'
-
             for f in found:
-                # we found error that we sought for?
-                if f == FALSE_REACH and prop.unreachcall():
-                    return f
-                elif f == FALSE_REACH and prop.undefinedness():
-                    return FALSE_UNDEF
-                elif f == FALSE_OVERFLOW and prop.signedoverflow():
-                    return f
-                elif f in (FALSE_FREE, FALSE_DEREF, FALSE_MEMTRACK)\
-                    and prop.memsafety():
-                    return f
-                elif f == FALSE_MEMCLEANUP and\
-                    (prop.memcleanup() or prop.memsafety() and not opts.sv_comp):
-                    return f
-                elif f == FALSE_TERMINATION and prop.termination():
-                    return f
-                elif f == FALSE_DEREF and prop.nullderef():
-                    return f
+                res = self._sought_error(f)
+                if res:
+                    return res
 
             return "{0} ({1})".format(result.RESULT_UNKNOWN, " ".join(found))
 
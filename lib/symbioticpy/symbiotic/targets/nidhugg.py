@@ -21,6 +21,7 @@ limitations under the License.
 from os.path import dirname, abspath, isfile
 from symbiotic.utils.utils import print_stdout
 from symbiotic.utils.process import runcmd
+from symbiotic.utils.matcher import OutputMatcher
 
 try:
     from symbiotic.versions import llvm_version
@@ -40,6 +41,12 @@ except ImportError:
 
 from . tool import SymbioticBaseTool
 
+_output_matcher = OutputMatcher([
+    (result.RESULT_TRUE_PROP, r'\s*No errors were detected\.\s*$'),
+    (result.RESULT_FALSE_REACH, r'\s*Error detected:\s*$'),
+    (result.RESULT_FALSE_REACH, '.*Error: Assertion violation at'),
+])
+
 class SymbioticTool(BaseTool, SymbioticBaseTool):
     """
     Nidhugg tool info object
@@ -104,6 +111,9 @@ class SymbioticTool(BaseTool, SymbioticBaseTool):
         cmd = [executable, '-sc', '-rf', '-disable-mutex-init-requirement']
         return cmd + options + tasks
 
+    def classify_output_line(self, line):
+        return _output_matcher.match(line)
+
     def determine_result(self, returncode, returnsignal, output, isTimeout):
         if isTimeout:
             return 'timeout'
@@ -111,14 +121,9 @@ class SymbioticTool(BaseTool, SymbioticBaseTool):
         if output is None:
             return 'ERROR (no output)'
 
-        for line in output:
-            line = str(line.strip())
-            if line == 'No errors were detected.':
-                return result.RESULT_TRUE_PROP
-            elif line == 'Error detected:':
-                return result.RESULT_FALSE_REACH
-            elif 'Error: Assertion violation at' in line:
-                return result.RESULT_FALSE_REACH
+        res = _output_matcher.first(output)
+        if res:
+            return res
 
         if returncode != 0:
             return result.RESULT_ERROR
@@ -94,7 +94,7 @@ class SymbioticTool(SymbioticBaseTool):
 
     def determine_result(self, returncode, returnsignal, output, isTimeout):
         status = "UNKNOWN"
-        for line in (l.decode('ascii') for l in output):
+        for line in output:
             if "UNKNOWN" in line:
                 status = result.RESULT_UNKNOWN
             elif "TRUE" in line:
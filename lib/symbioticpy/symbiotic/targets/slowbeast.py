@@ -1,5 +1,6 @@
 from os.path import abspath
 from .. utils import dbg
+from .. utils.matcher import OutputMatcher
 from . tool import SymbioticBaseTool
 
 try:
@@ -18,6 +19,17 @@ except ImportError:
     # the default version
     llvm_version='10.0.1'
 
+_output_matcher = OutputMatcher([
+    ('ASSERTERR', '.*assertion failed!'),
+    ('ASSERTERR', '.*assertion failure:'),
+    ('ASSERTERR', '.*None: __VERIFIER_error called!'),
+    ('MEMERR', '.*memory error - uninitialized read'),
+    ('NOPATHKILLED', '.*Killed paths: 0'),
+    ('PROBLEM', '.*Did not extend the path and reached entry of CFG'),
+    ('PROBLEM', '.*a problem was met'),
+    ('NOERRORS', '.*Found errors: 0'),
+])
+
 class SymbioticTool(BaseTool, SymbioticBaseTool):
 
     REQUIRED_PATHS = ['sb', 'slowbeast']
@@ -89,31 +101,19 @@ class SymbioticTool(BaseTool, SymbioticBaseTool):
             assert path is None
         gen.write(saveto)
 
+    def classify_output_line(self, line):
+        return _output_matcher.match(line)
+
     def determine_result(self, returncode, returnsignal, output, isTimeout):
         if isTimeout:
             return ''
 
-        no_path_killed = False
-        have_problem = False
-        no_errors = False
-        memerr = False
-        asserterr = False
-        for line in output:
-            if 'assertion failed!' in line:
-                asserterr = True
-            elif 'assertion failure:' in line:
-                asserterr = True
-            elif 'None: __VERIFIER_error called!' in line:
-                asserterr = True
-            elif 'memory error - uninitialized read' in line:
-                memerr = True
-            elif 'Killed paths: 0' in line:
-                no_path_killed = True
-            elif 'Did not extend the path and reached entry of CFG' in line or\
-                 'a problem was met' in line:
-                 have_problem = True
-            elif 'Found errors: 0' in line:
-                no_errors = True
+        found = set(_output_matcher.findall(output))
+        no_path_killed = 'NOPATHKILLED' in found
+        have_problem = 'PROBLEM' in found
+        no_errors = 'NOERRORS' in found
+        memerr = 'MEMERR' in found
+        asserterr = 'ASSERTERR' in found
 
         if not no_errors:
             if asserterr:
@@ -19,7 +19,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from symbiotic.utils.utils import process_grep
+from symbiotic.utils.utils import process_grep, available_memory
 from symbiotic.utils import dbg
 from symbiotic.exceptions import SymbioticException
 
@@ -59,6 +59,19 @@ class SymbioticTool(BaseTool, SymbioticBaseTool):
                     )
         return ((KleeTool(self._options), None, None),)
 
+    def portfolio(self):
+        verifiers = self.verifiers()
+        if self._options.property.unreachcall():
+            # KLEE and slowbeast -kind are independent,
+            # the rest runs only if they fail
+            return (verifiers[:2], verifiers[2:])
+        return (verifiers, ())
+
+    def portfolio_limits(self, count):
+        # KLEE and slowbeast use a single core, share the memory
+        memory = available_memory()
+        return (1, memory // max(1, count) if memory else None)
+
     def name(self):
         return 'svcomp'
 
@@ -21,6 +21,7 @@ limitations under the License.
 
 from symbiotic.utils.utils import process_grep
 from symbiotic.utils import dbg
+from symbiotic.utils.timeout import remaining_time
 from symbiotic.exceptions import SymbioticException
 
 try:
@@ -77,7 +78,15 @@ class SymbioticTool(KleeTool):
                 prp = calls[0]
  
 
-        return [executable, prp, self._options.testsuite_output] + tasks
+        cmd = [executable]
+        if self._options.live_test_export:
+            # symbiotic converts the tests by itself
+            cmd.append('--no-write-testcases')
+        remaining = remaining_time()
+        if remaining is not None:
+            # split the time that we have among the targets
+            cmd.append('--time-budget={0}'.format(remaining))
+        return cmd + [prp, self._options.testsuite_output] + tasks
 
 
     def determine_result(self, returncode, returnsignal, output, isTimeout):
@@ -52,6 +52,26 @@ class SymbioticBaseTool(object):
         # pairs (tool, params, timeout)
         return ((self, None, None),)
 
+    def portfolio(self):
+        """
+        Split verifiers() for the parallel portfolio (--parallel-portfolio).
+        \return a pair (members, fallbacks): the members are independent
+        and run concurrently, the fallbacks run one by one afterwards
+        if none of the members answered (e.g., if a member crashes)
+        """
+        return (self.verifiers(), ())
+
+    def portfolio_limits(self, count):
+        """
+        Limits of resources for every member of the portfolio
+        when the verifiers are run in parallel (--parallel-portfolio).
+        'count' is the number of the tools that run concurrently.
+        The memory is passed to cmdline() in rlimits['memlimit'] (in bytes,
+        as in BenchExec), the tools that ignore it are not limited.
+        \return a pair (number of CPUs, memory in MB), None means no limit
+        """
+        return (None, None)
+
    # we run these passes for every tool
    #def passes_after_compilation(self):
    #    """
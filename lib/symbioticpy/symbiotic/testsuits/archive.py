@@ -0,0 +1,68 @@
+#!/usr/bin/python
+
+"""
+Writing the test-suite directly into a zip archive.
+"""
+
+import os
+import zipfile
+from os.path import basename
+
+
+class TestSuiteZip(object):
+    """
+    Zip archive with the test-suite that is written incrementally.
+    Every file is compressed and written into the archive when it is added
+    (only the small central directory is kept in memory). The archive
+    is written into a temporary file that is synced and renamed
+    to the final name when the archive is closed, so the archive
+    with the final name is always complete.
+    """
+
+    def __init__(self, path, directory='test-suite'):
+        self.path = path
+        # the files are stored in this directory in the archive
+        self.directory = directory
+        self._tmp = '{0}.part'.format(path)
+        self._file = open(self._tmp, 'wb')
+        self._zip = zipfile.ZipFile(self._file, 'w',
+                                    compression=zipfile.ZIP_DEFLATED)
+        self._names = set()
+
+    def add(self, name, data):
+        """
+        Add a file with the given name and contents (bytes)
+        into the archive. Returns False if the file is already there.
+        """
+        if name in self._names:
+            return False
+        self._names.add(name)
+        self._zip.writestr('{0}/{1}'.format(self.directory, basename(name)),
+                           data)
+        return True
+
+    def add_directory(self, directory):
+        """ Add all XML files from the directory """
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.xml'):
+                with open(os.path.join(directory, name), 'rb') as f:
+                    self.add(name, f.read())
+
+    def __len__(self):
+        return len(self._names)
+
+    def close(self):
+        if self._zip is None:
+            return
+        self._zip.close()
+        self._zip = None
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp, self.path)
+        # make the rename persistent too
+        fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
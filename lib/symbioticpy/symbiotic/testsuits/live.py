@@ -0,0 +1,227 @@
+#!/usr/bin/python
+
+"""
+Export of the test-suite while KLEE is still running. Every .ktest file
+is converted into a testcase XML file as soon as KLEE finishes writing it
+and the XML file is put into the test-suite atomically (written into
+a temporary file and renamed), so the test-suite on the disk is valid
+and complete up to the last written test at any moment.
+"""
+
+import os
+import select
+from os import listdir
+from os.path import join
+from struct import Struct
+from threading import Thread, Event
+from time import time
+
+from symbiotic.utils import dbg
+from symbiotic.utils.ktest import KTest
+from symbiotic.exceptions import SymbioticException
+from . testcases import testcase_inputs, testcase_xml, _error_test_name
+
+# from sys/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+
+_inotify_event = Struct('iIII')
+
+
+def _inotify_watch(directory):
+    """
+    Start watching the directory for files that were written
+    and closed. Returns the inotify file descriptor
+    or None if inotify is not available.
+    """
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+
+    wd = libc.inotify_add_watch(fd, os.fsencode(directory),
+                                IN_CLOSE_WRITE | IN_MOVED_TO)
+    if wd < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _read_events(fd, timeout):
+    """
+    Wait at most 'timeout' seconds for events and return the names
+    of the written files, or None if some events were lost
+    """
+    ready, _, _ = select.select([fd], [], [], timeout)
+    if not ready:
+        return []
+
+    try:
+        buf = os.read(fd, 1 << 16)
+    except BlockingIOError:
+        return []
+
+    names = []
+    pos = 0
+    while pos + _inotify_event.size <= len(buf):
+        _, mask, _, length = _inotify_event.unpack_from(buf, pos)
+        pos += _inotify_event.size
+        if mask & IN_Q_OVERFLOW:
+            return None
+        name = buf[pos:pos + length].rstrip(b'\0')
+        pos += length
+        if name:
+            names.append(os.fsdecode(name))
+    return names
+
+
+def _write_atomically(path, data):
+    directory, name = os.path.split(path)
+    # hidden, so that nobody takes it for a test
+    tmp = join(directory, '.{0}.tmp'.format(name))
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class LiveTestExporter(object):
+    """
+    Watch the output directory of KLEE (KLEE must not write the testcases
+    by itself, i.e., it runs without -write-testcases) and convert every new
+    .ktest file into testcase XML in 'outdir'. If the .err file of a test
+    appears after the test was exported, the test is exported again
+    with the coverError key. Uses inotify if it is available,
+    otherwise the directory is polled.
+
+    The tests can be also added into 'archive' (TestSuiteZip). Files in the
+    archive cannot be rewritten, so a test is added into the archive
+    when it covers an error or when its .err file did not appear
+    in 'settle_time' seconds (KLEE writes it right after the .ktest file).
+    """
+
+    # seconds
+    poll_interval = 0.5
+    settle_time = 1
+
+    def __init__(self, directory, outdir=None, archive=None):
+        self.directory = directory
+        self.outdir = outdir or directory
+        self.archive = archive
+        # test name -> (time of export, XML) of tests not in the archive yet
+        self._pending = {}
+        # test name -> exported as covering an error
+        self._exported = {}
+        self._errors = set()
+        self._inotify = None
+        self._thread = None
+        self._stop = Event()
+
+    def exported(self):
+        """ Return the number of exported tests """
+        return len(self._exported)
+
+    def start(self):
+        self._inotify = _inotify_watch(self.directory)
+        if self._inotify is None:
+            dbg('inotify is not available, polling the test-suite directory')
+        self._thread = Thread(target=self._run, name='test-exporter',
+                              daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop watching and export the remaining tests
+        (call it once KLEE is not running anymore)
+        """
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self._inotify is not None:
+            os.close(self._inotify)
+            self._inotify = None
+
+        self.scan()
+        self._flush_pending(everything=True)
+        dbg('Exported {0} tests into {1}'.format(self.exported(), self.outdir))
+
+    def _run(self):
+        # the files written before we started watching
+        self.scan()
+        while not self._stop.is_set():
+            if self._pending:
+                self._flush_pending()
+
+            if self._inotify is None:
+                self._stop.wait(self.poll_interval)
+                self.scan()
+                continue
+
+            names = _read_events(self._inotify, self.poll_interval)
+            if names is None:
+                # we lost some events
+                self.scan()
+                continue
+            for name in names:
+                self._new_file(name)
+
+    def _flush_pending(self, everything=False):
+        """ Add the tests that will not change anymore into the archive """
+        now = time()
+        for test, (exported, xml) in list(self._pending.items()):
+            if everything or now - exported >= self.settle_time:
+                self.archive.add(test + '.xml', xml)
+                del self._pending[test]
+
+    def scan(self):
+        """ Export all tests in the directory that were not exported yet """
+        try:
+            names = listdir(self.directory)
+        except OSError:
+            # KLEE did not create the directory yet
+            return
+        # the errors first, so that the tests are exported with coverError
+        for name in names:
+            if name.endswith('.err'):
+                self._new_file(name)
+        for name in names:
+            if name.endswith('.ktest'):
+                self._new_file(name)
+
+    def _new_file(self, name):
+        if name.endswith('.ktest'):
+            test = name[:-len('.ktest')]
+            if test not in self._exported:
+                self._export(test)
+        elif name.endswith('.err'):
+            test = _error_test_name(name)
+            self._errors.add(test)
+            if self._exported.get(test) is False:
+                self._export(test)
+
+    def _export(self, test):
+        covers_error = test in self._errors
+        try:
+            with KTest(join(self.directory, test + '.ktest')) as ktest:
+                xml = testcase_xml(testcase_inputs(ktest.objects), covers_error)
+        except (SymbioticException, OSError):
+            # KLEE has not written the whole file yet
+            # (truncated files are refused by KTest), try it later
+            return
+
+        _write_atomically(join(self.outdir, test + '.xml'), xml)
+        self._exported[test] = covers_error
+
+        if self.archive is not None:
+            if covers_error:
+                self._pending.pop(test, None)
+                self.archive.add(test + '.xml', xml)
+            else:
+                self._pending[test] = (time(), xml)
@@ -2,8 +2,10 @@
 
 from os.path import basename
 from sys import version_info
-from hashlib import sha256 as hashfunc
 import datetime
+from io import BytesIO
+
+from symbiotic.utils.fingerprint import file_hash
 
 from sys import version_info
 if version_info < (3, 0):
@@ -27,16 +29,6 @@ if no_lxml:
     from xml.etree import ElementTree as ET
 
 
-def get_hash(source):
-    f = open(source, 'r', encoding='utf-8')
-    hsh = hashfunc()
-    for l in f:
-        hsh.update(l.encode('utf-8'))
-
-    f.close()
-    return hsh.hexdigest()
-
-
 def get_repr(obj):
     ret = []
     assert len(obj[1]) > 0
@@ -92,7 +84,7 @@ class MetadataWriter(object):
         for p in prps:
             ET.SubElement(self._metadata, 'specification').text = p
         ET.SubElement(self._metadata, 'programfile').text = source
-        ET.SubElement(self._metadata, 'programhash').text = get_hash(source)
+        ET.SubElement(self._metadata, 'programhash').text = file_hash(source)
         ET.SubElement(self._metadata, 'architecture').text = arch
         ET.SubElement(self._metadata, 'entryfunction').text = 'main'
         ET.SubElement(self._metadata, 'creationtime').text =\
@@ -104,15 +96,24 @@ class MetadataWriter(object):
         else:
             print(ET.tostring(self._metadata, pretty_print=True))
 
-    def write(self, to):
+    def _write(self, f):
         et = ET.ElementTree(self._metadata)
         doctype = """<!DOCTYPE test-metadata PUBLIC "+//IDN sosy-lab.org//DTD test-format test-metadata 1.0//EN" "https://sosy-lab.org/test-format/test-metadata-1.0.dtd">"""
         if no_lxml:
-           with open(to, 'wb') as f:
-                f.write("""<?xml version="1.0" encoding="UTF-8" standalone="no"?>""".encode('utf8'))
-                f.write(doctype.encode('utf8'))
-                et.write(f, encoding='UTF-8', method="xml",
+            f.write("""<?xml version="1.0" encoding="UTF-8" standalone="no"?>""".encode('utf8'))
+            f.write(doctype.encode('utf8'))
+            et.write(f, encoding='UTF-8', method="xml",
                      xml_declaration=False)
         else:
-            et.write(to, encoding='UTF-8', method="xml", doctype = doctype,
+            et.write(f, encoding='UTF-8', method="xml", doctype = doctype,
                      pretty_print=True, xml_declaration=True)
+
+    def tostring(self):
+        """ Get the metadata file as bytes """
+        f = BytesIO()
+        self._write(f)
+        return f.getvalue()
+
+    def write(self, to):
+        with open(to, 'wb') as f:
+            self._write(f)
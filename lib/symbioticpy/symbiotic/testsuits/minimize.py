@@ -0,0 +1,269 @@
+#!/usr/bin/python
+
+"""
+Minimization of the test-suite w.r.t. the covered code. Every test is
+replayed natively on the program compiled with coverage instrumentation
+(-fsanitize-coverage=trace-pc-guard) and a greedy set cover of the tests
+with the same total coverage is kept.
+"""
+
+import os
+from heapq import heapify, heappop, heappush
+from os.path import join
+from shutil import rmtree
+from subprocess import DEVNULL
+from tempfile import mkdtemp
+from time import time
+from xml.etree.ElementTree import iterparse
+
+from symbiotic.utils import dbg
+from symbiotic.utils.process import runcmd, run_parallel
+from symbiotic.utils.watch import ProcessWatch, DbgWatch
+from symbiotic.utils.utils import print_stdout
+
+# seconds for replaying one test
+replay_timeout = 10
+
+# The harness reads the inputs of the test (one value per line,
+# in the order of the input elements of the testcase) and writes
+# the coverage into a shared mapping of a file, so the coverage
+# is there even if the program aborts or is killed.
+_harness = r"""
+#include <fcntl.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/mman.h>
+#include <unistd.h>
+
+static unsigned char *__symbiotic_cov;
+
+void __sanitizer_cov_trace_pc_guard_init(uint32_t *start, uint32_t *stop) {
+    static uint32_t n;
+    if (start == stop || *start)
+        return;
+    for (uint32_t *g = start; g < stop; ++g)
+        *g = ++n;
+
+    const char *path = getenv("SYMBIOTIC_COVERAGE");
+    if (!path)
+        return;
+    int fd = open(path, O_RDWR | O_CREAT | O_TRUNC, 0644);
+    if (fd < 0)
+        return;
+    if (ftruncate(fd, n) == 0) {
+        void *mem = mmap(NULL, n, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+        if (mem != MAP_FAILED)
+            __symbiotic_cov = mem;
+    }
+    close(fd);
+}
+
+void __sanitizer_cov_trace_pc_guard(uint32_t *guard) {
+    if (!*guard || !__symbiotic_cov)
+        return;
+    __symbiotic_cov[*guard - 1] = 1;
+    *guard = 0;
+}
+
+static FILE *__symbiotic_inputs;
+static char __symbiotic_input[128];
+
+static const char *__symbiotic_next(void) {
+    if (!__symbiotic_inputs) {
+        const char *path = getenv("SYMBIOTIC_INPUTS");
+        if (!path || !(__symbiotic_inputs = fopen(path, "r")))
+            exit(0);
+    }
+    /* no more inputs, the test ends here */
+    if (!fgets(__symbiotic_input, sizeof(__symbiotic_input), __symbiotic_inputs))
+        exit(0);
+    return __symbiotic_input;
+}
+
+#define NONDET(name, type) \
+    __attribute__((weak)) type __VERIFIER_nondet_##name(void) { \
+        return (type) strtoull(__symbiotic_next(), NULL, 0); \
+    }
+#define NONDET_FLOAT(name, type) \
+    __attribute__((weak)) type __VERIFIER_nondet_##name(void) { \
+        return (type) strtod(__symbiotic_next(), NULL); \
+    }
+
+NONDET(bool, _Bool)
+NONDET(char, char)
+NONDET(uchar, unsigned char)
+NONDET(short, short)
+NONDET(ushort, unsigned short)
+NONDET(int, int)
+NONDET(uint, unsigned int)
+NONDET(unsigned, unsigned int)
+NONDET(long, long)
+NONDET(ulong, unsigned long)
+NONDET(longlong, long long)
+NONDET(ulonglong, unsigned long long)
+NONDET(size_t, unsigned long)
+NONDET(loff_t, long long)
+NONDET(sector_t, unsigned long)
+NONDET(pthread_t, unsigned long)
+NONDET(u8, unsigned char)
+NONDET(u16, unsigned short)
+NONDET(u32, unsigned int)
+NONDET(pointer, void *)
+NONDET(pchar, char *)
+NONDET_FLOAT(float, float)
+NONDET_FLOAT(double, double)
+
+__attribute__((weak)) void __VERIFIER_error(void) { abort(); }
+__attribute__((weak)) void __VERIFIER_assume(int cond) { if (!cond) exit(0); }
+"""
+
+
+def _popcount(x):
+    return bin(x).count('1')
+
+
+def greedy_cover(coverage):
+    """
+    Get a subset of the sets (given as integers used as bitsets)
+    that covers the same elements as all of them. Greedily takes
+    the set that covers the most elements that are not covered yet
+    (the first one of such sets).
+
+    \return the indices of the selected sets
+    """
+    covered = 0
+    # gains of the sets only decrease, so we can recompute them lazily
+    heap = [(-_popcount(c), n) for n, c in enumerate(coverage) if c]
+    heapify(heap)
+    selected = []
+    while heap:
+        gain, n = heappop(heap)
+        newgain = _popcount(coverage[n] & ~covered)
+        if newgain == 0:
+            continue
+        if newgain < -gain:
+            heappush(heap, (-newgain, n))
+            continue
+        selected.append(n)
+        covered |= coverage[n]
+    return selected
+
+
+def read_testcase(path):
+    """
+    Get the values of inputs from a testcase file
+    and whether the test covers an error
+    """
+    values, covers_error = [], False
+    for _, elem in iterparse(path, events=('end',)):
+        if elem.tag == 'input':
+            values.append((elem.text or '').strip())
+        elif elem.tag == 'testcase':
+            covers_error = elem.get('coverError') == 'true' or\
+                           elem.get('key') == 'coverError'
+        elem.clear()
+    return values, covers_error
+
+
+def _compile_replay(source, workdir, opts):
+    harness = join(workdir, 'harness.c')
+    with open(harness, 'w') as f:
+        f.write(_harness)
+
+    flags = ['-w', '-O0', '-fno-builtin']
+    if opts.is32bit:
+        flags.append('-m32')
+    cmd = ['clang', '-c', '-fsanitize-coverage=trace-pc-guard'] + flags +\
+          opts.CPPFLAGS + ['-o', join(workdir, 'program.o'), source]
+    runcmd(cmd, DbgWatch('all'),
+           'Failed compiling the program for replaying tests')
+
+    replay = join(workdir, 'replay')
+    cmd = ['clang'] + flags + ['-o', replay, harness,
+                               join(workdir, 'program.o'), '-lm']
+    runcmd(cmd, DbgWatch('all'), 'Failed linking the replay harness')
+    return replay
+
+
+def _replay(replay, tests, workdir, opts):
+    """
+    Replay the tests in parallel and return the list of their coverage
+    (as integers used as bitsets, None if the replay failed)
+    """
+    jobs, covfiles = [], []
+    for n, values in enumerate(tests):
+        inputs = join(workdir, 'inputs-{0}'.format(n))
+        with open(inputs, 'w') as f:
+            for val in values:
+                f.write(val)
+                f.write('\n')
+        covfile = join(workdir, 'coverage-{0}'.format(n))
+        covfiles.append(covfile)
+        env = dict(os.environ, SYMBIOTIC_INPUTS=inputs,
+                   SYMBIOTIC_COVERAGE=covfile)
+        jobs.append((['timeout', str(replay_timeout), replay],
+                     ProcessWatch(), {'env' : env, 'cwd' : workdir,
+                                      'stdin' : DEVNULL}))
+
+    run_parallel(jobs, opts.jobs or os.cpu_count())
+
+    coverage = []
+    for covfile in covfiles:
+        try:
+            with open(covfile, 'rb') as f:
+                coverage.append(int.from_bytes(f.read(), 'little'))
+        except OSError:
+            coverage.append(None)
+    return coverage
+
+
+def minimize_test_suite(opts, source, directory):
+    """
+    Remove the testcases from the test-suite in 'directory'
+    that do not cover anything that the other tests do not cover.
+    The tests that cover an error and the tests that could not be
+    replayed are kept.
+
+    \return the number of removed tests
+    """
+    start = time()
+    names = sorted(name for name in os.listdir(directory)
+                   if name.endswith('.xml') and name != 'metadata.xml')
+    if len(names) < 2:
+        return 0
+
+    tests, keep = [], set()
+    for n, name in enumerate(names):
+        values, covers_error = read_testcase(join(directory, name))
+        tests.append(values)
+        if covers_error:
+            keep.add(n)
+
+    workdir = mkdtemp(prefix='symbiotic-minimize-', dir=opts.working_dir_prefix)
+    try:
+        replay = _compile_replay(source, workdir, opts)
+        coverage = _replay(replay, tests, workdir, opts)
+    finally:
+        if opts.save_files:
+            dbg('Replay files are in {0}'.format(workdir))
+        else:
+            rmtree(workdir, ignore_errors=True)
+
+    keep.update(n for n, cov in enumerate(coverage) if cov is None)
+    keep.update(greedy_cover([cov or 0 for cov in coverage]))
+
+    removed = 0
+    for n, name in enumerate(names):
+        if n not in keep:
+            os.unlink(join(directory, name))
+            removed += 1
+
+    total = 0
+    for cov in coverage:
+        total |= cov or 0
+    print_stdout('INFO: Minimized the test-suite from {0} to {1} tests '
+                 '({2} covered edges) in {3:.2f} s'.format(
+                 len(names), len(names) - removed, _popcount(total),
+                 time() - start), color='WHITE')
+    return removed
@@ -1,8 +1,9 @@
 #!/usr/bin/python
 
-from os.path import basename
+from os import listdir
+from os.path import basename, join
+from time import time
 from sys import version_info
-from hashlib import sha256 as hashfunc
 
 from sys import version_info
 if version_info < (3, 0):
@@ -10,6 +11,9 @@ if version_info < (3, 0):
 
 import re
 
+from symbiotic.utils.ktest import KTest
+from symbiotic.utils.utils import print_stdout
+
 skip_repeating_lines = False
 include_objects = True
 only_objects_in_main = True
@@ -26,26 +30,17 @@ if no_lxml:
     from xml.etree import ElementTree as ET
 
 
-def get_hash(source):
-    f = open(source, 'r', encoding='utf-8')
-    hsh = hashfunc()
-    for l in f:
-        hsh.update(l.encode('utf-8'))
-
-    f.close()
-    return hsh.hexdigest()
-
-
 def get_repr(obj):
     ret = []
-    assert len(obj[1]) > 0
+    data = obj.data
+    assert len(data) > 0
 
-    b = obj[1][0]
+    b = data[0]
     num = 1
-    for i in range(1, len(obj[1])):
-        if obj[1][i] != b:
+    for i in range(1, len(data)):
+        if data[i] != b:
             ret.append((b, num))
-            b = obj[1][i]
+            b = data[i]
             num = 1
         else:
             num += 1
@@ -55,20 +50,15 @@ def get_repr(obj):
 
 
 def print_object(obj):
-    rep = 'len {0} bytes, |'.format(len(obj[1]))
+    rep = 'len {0} bytes, |'.format(obj.size)
     for part in get_repr(obj):
-        if version_info.major < 3:
-            value = ord(part[0])
-        else:
-            value = part[0]
-
-        value = hex(value)
+        value = hex(part[0])
 
         if part[1] > 1:
             rep += '{0} times {1}|'.format(part[1], value)
         else:
             rep += '{0}|'.format(value)
-    print('{0} := {1}'.format(obj[0], rep))
+    print('{0} := {1}'.format(obj.name.decode('utf-8'), rep))
 
 
 def split_name(name):
@@ -78,6 +68,113 @@ def split_name(name):
     return var[0], var[1], var[2]
 
 
+# is this string a valid variable identificatior?
+_variable_re = re.compile("^[_a-zA-Z\$][_a-zA-Z\$0-9]*$")
+
+_doctype = """<!DOCTYPE testcase PUBLIC "+//IDN sosy-lab.org//DTD test-format testcase 1.0//EN" "https://sosy-lab.org/test-format/testcase-1.0.dtd">"""
+
+
+def testcase_inputs(objects):
+    """
+    Get the list of pairs (variable, value) that form the test case
+    from the objects of a ktest
+    """
+    if not include_objects:
+        return []
+
+    if only_objects_in_main:
+        # filter the objects to those that are present in main
+        # and sort them according to line numbers
+        new_objects = []
+        for o in objects:
+            var_fun, var_name, var_line = split_name(o.name)
+            if var_fun is None or var_fun != 'main':
+                continue
+
+            # for the trivial witnesses use only scalar variables, as for
+            # array accesses we would need a full path
+            if trivial_witness and not _variable_re.match(var_name):
+                continue
+
+            new_objects.append((var_line, o))
+
+        # sort the objects according to line numbers
+        new_objects.sort(key=lambda x: int(x[0]))
+        objects = [o for o in map(lambda x: x[1], new_objects)]
+
+    inputs = []
+    for o in objects:
+        var_fun, var_name, var_line = split_name(o.name)
+        if var_line is None:
+            continue
+
+        assert var_fun and var_name and var_line
+        if not only_objects_in_main and\
+           not _variable_re.match(var_name):
+           # use only scalar variables now, as we do not support arrays
+           # or multiple assignments now
+            continue
+
+        # If possible, dump the value as a regular number (not byte per byte)
+        # XXX: the length may not be sufficient. We need to know also
+        # that it is really a primitive type (we can have a struct of size 8)
+        val = o.value()
+        if val is None:
+            # dump this as bytes
+            for i in range(0, o.size):
+                val = o.data[i]
+
+        inputs.append((var_name, str(val)))
+
+    return inputs
+
+
+def _escape_text(text):
+    text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    # libxml2 escapes carriage returns in the text too
+    return text if no_lxml else text.replace('\r', '&#13;')
+
+
+def _escape_attrib(text):
+    text = _escape_text(text).replace('"', '&quot;')
+    if no_lxml:
+        text = text.replace('\r', '&#13;')
+    text = text.replace('\n', '&#10;')
+    # ElementTree and libxml2 differ here
+    return text.replace('\t', '&#09;' if no_lxml else '&#9;')
+
+
+def testcase_xml(inputs, covers_error):
+    """
+    Create the content of a testcase file from the inputs (as returned
+    by testcase_inputs) without building the XML tree. The output is
+    the same as what TestCaseWriter.write() writes.
+    """
+    start = '<testcase key="coverError"' if covers_error else '<testcase'
+    if no_lxml:
+        parts = ['<?xml version="1.0" encoding="UTF-8" standalone="no"?>',
+                 _doctype]
+        sep = ''
+        indent = ''
+        empty = ' />'
+    else:
+        parts = ["<?xml version='1.0' encoding='UTF-8'?>\n", _doctype, '\n']
+        sep = '\n'
+        indent = '  '
+        empty = '/>\n'
+
+    if not inputs:
+        parts.append(start + empty)
+    else:
+        parts.append(start + '>' + sep)
+        for var, val in inputs:
+            parts.append('{0}<input variable="{1}">{2}</input>{3}'.format(
+                         indent, _escape_attrib(var), _escape_text(val), sep))
+        parts.append('</testcase>' + sep)
+
+    return ''.join(parts).encode('utf-8')
+
+
 class TestCaseWriter(object):
     def __init__(self, source, covers_error):
         if covers_error:
@@ -86,49 +183,12 @@ class TestCaseWriter(object):
             self._root = ET.Element('testcase')
 
         # is this string a valid variable identificatior?
-        self._variable_re = re.compile("^[_a-zA-Z\$][_a-zA-Z\$0-9]*$")
+        self._variable_re = _variable_re
         # is this string a valid variable identificatior or array access?
         # XXX: this is not supported now
         self._variable_index_re = re.compile(
             "^[_a-zA-Z\$][_a-zA-Z\$0-9]*(\[.*\])?$")
 
-    def _parseKtest(self, pathFile):
-        # this code is taken from ktest-tool from KLEE
-        # (but modified)
-        from struct import unpack
-
-        f = open(pathFile, 'rb')
-
-        hdr = f.read(5)
-        if len(hdr) != 5 or (hdr != b'KTEST' and hdr != b"BOUT\n"):
-            print('unrecognized file')
-            sys.exit(1)
-        version, = unpack('>i', f.read(4))
-        if version > 3:
-            print('unrecognized version')
-            sys.exit(1)
-        # skip args
-        numArgs, = unpack('>i', f.read(4))
-        for i in range(numArgs):
-            size, = unpack('>i', f.read(4))
-            f.read(size)
-
-        if version >= 2:
-            unpack('>i', f.read(4))
-            unpack('>i', f.read(4))
-
-        numObjects, = unpack('>i', f.read(4))
-        objects = []
-        for i in range(numObjects):
-            size, = unpack('>i', f.read(4))
-            name = f.read(size)
-            size, = unpack('>i', f.read(4))
-            bytes = f.read(size)
-            objects.append((name, bytes))
-
-        f.close()
-        return objects
-
     def _newNodeEdge(self, last_id, line=None, originfile=None):
         # create new node
         node = ET.SubElement(self._graph, 'node', id=str(last_id))
@@ -145,77 +205,13 @@ class TestCaseWriter(object):
         return node, edge
 
     def _dumpObjects(self, ktestfile, originfile):
-        from struct import unpack
-
-        objects = self._parseKtest(ktestfile)
-       #print(' -- ---- --')
-       #print('Symbolic objects:')
-       #for o in objects:
-       #    print_object(o)
-       #print(' -- ---- --')
-
-        if not include_objects:
-            return 1
+        with KTest(ktestfile) as ktest:
+            return self._dumpKTestObjects(ktest.objects)
 
+    def _dumpKTestObjects(self, objects):
         last_id = 1
-
-        if only_objects_in_main:
-            # filter the objects to those that are present in main
-            # and sort them according to line numbers
-            new_objects = []
-            for o in objects:
-                var_fun, var_name, var_line = split_name(o[0])
-                if var_fun is None or var_fun != 'main':
-                    continue
-
-                # for the trivial witnesses use only scalar variables, as for
-                # array accesses we would need a full path
-                if trivial_witness and not self._variable_re.match(var_name):
-                    continue
-
-                new_objects.append((var_line, o))
-
-            # sort the objects according to line numbers
-            new_objects.sort(key=lambda x: int(x[0]))
-            objects = [o for o in map(lambda x: x[1], new_objects)]
-
-        for o in objects:
-            var_fun, var_name, var_line = split_name(o[0])
-            if var_line is None:
-                continue
-
-            assert var_fun and var_name and var_line
-            if not only_objects_in_main and\
-               not self._variable_re.match(var_name):
-               # use only scalar variables now, as we do not support arrays
-               # or multiple assignments now
-                continue
-
-            ass_list = []
-            bytes_num = len(o[1])
-            # If possible, dump the value as a regular number (not byte per byte)
-            # XXX: the length may not be sufficient. We need to know also
-            # that it is really a primitive type (we can have a struct of size 8)
-            if bytes_num == 8:
-                val = unpack('l', o[1])[0]
-            elif bytes_num == 4:
-                val = unpack('i', o[1])[0]
-            elif bytes_num == 2:
-                # unpack needs a buffer of size 4 for an integer
-                val = unpack('h', o[1])[0]
-            elif bytes_num == 1:
-                # unpack needs a buffer of size 4 for an integer
-                val = unpack('b', o[1])[0]
-            else:
-                # dump this as bytes
-                for i in range(0, bytes_num):
-                    if version_info.major < 3:
-                        val = ord(o[1][i])
-                    else:
-                        val = o[1][i]
-
-            ET.SubElement(self._root, 'input', variable = var_name).text = str(val)
-
+        for var_name, val in testcase_inputs(objects):
+            ET.SubElement(self._root, 'input', variable = var_name).text = val
             last_id += 1
 
         return last_id
@@ -239,7 +235,7 @@ class TestCaseWriter(object):
 
     def write(self, to):
         et = ET.ElementTree(self._root)
-        doctype = """<!DOCTYPE testcase PUBLIC "+//IDN sosy-lab.org//DTD test-format testcase 1.0//EN" "https://sosy-lab.org/test-format/testcase-1.0.dtd">"""
+        doctype = _doctype
         if no_lxml:
            with open(to, 'wb') as f:
                 f.write("""<?xml version="1.0" encoding="UTF-8" standalone="no"?>""".encode('utf8'))
@@ -249,3 +245,64 @@ class TestCaseWriter(object):
         else:
             et.write(to, encoding='UTF-8', method="xml", doctype = doctype,
                      pretty_print=True, xml_declaration=True)
+
+
+def _error_test_name(errfile):
+    """ Get the name of the test that the .err file belongs to """
+    # test000001.assert.err -> test000001
+    return errfile.rsplit('.', 2)[0]
+
+
+def _covering_error(directory):
+    """ Get the names of tests (without suffixes) that cover an error """
+    return {_error_test_name(name) for name in listdir(directory)
+            if name.endswith('.err')}
+
+
+def _convert_ktests(ktests, outdir):
+    # runs in the worker processes
+    for ktestfile, covers_error in ktests:
+        with KTest(ktestfile) as ktest:
+            xml = testcase_xml(testcase_inputs(ktest.objects), covers_error)
+        name = basename(ktestfile)
+        with open(join(outdir, name[:name.rfind('.')] + '.xml'), 'wb') as f:
+            f.write(xml)
+    return len(ktests)
+
+
+def convert_ktests(directory, outdir, jobs=0, chunksize=64):
+    """
+    Convert all .ktest files in the directory (e.g., klee-out-N)
+    into testcase XML files in outdir. The files are converted
+    in parallel by 'jobs' processes (0 means the number of CPUs).
+    This is the back-end of scripts/ktest2testcase.py, symbiotic itself
+    gets the testcases from KLEE or from the LiveTestExporter.
+
+    \return the number of converted tests
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from os import cpu_count, makedirs
+
+    start = time()
+    makedirs(outdir, exist_ok=True)
+    errors = _covering_error(directory)
+    ktests = sorted((join(directory, name), name[:-len('.ktest')] in errors)
+                    for name in listdir(directory) if name.endswith('.ktest'))
+    chunks = [ktests[i:i + chunksize] for i in range(0, len(ktests), chunksize)]
+
+    jobs = jobs or cpu_count() or 1
+    converted = 0
+    if jobs == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            converted += _convert_ktests(chunk, outdir)
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(chunks))) as executor:
+            for num in executor.map(_convert_ktests, chunks,
+                                    [outdir] * len(chunks)):
+                converted += num
+
+    elapsed = time() - start
+    print_stdout('INFO: Converted {0} tests in {1:.2f} s ({2:.0f} tests/s)'.format(
+                 converted, elapsed, converted / elapsed if elapsed > 0 else 0),
+                 color='WHITE')
+    return converted
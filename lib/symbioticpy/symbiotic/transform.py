@@ -7,11 +7,16 @@ import re
 from . exceptions import SymbioticExceptionalResult
 from . options import SymbioticOptions
 from . utils import dbg, print_elapsed_time, restart_counting_time
-from . utils.process import ProcessRunner, runcmd
+from . utils.process import ProcessRunner, runcmd, run_parallel
 from . utils.watch import ProcessWatch, DbgWatch
 from . utils.utils import print_stdout, print_stderr, process_grep
+from . utils.utils import buffer_output, print_buffered
+from . utils.cache import StageCache, parse_deps_file
 from . exceptions import SymbioticException
-from shutil import move
+from shutil import move, copyfile
+from copy import copy, deepcopy
+from threading import Event, Lock, Thread
+from concurrent.futures import Future
 
 class PrepareWatch(ProcessWatch):
     def __init__(self, lines=100):
@@ -135,6 +140,10 @@ class SymbioticCC(object):
     def __init__(self, src, tool, opts=None, env=None):
         # source file
         self.sources = src
+        # opt passes that are to be run on the current file,
+        # see _defer_opt()
+        self._pending_passes = []
+        self._pending_optimizations = False
         # source compiled to llvm bitecode
         self.curfile = None
         # environment
@@ -147,10 +156,108 @@ class SymbioticCC(object):
 
         # definitions of our functions that we linked
         self._linked_functions = []
+        # models of undefined functions that we compiled (source -> bitcode),
+        # shared with the copy that prepares the unsliced file
+        self._compiled_models = {}
+        self._models_lock = Lock()
+        # the future with the prepared unsliced file
+        self._unsliced = None
+        # the thread that prepares the unsliced file in the background,
+        # the event that cancels it and the messages that it printed
+        self._unsliced_thread = None
+        self._unsliced_cancel = Event()
+        self._unsliced_output = []
 
         # tool to use
         self._tool = tool
 
+        # persistent cache of the outputs of the stages
+        self._cache = None
+        if self.options.cache_dir:
+            self._cache = self._create_cache()
+
+    @property
+    def curfile(self):
+        # anyone that wants to use the current file needs
+        # it with all the deferred passes applied
+        self.flush_opt()
+        return self._curfile
+
+    @curfile.setter
+    def curfile(self, f):
+        self.flush_opt()
+        self._curfile = f
+
+    def _defer_opt(self, passes, optimizations=False):
+        """
+        Postpone running the passes on the current file until the file
+        is needed by something else than opt. Consecutive opt runs
+        are then fused into one invocation of opt, so that we do not parse
+        and write the module again and again.
+        """
+        self._pending_passes += passes
+        self._pending_optimizations |= optimizations
+
+    def flush_opt(self):
+        """ Run the deferred opt passes (if any) """
+        if not self._pending_passes:
+            return
+
+        passes = self._pending_passes
+        optimizations = self._pending_optimizations
+        self._pending_passes = []
+        self._pending_optimizations = False
+
+        if optimizations:
+            restart_counting_time()
+        self._run_opt(passes)
+        if optimizations:
+            print_elapsed_time('INFO: Optimizations time', color='WHITE')
+
+    def _create_cache(self):
+        from . options import get_versions
+        _, versions, llvm_version, build_types = get_versions()
+        # the outputs of stages depend on the versions of the tools
+        # that we use, so make them a part of the keys
+        vers = [llvm_version, self._tool.llvm_version(), ' '.join(self._get_cc())]
+        vers += ['{0}:{1}'.format(k, v) for (k, v) in sorted(versions.items())]
+        vers += ['{0}:{1}'.format(k, v) for (k, v) in sorted(build_types.items())]
+        try:
+            return StageCache(self.options.cache_dir,
+                              self.options.cache_size * 1024 * 1024,
+                              ';'.join(vers))
+        except OSError as e:
+            print_stderr('Failed creating the cache: {0}'.format(str(e)),
+                         color='BROWN')
+            return None
+
+    def _from_cache(self, cmd, output):
+        """
+        Try restoring the output of the stage given by cmd from the cache.
+        Return the pair (key, hit). The key is None if caching is disabled.
+        """
+        if self._cache is None:
+            return None, False
+
+        key = self._cache.key(cmd, output)
+        return key, self._cache.restore(key, output)
+
+    def _to_cache(self, key, output, deps=None):
+        if key is not None:
+            self._cache.store(key, output, deps)
+
+    def _run_stage(self, cmd, output, watch, err_msg):
+        """
+        Run the command of a stage that creates the file 'output'
+        or take the output from the cache if it has been cached
+        """
+        key, hit = self._from_cache(cmd, output)
+        if hit:
+            return
+
+        runcmd(cmd, watch, err_msg)
+        self._to_cache(key, output)
+
     def _get_cc(self):
         if hasattr(self._tool, 'cc'):
             return self._tool.cc()
@@ -194,9 +301,10 @@ class SymbioticCC(object):
         return runcmd(cmd, DbgWatch('all'),
                       "Failed running command: {0}".format(" ".join(cmd)))
 
-    def _compile_to_llvm(self, source, output=None, with_g=True, opts=[]):
+    def _compile_cmd(self, source, output=None, with_g=True, opts=[]):
         """
-        Compile given source to LLVM bitecode
+        Get the command that compiles given source to LLVM bitecode
+        and the name of the output file
         """
 
         # __inline attribute is buggy in clang, remove it using -D__inline
@@ -228,23 +336,105 @@ class SymbioticCC(object):
         cmd.append(llvmfile)
         cmd.append(source)
 
-        runcmd(cmd, CompileWatch(),
+        return cmd, llvmfile
+
+    def _deps_cmd(self, key, llvmfile):
+        """
+        If we cache the output of compilation, the output depends also
+        on the included files, so get them from the compiler
+        """
+        if key is None:
+            return []
+        return ['-MD', '-MF', '{0}.d'.format(llvmfile)]
+
+    def _cache_compiled(self, key, llvmfile):
+        if key is None:
+            return
+
+        try:
+            deps = parse_deps_file('{0}.d'.format(llvmfile))
+        except OSError:
+            deps = None
+        self._to_cache(key, llvmfile, deps)
+
+    def _compile_to_llvm(self, source, output=None, with_g=True, opts=[]):
+        """
+        Compile given source to LLVM bitecode
+        """
+
+        cmd, llvmfile = self._compile_cmd(source, output, with_g, opts)
+
+        key, hit = self._from_cache(cmd, llvmfile)
+        if hit:
+            return llvmfile
+
+        runcmd(cmd + self._deps_cmd(key, llvmfile), CompileWatch(),
                "Compiling source '{0}' failed".format(source))
+        self._cache_compiled(key, llvmfile)
 
         return llvmfile
 
+    def _compile_parallel(self, sources, opts):
+        """
+        Compile the sources concurrently, each by its own compiler process.
+        If compiling of any source fails, kill the other compilers.
+        Return the list of compiled files.
+        """
+        llvmfiles = []
+        jobs = []
+        compiled = []
+        for source in sources:
+            # the output files must not clash
+            basename = os.path.basename(source)
+            stem = basename[:basename.rfind('.')]
+            llvmfile, n = '{0}.bc'.format(stem), 0
+            while llvmfile in llvmfiles:
+                n += 1
+                llvmfile = '{0}-{1}.bc'.format(stem, n)
+            llvmfiles.append(llvmfile)
+
+            cmd, llvmfile = self._compile_cmd(source, llvmfile, opts=opts)
+            key, hit = self._from_cache(cmd, llvmfile)
+            if hit:
+                continue
+
+            jobs.append((cmd + self._deps_cmd(key, llvmfile), CompileWatch()))
+            compiled.append((source, llvmfile, key))
+
+        if len(jobs) == 1:
+            cmd, watch = jobs[0]
+            runcmd(cmd, watch,
+                   "Compiling source '{0}' failed".format(compiled[0][0]))
+        elif jobs:
+            jobsnum = self.options.jobs or os.cpu_count()
+            dbg('Compiling {0} sources using {1} jobs'.format(len(jobs), jobsnum))
+            retvals = run_parallel(jobs, jobsnum,
+                                   stop=lambda idx, retval: retval != 0)
+            for (source, _, _), retval in zip(compiled, retvals):
+                if retval != 0 and retval is not None:
+                    raise SymbioticException("Compiling source '{0}' failed".format(source))
+
+        for (_, llvmfile, key) in compiled:
+            self._cache_compiled(key, llvmfile)
+
+        return llvmfiles
+
     def run_opt(self, passes):
         if not passes:
             return
 
-        self._run_opt(passes)
+        if self.options.fuse_opt:
+            self._defer_opt(passes)
+        else:
+            self._run_opt(passes)
 
     def _run_opt(self, passes):
-        output = '{0}-pr.bc'.format(self.curfile[:self.curfile.rfind('.')])
+        curfile = self._curfile
+        output = '{0}-pr.bc'.format(curfile[:curfile.rfind('.')])
         cmd = ['opt', '-load', 'LLVMsbt.so',
-               self.curfile, '-o', output] + passes
+               curfile, '-o', output] + passes
 
-        runcmd(cmd, PrepareWatch(), 'Running opt failed')
+        self._run_stage(cmd, output, PrepareWatch(), 'Running opt failed')
         self.curfile = output
         self._save_ll()
 
@@ -325,8 +515,12 @@ class SymbioticCC(object):
         restart_counting_time()
         watch = InstrumentationWatch()
 
-        process = ProcessRunner()
-        retval = process.run(cmd, watch)
+        key, hit = self._from_cache(cmd, output)
+        if hit:
+            retval = 0
+        else:
+            process = ProcessRunner()
+            retval = process.run(cmd, watch)
         if retval != 0:
             for line in watch.getLines():
                 if b'PredatorPlugin: Predator found no errors' in line:
@@ -345,6 +539,7 @@ class SymbioticCC(object):
                 raise SymbioticException('Instrumenting the code failed')
             print_elapsed_time('INFO: Instrumentation [FAILED] time', color='WHITE')
         else:
+            self._to_cache(None if hit else key, output)
             print_elapsed_time('INFO: Instrumentation time', color='WHITE')
             self.curfile = output
             self._save_ll()
@@ -367,64 +562,76 @@ class SymbioticCC(object):
         if self.curfile:
             cmd.append(self.curfile)
 
-        runcmd(cmd, DbgWatch('compile'),
-               'Failed linking llvm file with libraries')
+        self._run_stage(cmd, output, DbgWatch('compile'),
+                        'Failed linking llvm file with libraries')
         self.curfile = output
         self._save_ll()
 
-    def _link_undefined(self, undefs):
-        def _get_path(symbdir, llvmver, ty, tool, undef):
-            # check also if we have precompiled .bc files
-            if self.options.is32bit:
-                path = os.path.abspath('{0}/llvm-{1}/lib32/{2}/{3}/{4}.bc'.format(symbdir, llvmver, ty, tool, undef))
-            else:
-                path = os.path.abspath('{0}/llvm-{1}/lib/{2}/{3}/{4}.bc'.format(symbdir, llvmver, ty, tool, undef))
-            if os.path.isfile(path):
-                return path
-
-            path = os.path.abspath('{0}/lib/{1}/{2}/{3}.c'.format(symbdir, ty, tool, undef))
-            if os.path.isfile(path):
-                return path
-
-            # do we have at least a generic implementation?
-            if self.options.is32bit:
-                path = os.path.abspath('{0}/llvm-{1}/lib32/{2}/{3}.bc'.format(symbdir, llvmver, ty, undef))
-            else:
-                path = os.path.abspath('{0}/llvm-{1}/lib/{2}/{3}.bc'.format(symbdir, llvmver, ty, undef))
-            if os.path.isfile(path):
-                return path
-
-            path = os.path.abspath('{0}/lib/{1}/{2}.c'.format(symbdir, ty, undef))
-            if os.path.isfile(path):
-                return path
-
-            return None
-
-        def get_path(symbdir, llvmver, tool, undef):
-            # return the first found definition (in the order of linkundef)
-            for ty in self.options.linkundef:
-                path = _get_path(symbdir, llvmver, ty, tool, undef)
-                if path:
-                    return path
-            return None
+    def _get_model_index(self):
+        from . models import get_model_index
+        return get_model_index(self.env.symbiotic_dir,
+                               self._tool.llvm_version(),
+                               self.options.is32bit)
 
+    def _get_model_bitcode(self, path):
+        """
+        Get the bitcode of the model in path. The precompiled
+        models are used directly, the others are compiled only once.
+        """
+        if path.endswith('.bc'):
+            return path
+
+        with self._models_lock:
+            bcfile = self._compiled_models.get(path)
+            if bcfile is None:
+                basename = os.path.basename(path)
+                bcfile = os.path.abspath('{0}.bc'.format(basename[:basename.rfind('.')]))
+                self._compile_to_llvm(path, bcfile)
+                self._compiled_models[path] = bcfile
+        return bcfile
+
+    def _get_model_deps(self, index, path, bitcode):
+        """ Get the undefined symbols of a model """
+        deps = index.deps(path)
+        if deps is None:
+            _, deps = self._get_symbols(bitcode)
+            index.set_deps(path, deps)
+        return deps
+
+    def _link_undefined(self, undefs, defined=None):
+        """
+        Link the models of the undefined functions. If 'defined' is not None,
+        it is the set of symbols defined in the current file and then also
+        the transitive closure of the functions that the models need
+        is linked -- everything in one run of llvm-link.
+        """
+        index = self._get_model_index()
+        models = index.resolve(self.options.linkundef,
+                               self._tool.name().lower())
 
         tolink = []
-        for undef in undefs:
-            path = get_path(self.env.symbiotic_dir, self._tool.llvm_version(),
-                            self._tool.name().lower(), undef)
+        worklist = list(undefs)
+        queued = set(worklist)
+        while worklist:
+            undef = worklist.pop(0)
+            path = models.get(undef)
             if path is None:
                 continue
 
-            basename = os.path.basename(path)
-            bcfile='{0}.bc'.format(basename[:basename.rfind('.')])
-            output = os.path.abspath(bcfile)
-            self._compile_to_llvm(path, output)
-            tolink.append(output)
+            bitcode = self._get_model_bitcode(path)
+            tolink.append(bitcode)
 
             # for debugging
             self._linked_functions.append(undef)
 
+            if defined is None:
+                continue
+
+            for dep in self._get_model_deps(index, path, bitcode):
+                if dep not in queued and dep not in defined:
+                    queued.add(dep)
+                    worklist.append(dep)
+
         if tolink:
             self.link(libs=tolink)
             return True
@@ -436,34 +643,43 @@ class SymbioticCC(object):
 
         return self._link_undefined(self.options.link_files)
 
-    def _get_undefined(self, bitcode, only_func=[]):
-        cmd = ['llvm-nm', '-undefined-only', '-just-symbol-name', bitcode]
+    def _get_symbols(self, bitcode):
+        """
+        Get the pair (defined, undefined) of the sets
+        of symbols in the bitcode
+        """
+        cmd = ['llvm-nm', bitcode]
         watch = ProcessWatch(None)
-        runcmd(cmd, watch, 'Failed getting undefined symbols from bitcode')
-        undefs = list(map(lambda s: s.strip().decode('ascii'), watch.getLines()))
-        if only_func:
-            return [x for x in undefs if x in only_func]
-        return undefs
-
-    def _rec_link_undefined(self, only_func=[]):
-        # get undefined functions from the bitcode
-        undefs = self._get_undefined(self.curfile, only_func)
-        if self._link_undefined(undefs):
-            # if we linked someting, try get undefined again,
-            # because the functions may have added some new undefined
-            # functions
-            if not only_func:
-                self._rec_link_undefined()
+        runcmd(cmd, watch, 'Failed getting symbols from bitcode')
+
+        defined, undefined = set(), set()
+        for line in watch.getLines():
+            parts = line.decode('ascii').split()
+            if len(parts) < 2:
+                continue
+            # undefined (also weak undefined) symbols
+            if parts[-2] in ('U', 'w', 'v'):
+                undefined.add(parts[-1])
+            else:
+                defined.add(parts[-1])
+
+        return defined, undefined
 
     def link_undefined(self, only_func=[]):
         if not self.options.linkundef:
             return
 
         self._linked_functions = [] # for printing
-        self._rec_link_undefined(only_func)
+
+        defined, undefs = self._get_symbols(self.curfile)
+        if only_func:
+            # link just the given functions (not what they need)
+            self._link_undefined([x for x in only_func if x in undefs])
+        else:
+            self._link_undefined(sorted(undefs), defined)
 
         if self._linked_functions:
-            print('Linked our definitions to these undefined functions:')
+            print_stdout('Linked our definitions to these undefined functions:')
             for f in self._linked_functions:
                 print_stdout('  ', print_nl=False)
                 print_stdout(f)
@@ -504,8 +720,12 @@ class SymbioticCC(object):
         cmd.append(self.curfile)
 
         watch = SlicerWatch()
-        process = ProcessRunner()
-        retval = process.run(cmd, watch)
+        key, hit = self._from_cache(cmd, output)
+        if hit:
+            retval = 0
+        else:
+            process = ProcessRunner()
+            retval = process.run(cmd, watch)
         if retval != 0:
             if retval != 124: # TIMEOUT of slicer
                 for line in watch.getLines():
@@ -519,6 +739,7 @@ class SymbioticCC(object):
             # act as the slicing was disabled
             self.options.noslice = True
         else:
+            self._to_cache(None if hit else key, output)
             self.curfile = output
             self._save_ll()
 
@@ -526,13 +747,19 @@ class SymbioticCC(object):
         if not passes or self.options.no_optimize:
             return
 
-        disable += self.options.disabled_optimizations
+        disable = disable + self.options.disabled_optimizations
         if disable:
             ds = set(disable)
-            passes = filter(lambda x: not ds.__contains__(x), passes)
+            passes = [p for p in passes if p not in ds]
 
         if not passes:
             dbg("No passes available for optimizations")
+            return
+
+        if self.options.fuse_opt:
+            # we always load LLVMsbt.so when running the deferred passes
+            self._defer_opt(passes, optimizations=True)
+            return
 
         output = '{0}-opt.bc'.format(self.curfile[:self.curfile.rfind('.')])
         cmd = ['opt']
@@ -542,7 +769,7 @@ class SymbioticCC(object):
         cmd += passes
 
         restart_counting_time()
-        runcmd(cmd, CompileWatch(), 'Optimizing the code failed')
+        self._run_stage(cmd, output, CompileWatch(), 'Optimizing the code failed')
         print_elapsed_time('INFO: Optimizations time', color='WHITE')
 
         self.curfile = output
@@ -590,17 +817,23 @@ class SymbioticCC(object):
         opts += self.cc_disable_optimizations()
 
         llvmsrc = []
+        tocompile = []
         options = self.options
         for source in self.sources:
             if options.source_is_bc:
                 dbg("Treating '{0}' as LLVM bitcode (required)".format(source))
-                llvms = source
+                llvmsrc.append(source)
             elif source.endswith('.bc') or source.endswith('.ll'):
                 dbg("Treating '{0}' as LLVM bitcode (according to suffix)".format(source))
-                llvms = source
+                llvmsrc.append(source)
             else:
-                llvms = self._compile_to_llvm(source, opts=opts)
-            llvmsrc.append(llvms)
+                # placeholder for the compiled file
+                llvmsrc.append(None)
+                tocompile.append(source)
+
+        # compile all the C sources at once
+        compiled = iter(self._compile_parallel(tocompile, opts))
+        llvmsrc = [llvms or next(compiled) for llvms in llvmsrc]
 
         # link all compiled sources to a one bitecode
         # the result is stored to self.curfile
@@ -674,14 +907,35 @@ class SymbioticCC(object):
         # and also other funs like __errno_location may be included
         self.link_undefined()
 
-    def prepare_unsliced_file(self):
+    def _unsliced_copy(self):
         """
-        Get the unsliced file and perform the same
-        postprocessing steps as for the sliced file
+        Get a copy of this object that works on a copy of the unsliced
+        file, so that it can prepare the file while we work on the sliced
+        file (the names of the files that it creates do not clash with ours).
+        The copy has its own options and tool, the stages change them.
         """
+        cc = copy(self)
+        cc._pending_passes = []
+        cc._pending_optimizations = False
+        cc._linked_functions = []
+        cc._unsliced = None
+        cc._unsliced_thread = None
+        memo = {}
+        cc.options = deepcopy(self.options, memo)
+        cc._tool = deepcopy(self._tool, memo)
+
         llvmfile = self.nonsliced_llvmfile
-        tmp = self.curfile
-        self.curfile = llvmfile
+        unsliced = '{0}-unsliced.bc'.format(llvmfile[:llvmfile.rfind('.')])
+        copyfile(llvmfile, unsliced)
+        cc.curfile = unsliced
+        return cc
+
+    def _prepare_unsliced_file(self):
+        """
+        Perform the same postprocessing steps on the unsliced file
+        as for the sliced file (self is the copy from _unsliced_copy)
+        """
+        restart_counting_time()
 
         if self.options.property.termination():
             self.run_opt(['-find-exits']) # FIXME: make tool specific
@@ -690,10 +944,69 @@ class SymbioticCC(object):
             self._tool.actions_after_slicing(self)
         self.postprocessing()
 
-        llvmfile = self.curfile
-        self.curfile = tmp
+        return self.curfile
 
-        return llvmfile
+    def start_preparing_unsliced_file(self):
+        """
+        Start preparing the unsliced file in the background,
+        prepare_unsliced_file() then just waits for the result
+        """
+        if self._unsliced is not None:
+            return
+
+        dbg('Preparing the unsliced file in the background')
+        future = Future()
+        cc = self._unsliced_copy()
+
+        def prepare():
+            # print the messages once we use the file, not in between ours
+            buffer_output(self._unsliced_output)
+            ProcessRunner.cancel_on(self._unsliced_cancel)
+            try:
+                future.set_result(cc._prepare_unsliced_file())
+            except BaseException as e:
+                future.set_exception(e)
+
+        self._unsliced = future
+        # we do not wait for the thread if we do not need the file,
+        # stop_preparing_unsliced_file() cancels it
+        self._unsliced_thread = Thread(target=prepare, name='unsliced',
+                                       daemon=True)
+        self._unsliced_thread.start()
+
+    def cancel_preparing_unsliced_file(self):
+        """
+        Do not let the background preparation start new processes,
+        the running ones are to be killed by the caller
+        """
+        ProcessRunner.cancel(self._unsliced_cancel)
+
+    def stop_preparing_unsliced_file(self):
+        """ Wait for the (cancelled) background preparation to finish """
+        self.cancel_preparing_unsliced_file()
+        if self._unsliced_thread is not None:
+            self._unsliced_thread.join()
+
+    def prepare_unsliced_file(self):
+        """
+        Get the unsliced file and perform the same
+        postprocessing steps as for the sliced file.
+        The file is prepared only once.
+        """
+        if self._unsliced is None:
+            self._unsliced = Future()
+            try:
+                self._unsliced.set_result(self._unsliced_copy()._prepare_unsliced_file())
+            except BaseException as e:
+                self._unsliced.set_exception(e)
+        elif not self._unsliced.done():
+            dbg('Waiting for the unsliced file')
+
+        try:
+            return self._unsliced.result()
+        finally:
+            print_buffered(self._unsliced_output)
+            self._unsliced_output.clear()
 
 
     def _disable_some_optimizations(self, llvm_version):
@@ -868,6 +1181,13 @@ class SymbioticCC(object):
         # remember the non-sliced llvmfile
         self.nonsliced_llvmfile = self.curfile
 
+        # we may need the unsliced file later (when replaying an error,
+        # or if we fail on the sliced file), prepare it meanwhile
+        opts = self.options
+        if opts.speculative_unsliced and not opts.noslice and\
+           (opts.replay_error or opts.sv_comp or opts.test_comp):
+            self.start_preparing_unsliced_file()
+
         if hasattr(self._tool, 'passes_before_slicing'):
             passes = self._tool.passes_before_slicing()
             if passes:
@@ -910,5 +1230,8 @@ class SymbioticCC(object):
                     self.options.final_output, str(e))
                 raise SymbioticException(msg)
 
+        if self.options.stats and self._cache:
+            print_stdout('INFO: Stage cache {0}'.format(self._cache.stats()))
+
         return self.curfile
 
@@ -0,0 +1,164 @@
+#!/usr/bin/python
+
+"""
+Streaming of the output of child processes with asyncio.
+The output is read in large chunks that are split into lines afterwards,
+so that chatty tools do not cost a syscall per line, and the outputs
+of several processes can be multiplexed in one event loop.
+"""
+
+import asyncio
+from io import BytesIO
+
+# how much of the output we read at once
+CHUNK_SIZE = 1 << 16
+
+
+def _kill(process):
+    if process.poll() is None:
+        process.terminate()
+        process.kill()
+
+
+async def _stop(process, timeout):
+    # give the process a chance to finish gracefully
+    if process.poll() is None:
+        process.terminate()
+        delay = 0.001
+        while timeout > 0 and process.poll() is None:
+            await asyncio.sleep(delay)
+            timeout -= delay
+            delay = min(2 * delay, 0.05)
+    _kill(process)
+    return await _wait_exit(process)
+
+
+async def _wait_exit(process):
+    # the process closed its output, so it is going to exit soon,
+    # do not block the event loop (other processes) waiting for it
+    delay = 0.001
+    while process.poll() is None:
+        await asyncio.sleep(delay)
+        delay = min(2 * delay, 0.05)
+    return process.returncode
+
+
+async def stream(process, watch, chunk_size=CHUNK_SIZE):
+    """
+    Pass the output of the process (a Popen object with stdout=PIPE)
+    to the watch line by line and wait for the process to finish.
+    If the watch is not ok with the output, the process is terminated
+    (and killed after watch.stop_timeout seconds). If the coroutine
+    is cancelled, the process is killed.
+
+    \return return code of the process or None when the
+    process has been stopped by the watch object
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=chunk_size, loop=loop)
+    transport, _ = await loop.connect_read_pipe(
+                        lambda: asyncio.StreamReaderProtocol(reader, loop=loop),
+                        process.stdout)
+    try:
+        pending = b''
+        while True:
+            try:
+                chunk = await asyncio.wait_for(reader.read(chunk_size),
+                                               watch.poll_interval)
+            except asyncio.TimeoutError:
+                # the process is silent, ask the watch anyway
+                if not watch.ok():
+                    await _stop(process, watch.stop_timeout)
+                    return None
+                continue
+
+            if not chunk:
+                break
+
+            if pending:
+                chunk = pending + chunk
+            # keep the incomplete last line for the next chunk
+            end = chunk.rfind(b'\n') + 1
+            pending = chunk[end:]
+            # split the lines in C (BytesIO splits only on '\n'
+            # like iterating over the pipe does)
+            for line in BytesIO(chunk[:end]):
+                watch.putLine(line)
+                if not watch.ok():
+                    # watch told us to kill the process for some reason
+                    await _stop(process, watch.stop_timeout)
+                    return None
+
+        # the last line without a newline
+        if pending:
+            watch.putLine(pending)
+            if not watch.ok():
+                await _stop(process, watch.stop_timeout)
+                return None
+
+        return await _wait_exit(process)
+    except BaseException:
+        # cancelled (timeout, interrupt, some other process decided
+        # the result), do not leave the process behind
+        _kill(process)
+        raise
+    finally:
+        transport.close()
+
+
+def wait(process, watch, chunk_size=CHUNK_SIZE):
+    """ Synchronous wrapper around stream() """
+    return asyncio.run(stream(process, watch, chunk_size))
+
+
+async def stream_many(start, jobsnum, maxjobs=None, stop=None):
+    """
+    Run 'jobsnum' processes and multiplex their outputs in this event loop.
+    'start' is a callable that gets the index of a job and starts the process,
+    it returns the pair (process, watch). At most 'maxjobs' processes
+    are running at once (all of them if None).
+
+    'stop' is a callable that gets the index of a job and its return code
+    whenever a process finishes. If it returns True, the processes that
+    are still running are killed and no new processes are started.
+
+    \return the list of return codes of the processes, None for the
+    processes that were killed or never started
+    """
+    if maxjobs is None or maxjobs <= 0:
+        maxjobs = jobsnum
+    semaphore = asyncio.Semaphore(max(1, maxjobs))
+    retvals = [None] * jobsnum
+    stopped = False
+
+    async def _run(idx):
+        nonlocal stopped
+        async with semaphore:
+            if stopped:
+                return
+            process, watch = start(idx)
+            retvals[idx] = await stream(process, watch)
+            # decide before the slot is released,
+            # so that no other process is started meanwhile
+            if stop and not stopped and stop(idx, retvals[idx]):
+                stopped = True
+
+    tasks = [asyncio.ensure_future(_run(n)) for n in range(jobsnum)]
+    try:
+        for future in asyncio.as_completed(tasks):
+            await future
+            if stopped:
+                break
+    finally:
+        # kill the processes that are still running (cancels also
+        # the tasks on errors, timeout or interrupt)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return retvals
+
+
+def run_many(start, jobsnum, maxjobs=None, stop=None):
+    """ Synchronous wrapper around stream_many() """
+    return asyncio.run(stream_many(start, jobsnum, maxjobs, stop))
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+
+import os
+import json
+from hashlib import sha256 as hashfunc
+from shutil import copyfile
+from threading import get_ident
+
+from . utils import dbg
+from . fingerprint import file_hash
+
+
+def _strip_timeout(cmd):
+    # the time limit does not change the output (we cache only successful runs)
+    if len(cmd) > 2 and cmd[0] == 'timeout':
+        return cmd[2:]
+    return cmd
+
+
+def parse_deps_file(path):
+    """
+    Parse a make-style dependency file (as generated by clang -MD)
+    and return the list of files the target depends on
+    """
+    with open(path, 'r') as f:
+        content = f.read().replace('\\\n', ' ')
+    _, _, deps = content.partition(':')
+    return [d for d in deps.split() if d]
+
+
+class StageCache(object):
+    """
+    Persistent content-addressed cache of the outputs of the stages
+    of symbiotic-cc. The key of an entry is computed from the command line
+    of the stage where every existing file is replaced by the hash of its
+    content and the output file by a placeholder, together with the versions
+    of the used tools. Entries are evicted in LRU order when the cache
+    grows over its size limit. The size of the cache is computed
+    once and then we only count what we store, so that we do not walk
+    the whole cache on every store (what other processes store is found
+    out when we walk the cache to evict entries).
+    """
+
+    def __init__(self, cachedir, maxsize, versions):
+        self._dir = os.path.abspath(cachedir)
+        self._maxsize = maxsize
+        self._versions = versions
+
+        self.hits = 0
+        self.misses = 0
+        # the size of the entries in the cache, computed on the first store
+        self._size = None
+
+        os.makedirs(self._dir, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self._dir, key[:2], key)
+
+    def key(self, cmd, output):
+        hsh = hashfunc()
+        hsh.update(self._versions.encode('utf-8'))
+        for arg in _strip_timeout(cmd):
+            arg = str(arg)
+            if arg == output:
+                hsh.update(b'\0<output>')
+            elif os.path.isfile(arg):
+                hsh.update(b'\0<file>')
+                hsh.update(file_hash(arg).encode('ascii'))
+            else:
+                hsh.update(b'\0')
+                hsh.update(arg.encode('utf-8'))
+        return hsh.hexdigest()
+
+    def _deps_are_valid(self, entry):
+        depsfile = entry + '.deps'
+        if not os.path.isfile(depsfile):
+            return True
+
+        with open(depsfile, 'r') as f:
+            deps = json.load(f)
+        for path, hsh in deps.items():
+            if not os.path.isfile(path) or file_hash(path) != hsh:
+                dbg("Cached entry is stale, '{0}' changed".format(path),
+                    domain='cache')
+                return False
+        return True
+
+    def restore(self, key, output):
+        """
+        Copy the cached output of the stage with the given key
+        to 'output'. Return True on hit and False on miss.
+        """
+        entry = self._entry(key)
+        if not os.path.isfile(entry) or not self._deps_are_valid(entry):
+            self.misses += 1
+            return False
+
+        copyfile(entry, output)
+        # mark the entry as recently used
+        os.utime(entry)
+        self.hits += 1
+        dbg("Restored '{0}' from the cache".format(output), domain='cache')
+        return True
+
+    def store(self, key, output, deps=None):
+        """
+        Store the output of a stage. 'deps' is an optional list
+        of files that the output depends on besides the command line
+        (e.g., included headers)
+        """
+        entry = self._entry(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+
+        # copy to a temporary file and rename it, so that a concurrently
+        # running symbiotic never sees a half-written entry
+        tmp = '{0}.{1}.{2}.tmp'.format(entry, os.getpid(), get_ident())
+        try:
+            copyfile(output, tmp)
+            size = os.path.getsize(tmp)
+            if deps:
+                with open(tmp + '.deps', 'w') as f:
+                    json.dump({os.path.abspath(d): file_hash(d) for d in deps
+                               if os.path.isfile(d)}, f)
+                os.rename(tmp + '.deps', entry + '.deps')
+            elif os.path.lexists(entry + '.deps'):
+                # the dependencies of a previous entry with the same key
+                os.unlink(entry + '.deps')
+            try:
+                size -= os.path.getsize(entry)
+            except OSError:
+                pass # a new entry
+            os.rename(tmp, entry)
+        except OSError as e:
+            dbg('Failed storing to the cache: {0}'.format(str(e)), domain='cache')
+            return
+
+        if self._size is None:
+            self._evict()
+        else:
+            self._size += size
+            if self._size > self._maxsize:
+                self._evict()
+
+    def _evict(self):
+        """ Compute the size of the cache and evict entries if needed """
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self._dir):
+            for f in files:
+                if f.endswith('.tmp') or f.endswith('.deps'):
+                    continue
+                path = os.path.join(root, f)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        self._size = total
+        if total <= self._maxsize:
+            return
+
+        # remove the least recently used entries, make some space
+        # so that we do not need to evict again on the next store
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self._maxsize * 0.9:
+                break
+            for f in (path, path + '.deps'):
+                try:
+                    os.unlink(f)
+                except OSError:
+                    pass
+            total -= size
+            dbg("Evicted '{0}' from the cache".format(path), domain='cache')
+        self._size = total
+
+    def stats(self):
+        return 'hits: {0}, misses: {1}'.format(self.hits, self.misses)
@@ -0,0 +1,54 @@
+#!/usr/bin/python
+
+"""
+SHA-256 fingerprints of files. The raw content of the file is hashed
+and the fingerprints are memoized for the lifetime of the process
+(keyed by the path, modification time and size of the file),
+so a file that does not change is hashed only once.
+"""
+
+import os
+import mmap
+from hashlib import sha256
+from threading import Lock
+
+# how much of the file we hash at once when we cannot map it
+BLOCK_SIZE = 1 << 20
+
+_fingerprints = {}
+_lock = Lock()
+
+
+def _hash_blocks(f, hsh):
+    while True:
+        block = f.read(BLOCK_SIZE)
+        if not block:
+            break
+        hsh.update(block)
+
+
+def _hash(path):
+    hsh = sha256()
+    with open(path, 'rb') as f:
+        try:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # empty file or a file that cannot be mapped
+            _hash_blocks(f, hsh)
+        else:
+            with mapping:
+                hsh.update(mapping)
+    return hsh.hexdigest()
+
+
+def file_hash(path):
+    """ Get the SHA-256 of the content of the file (as a hex string) """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size, st.st_ino)
+    with _lock:
+        fingerprint = _fingerprints.get(key)
+    if fingerprint is None:
+        fingerprint = _hash(path)
+        with _lock:
+            _fingerprints[key] = fingerprint
+    return fingerprint
@@ -0,0 +1,168 @@
+#!/usr/bin/python
+
+"""
+Reading .ktest files generated by KLEE (the format is taken from ktest-tool).
+The files are memory-mapped and the objects are just views into the mapping,
+so their contents are not copied unless it is needed.
+"""
+
+import mmap
+from os import scandir
+from os.path import join
+from struct import Struct
+
+from .. exceptions import SymbioticException
+
+_int = Struct('>i')
+
+# the values of objects of these sizes we can show as numbers
+_int_formats = {1: 'b', 2: 'h', 4: 'i', 8: 'l'}
+
+
+class KTestObject(object):
+    """
+    Symbolic object from a .ktest file. 'data' is a memoryview
+    into the file that is valid until the KTest is closed.
+    """
+
+    __slots__ = ('_name', 'data')
+
+    def __init__(self, name, data):
+        self._name = name
+        self.data = data
+
+    @property
+    def name(self):
+        return bytes(self._name)
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    def cast(self, fmt):
+        """ Get the data as a typed view (see memoryview.cast) """
+        return self.data.cast(fmt)
+
+    def value(self):
+        """
+        Get the value of the object as a (signed) integer
+        if it has the size of some integer type, otherwise return None
+        """
+        fmt = _int_formats.get(len(self.data))
+        if fmt is None:
+            return None
+        return self.data.cast(fmt)[0]
+
+    def is_zero(self):
+        return self.data.tobytes().count(0) == len(self.data)
+
+    def _release(self):
+        self._name.release()
+        self.data.release()
+
+
+class KTest(object):
+    """
+    Parsed .ktest file. Use it as a context manager or call close(),
+    the objects are not valid after closing the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.args = []
+        self.objects = []
+        self._mmap = None
+        self._view = None
+
+        with open(path, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file
+                raise SymbioticException("Invalid ktest file: '{0}'".format(path))
+
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_int(self, pos):
+        if pos + 4 > len(self._view):
+            raise SymbioticException("Truncated ktest file: '{0}'".format(self.path))
+        return _int.unpack_from(self._view, pos)[0], pos + 4
+
+    def _read_bytes(self, pos):
+        size, pos = self._read_int(pos)
+        if size < 0 or pos + size > len(self._view):
+            raise SymbioticException("Truncated ktest file: '{0}'".format(self.path))
+        return self._view[pos:pos + size], pos + size
+
+    def _parse(self):
+        self._view = memoryview(self._mmap)
+        hdr = self._view[:5].tobytes()
+        if hdr != b'KTEST' and hdr != b'BOUT\n':
+            raise SymbioticException("Unrecognized file: '{0}'".format(self.path))
+
+        version, pos = self._read_int(5)
+        if version > 3:
+            raise SymbioticException("Unrecognized version of ktest: '{0}'".format(self.path))
+        self.version = version
+
+        numArgs, pos = self._read_int(pos)
+        for i in range(numArgs):
+            arg, pos = self._read_bytes(pos)
+            self.args.append(arg.tobytes())
+            arg.release()
+
+        if version >= 2:
+            # sym_argvs and sym_argv_len
+            _, pos = self._read_int(pos)
+            _, pos = self._read_int(pos)
+
+        numObjects, pos = self._read_int(pos)
+        for i in range(numObjects):
+            name, pos = self._read_bytes(pos)
+            try:
+                data, pos = self._read_bytes(pos)
+            except SymbioticException:
+                # the mapping cannot be closed while the view exists
+                name.release()
+                raise
+            self.objects.append(KTestObject(name, data))
+
+    def close(self):
+        for o in self.objects:
+            o._release()
+        self.objects = []
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.objects)
+
+    def __len__(self):
+        return len(self.objects)
+
+
+def read_ktests(directory, suffix='.ktest'):
+    """
+    Parse all .ktest files in the directory (e.g., klee-out-N)
+    in the order of their names. Yields KTest objects, every KTest
+    is closed when the next one is requested.
+    """
+    paths = sorted(e.name for e in scandir(directory)
+                   if e.name.endswith(suffix) and e.is_file())
+    for name in paths:
+        with KTest(join(directory, name)) as ktest:
+            yield ktest
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+
+import re
+
+
+try:
+    import re._parser as _sre_parse
+except ImportError:
+    import sre_parse as _sre_parse
+
+
+def _required_literal(pattern):
+    """
+    Get the longest string that must occur in every string
+    that the pattern matches (or '' if we do not find any)
+    """
+    try:
+        parsed = _sre_parse.parse(pattern)
+    except Exception:
+        return ''
+
+    best, cur = '', []
+    for op, arg in parsed:
+        if op is _sre_parse.LITERAL:
+            cur.append(chr(arg))
+            continue
+        if len(cur) > len(best):
+            best = ''.join(cur)
+        cur = []
+    if len(cur) > len(best):
+        best = ''.join(cur)
+    return best
+
+
+def _trie_regex(words):
+    """
+    Create a regular expression that matches any of the words.
+    The alternatives are factored by common prefixes, which makes
+    the search much faster than a plain alternation of the words.
+    """
+    groups = {}
+    end = False
+    for w in words:
+        if w:
+            groups.setdefault(w[0], []).append(w[1:])
+        else:
+            end = True
+    if not groups:
+        return ''
+
+    alts = [re.escape(c) + _trie_regex(ws) for c, ws in sorted(groups.items())]
+    regex = alts[0] if len(alts) == 1 else '(?:{0})'.format('|'.join(alts))
+    if end:
+        # a shorter word is a prefix of this one
+        regex = '(?:{0})?'.format(regex)
+    return regex
+
+
+def _search_pattern(pattern):
+    """
+    Get a pattern for re.search that matches the lines that
+    the given pattern matches with re.match
+    """
+    # the leading .* is implied by searching, the trailing .* matches always
+    if pattern.endswith('.*') and not pattern.endswith('\\.*'):
+        pattern = pattern[:-2]
+    if pattern.startswith('.*'):
+        return '(?:{0})'.format(pattern[2:])
+    return '^(?:{0})'.format(pattern)
+
+
+def _prefilter(patterns):
+    """
+    Create a regular expression that matches (at least) all lines
+    that match any of the patterns. Most of the lines in the output
+    of tools are not interesting and these are refused with a single
+    scan of the line.
+    """
+    literals, rest = set(), []
+    for pattern in patterns:
+        literal = _required_literal(pattern)
+        if len(literal) >= 3:
+            literals.add(literal)
+        else:
+            rest.append(_search_pattern(pattern))
+
+    if literals:
+        rest.insert(0, _trie_regex(sorted(literals)))
+    return '|'.join(rest)
+
+
+class _CompiledPatterns(object):
+    def __init__(self, patterns, for_bytes):
+        enc = (lambda p: p.encode('utf-8')) if for_bytes else (lambda p: p)
+        self.prefilter = re.compile(enc(_prefilter(patterns)))
+        self.patterns = [re.compile(enc(p)) for p in patterns]
+
+
+class OutputMatcher(object):
+    """
+    Classify lines of the output of a tool. The matcher gets a list of pairs
+    (key, regular expression) and for a line returns the key of the first
+    regular expression that matches the line (using re.match), or None.
+    Lines can be both bytes and str.
+    """
+
+    def __init__(self, patterns):
+        self._keys = [key for key, _ in patterns]
+        self._str = _CompiledPatterns([p for _, p in patterns], False)
+        self._bytes = _CompiledPatterns([p for _, p in patterns], True)
+
+    def _get_compiled(self, line):
+        if isinstance(line, str):
+            return self._str
+        return self._bytes
+
+    def match(self, line):
+        compiled = self._get_compiled(line)
+        if compiled.prefilter.search(line) is None:
+            return None
+
+        # keep the priority of the patterns
+        for key, pattern in zip(self._keys, compiled.patterns):
+            if pattern.match(line):
+                return key
+
+        return None
+
+    def first(self, lines):
+        """ Return the key of the first matching line or None """
+        for line in lines:
+            key = self.match(line)
+            if key is not None:
+                return key
+        return None
+
+    def findall(self, lines):
+        """ Return the list of keys of the matching lines """
+        match = self.match
+        return [key for key in map(match, lines) if key is not None]
@@ -3,8 +3,10 @@
 from subprocess import Popen, PIPE, STDOUT
 from . utils import dbg, print_stderr
 from . watch import ProcessWatch
+from . import aioprocess
 from .. import SymbioticException
 from sys import stdout, stderr
+from threading import Lock, local
 
 try:
     from benchexec.util import find_executable
@@ -13,69 +15,126 @@ except ImportError:
 
 
 class ProcessRunner(object):
-    # we have one global process so that we can kill it anytime
-    # (there's always at most one process running anyway)
-    current_process = None
+    """
+    Runs child processes and passes their output to watch objects.
+    All the running children are registered in the class attribute
+    'children', so that we can kill all of them anytime (on timeout
+    or interrupt) from any instance of ProcessRunner.
+    """
+
+    # running processes -> their watches
+    children = {}
+    _lock = Lock()
+    # the events that cancel the work of threads, see cancel_on()
+    _thread = local()
+
+    @staticmethod
+    def cancel_on(event):
+        """
+        The current thread cannot start new processes once the event
+        is set by cancel() (the running ones are killed as usual)
+        """
+        ProcessRunner._thread.cancel = event
+
+    @staticmethod
+    def cancel(event):
+        with ProcessRunner._lock:
+            event.set()
 
-    def run(self, cmd, watch = ProcessWatch()):
+    def start(self, cmd, watch = ProcessWatch(), **kwargs):
         """
-        Run command cmd and pass its stdout+stderr output
-        to the watch object. watch object is supposed to be
-        an instance of ProcessWatch object.
+        Start the command cmd in the background, kwargs are passed to Popen.
+        The output of the process must be then consumed by calling
+        wait(process, watch) which returns the return code of the process.
 
-        \return return code of the process or None when the
-        process has been stopped by the watch object
+        \return the handle of the started process
         """
 
         assert isinstance(watch, ProcessWatch)
-        # we executed another process while the previous one is still running
-        assert ProcessRunner.current_process is None
 
         dbg('|> {0}'.format(' '.join(map(str, cmd))), prefix='', color='CYAN')
 
-        # run the command and store the handle into the class attribute
-        # current_process, so that we can easily kill this process
-        # on timeout or signal. This way we can run only one
-        # process at the time, but we don't need more (yet?)
+        cancel = getattr(ProcessRunner._thread, 'cancel', None)
+        with ProcessRunner._lock:
+            if cancel is not None and cancel.is_set():
+                raise SymbioticException('Cancelled: ' + ' '.join(cmd))
+            try:
+                process = Popen(cmd, stdout=PIPE, stderr=STDOUT, **kwargs)
+            except OSError as e:
+                msg = ' '.join(cmd) + '\n'
+                raise SymbioticException(msg + str(e))
+            ProcessRunner.children[process] = watch
+
+        return process
+
+    def wait(self, process):
+        """
+        Pass the output of the process to its watch
+        and wait until it finishes.
+
+        \return return code of the process or None when the
+        process has been stopped by the watch object
+        """
+        watch = ProcessRunner.children[process]
         try:
-            ProcessRunner.current_process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-        except OSError as e:
-            msg = ' '.join(cmd) + '\n'
-            raise SymbioticException(msg + str(e))
-
-        for line in ProcessRunner.current_process.stdout:
-            if line == b'':
-                break
-
-            watch.putLine(line)
-            if not watch.ok():
-                # watch told us to kill the process for some reason
-                ProcessRunner.current_process.terminate()
-                ProcessRunner.current_process.kill()
-                ProcessRunner.current_process = None
-                return None
+            return aioprocess.wait(process, watch)
+        finally:
+            self._remove(process)
 
-        status = ProcessRunner.current_process.wait()
-        ProcessRunner.current_process = None
+    def _remove(self, process):
+        with ProcessRunner._lock:
+            ProcessRunner.children.pop(process, None)
 
-        return status
+    def run(self, cmd, watch = ProcessWatch(), **kwargs):
+        """
+        Run command cmd and pass its stdout+stderr output
+        to the watch object. watch object is supposed to be
+        an instance of ProcessWatch object.
+
+        \return return code of the process or None when the
+        process has been stopped by the watch object
+        """
+        return self.wait(self.start(cmd, watch, **kwargs))
+
+    def processes(self):
+        with ProcessRunner._lock:
+            return list(ProcessRunner.children.keys())
 
     def hasProcess(self):
-        return ProcessRunner.current_process is not None
+        return len(ProcessRunner.children) > 0
+
+    def terminate(self, process=None):
+        """ Terminate the given process or all processes if it is None """
+        for p in ([process] if process else self.processes()):
+            if p.poll() is None:
+                p.terminate()
 
-    def terminate(self):
-        assert self.hasProcess()
-        if self.exitStatus() is None:
-            ProcessRunner.current_process.terminate()
+    def kill(self, process=None):
+        """ Kill the given process or all processes if it is None """
+        for p in ([process] if process else self.processes()):
+            if p.poll() is None:
+                p.kill()
+
+    def exitStatus(self, process=None):
+        """
+        Return the exit status of the given process. If the process
+        is None, return None if any of the processes is still running
+        """
+        if process:
+            return process.poll()
 
-    def kill(self):
-        assert self.hasProcess()
-        if self.exitStatus() is None:
-            ProcessRunner.current_process.kill()
+        status = 0
+        for p in self.processes():
+            status = p.poll()
+            if status is None:
+                return None
+        return status
 
-    def exitStatus(self):
-        assert self.hasProcess()
-        return ProcessRunner.current_process.poll()
+    def reap(self):
+        """ Forget the processes that finished (e.g., after killing them) """
+        for p in self.processes():
+            if p.poll() is not None:
+                self._remove(p)
 
 def runcmd(cmd, watch = ProcessWatch(), err_msg = ""):
     ## if the binary does not have absolute path, tell us which binary it is
@@ -88,3 +147,37 @@ def runcmd(cmd, watch = ProcessWatch(), err_msg = ""):
                          color='RED', print_nl=False)
         raise SymbioticException(err_msg)
 
+
+def run_parallel(jobs, maxjobs=None, stop=None):
+    """
+    Run the commands concurrently. 'jobs' is a list of pairs (cmd, watch)
+    or triples (cmd, watch, kwargs) where kwargs is a dictionary of additional
+    arguments for Popen (e.g., cwd). Every process passes its output
+    to its own watch object.
+    At most 'maxjobs' processes are running at once (all of them if None).
+
+    'stop' is a callable that gets the index of a job and its return code
+    whenever a process finishes. If it returns True, the processes that
+    are still running are killed and no new processes are started.
+
+    \return the list of return codes of the processes, None for the
+    processes that were killed or never started
+    """
+    runner = ProcessRunner()
+    processes = []
+
+    def _start(idx):
+        cmd, watch = jobs[idx][:2]
+        kwargs = jobs[idx][2] if len(jobs[idx]) > 2 else {}
+        process = runner.start(cmd, watch, **kwargs)
+        processes.append(process)
+        return process, watch
+
+    # the outputs of all the processes are read in one event loop
+    try:
+        return aioprocess.run_many(_start, len(jobs), maxjobs, stop)
+    finally:
+        for process in processes:
+            runner.kill(process)
+            process.wait()
+            runner._remove(process)
@@ -1,6 +1,9 @@
 #!/usr/bin/python
 
 import signal
+from time import monotonic
+
+_deadline = None
 
 
 class Timeout(Exception):
@@ -8,14 +11,27 @@ class Timeout(Exception):
 
 
 def start_timeout(sec):
+    global _deadline
+
     def alarm_handler(signum, data):
         raise Timeout
 
     signal.signal(signal.SIGALRM, alarm_handler)
     signal.alarm(sec)
+    _deadline = monotonic() + sec
 
 
 def stop_timeout():
+    global _deadline
+
     # turn of timeout
     signal.signal(signal.SIGALRM, signal.SIG_DFL)
     signal.alarm(0)
+    _deadline = None
+
+
+def remaining_time():
+    """ Seconds remaining till the timeout (None if there is no timeout) """
+    if _deadline is None:
+        return None
+    return max(0, int(_deadline - monotonic()))
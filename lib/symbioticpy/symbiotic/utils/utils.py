@@ -3,6 +3,7 @@
 import sys
 import os
 from time import time
+from threading import local
 from distutils.version import LooseVersion
 
 COLORS = {
@@ -21,6 +22,23 @@ COLORS = {
 }
 
 
+# the messages of threads that should not print directly
+_output = local()
+
+
+def buffer_output(buffered):
+    """
+    Store the messages that the current thread prints
+    into the list 'buffered' (or print them again if it is None)
+    """
+    _output.buffer = buffered
+
+
+def print_buffered(buffered):
+    for msg in buffered:
+        print_stream(*msg)
+
+
 def print_stream(msg, stream, prefix=None, print_nl=True, color=None):
     """
     Print message to stderr/stdout
@@ -31,6 +49,11 @@ def print_stream(msg, stream, prefix=None, print_nl=True, color=None):
     @ color    : str    color to use when printing, default None
     """
 
+    buffered = getattr(_output, 'buffer', None)
+    if buffered is not None:
+        buffered.append((msg, stream, prefix, print_nl, color))
+        return
+
     # don't print color when the output is redirected
     # to a file
     if not stream.isatty():
@@ -100,23 +123,69 @@ def dbg(msg, domain='all', print_nl=True, prefix='[DBG] ', color='GRAY'):
             print_stderr(msg, prefix, print_nl, color)
 
 
-# variable used to measure elapsed time
-last_time = None
+def _cgroup_memory_limit():
+    """ The memory limit of our cgroup (e.g., set by BenchExec) in bytes """
+    try:
+        with open('/proc/self/cgroup', 'r') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+
+    for line in lines:
+        _, controllers, path = line.split(':', 2)
+        if controllers == '':
+            # cgroups v2
+            limit = '/sys/fs/cgroup{0}/memory.max'.format(path.rstrip('/'))
+        elif 'memory' in controllers.split(','):
+            limit = '/sys/fs/cgroup/memory{0}/memory.limit_in_bytes'\
+                    .format(path.rstrip('/'))
+        else:
+            continue
+        try:
+            with open(limit, 'r') as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            # 'max' or no access to the cgroup
+            continue
+    return None
+
+
+def available_memory():
+    """
+    The memory in MB that we can use: the memory limit of our cgroup
+    or the available memory of the system, None if we cannot find out
+    """
+    memory = []
+    limit = _cgroup_memory_limit()
+    if limit:
+        memory.append(limit // (1024 * 1024))
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    memory.append(int(line.split()[1]) // 1024)
+                    break
+    except (OSError, ValueError, IndexError):
+        pass
+    return min(memory) if memory else None
+
+
+# used to measure elapsed time, every thread measures its own time
+_timer = local()
 
 
 def restart_counting_time():
-    global last_time
-    last_time = time()
+    _timer.last_time = time()
 
 
 def print_elapsed_time(msg, color=None):
-    global last_time
+    last_time = getattr(_timer, 'last_time', None)
     assert last_time is not None
 
     tm = time() - last_time
     print_stdout('{0}: {1}'.format(msg, tm), color=color)
     # set new starting point
-    last_time = time()
+    _timer.last_time = time()
 
 
 def get_symbiotic_dir():
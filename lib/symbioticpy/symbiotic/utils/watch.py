@@ -6,6 +6,13 @@ from . utils import dbg
 class ProcessWatch(object):
     """ Parse output of running process """
 
+    # if not None, ok() is called also every 'poll_interval' seconds
+    # when the process does not print anything
+    poll_interval = None
+    # how long to wait after terminating the process (when ok() returned
+    # False) before it is killed
+    stop_timeout = 0
+
     def __init__(self, lines_limit=0):
         """
         Initialize a watch. By default, do not store
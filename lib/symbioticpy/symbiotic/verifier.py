@@ -1,10 +1,15 @@
 #!/usr/bin/python
 
 import sys
+import os
+import heapq
+from collections import deque
+from time import time
+from shutil import copyfile
+from tempfile import mkdtemp, mkstemp
 
-from . utils import dbg
 from . utils import dbg, print_elapsed_time, restart_counting_time
-from . utils.process import runcmd, ProcessRunner
+from . utils.process import runcmd, run_parallel, ProcessRunner
 from . utils.watch import ProcessWatch, DbgWatch
 from . utils.utils import print_stderr, print_stdout
 from . exceptions import SymbioticException, SymbioticExceptionalResult
@@ -17,21 +22,132 @@ def initialize_verifier(opts):
         raise SymbioticException('Unknown verifier: {0}'.format(opts.tool_name))
 
 class ToolWatch(ProcessWatch):
-    def __init__(self, tool):
-        # store the whole output of a tool
-        ProcessWatch.__init__(self, None)
+    """
+    Watch that stores the output of a tool. If the tool can classify
+    the lines of its output (it has the method classify_output_line),
+    only the classified lines (at most 'relevant_limit' lines of each class)
+    and the last 'tail_lines' lines are kept, so the memory is bounded
+    no matter how much the tool prints. Otherwise, the whole output is kept.
+    The whole output can be also written into a compressed file.
+
+    If the tool can determine the final result from a single line
+    of its output (it has the method final_result), the watch tells
+    to stop the tool once the result is known and the grace period
+    (the time for the tool to write the witness, etc.) passed.
+    """
+
+    # seconds
+    grace_period = 5
+    stop_timeout = 2
+    # lines kept for reporting errors
+    tail_lines = 1000
+    # lines of the same class that are kept
+    relevant_limit = 100
+
+    def __init__(self, tool, spill=None):
+        # we store the lines by ourselves
+        ProcessWatch.__init__(self, 0)
         self._tool = tool
+        self._classify = getattr(tool, 'classify_output_line', None)
+        self._final_result = getattr(tool, 'final_result', None)
+        # the final result determined from the output
+        self.verdict = None
+        self._verdict_time = None
+        if self._final_result:
+            self.poll_interval = 0.5
+
+        # pairs (number of the line, line)
+        self._tail = deque(maxlen=self.tail_lines if self._classify else None)
+        self._relevant = []
+        self._relevant_count = {}
+        self._linenum = 0
+
+        self._spill = None
+        if spill:
+            import gzip
+            self._spill = gzip.open(spill, 'wb', compresslevel=1)
+            dbg("Writing the output of {0} to '{1}'".format(tool.name(), spill))
 
     def parse(self, line):
         if b'ERROR' in line or b'WARN' in line or b'Assertion' in line\
            or b'error' in line or b'warn' in line:
-            line = line.decode('utf-8', 'replace')
-            sys.stderr.write(line)
+            sys.stderr.write(line.decode('utf-8', 'replace'))
         else:
             # characters on which decode fails
             msg = line.decode('utf-8', 'replace')
             dbg(msg, 'all', print_nl=msg[-1] != '\n', prefix='', color=None)
 
+        self._linenum += 1
+        self._tail.append((self._linenum, line))
+        if self._spill:
+            self._spill.write(line)
+
+        key = None
+        if self._classify:
+            key = self._classify(line)
+            if key is None:
+                # nothing interesting in this line
+                return
+
+            cnt = self._relevant_count.get(key, 0)
+            if cnt < self.relevant_limit:
+                self._relevant_count[key] = cnt + 1
+                self._relevant.append((self._linenum, line))
+
+        if self._final_result and self.verdict is None:
+            self.verdict = self._final_result(line)
+            if self.verdict:
+                dbg('Result is going to be {0}'.format(self.verdict))
+                self._verdict_time = time()
+
+    def getLines(self):
+        """
+        Get the stored lines of the output (in the original order)
+        """
+        if not self._classify:
+            return [line for _, line in self._tail]
+
+        lines = []
+        last = 0
+        for num, line in heapq.merge(self._relevant, self._tail):
+            # the line can be both in the relevant lines and in the tail
+            if num != last:
+                lines.append(line)
+                last = num
+        return lines
+
+    def getTail(self):
+        """ Get the last lines of the output """
+        return [line for _, line in self._tail]
+
+    def finish(self):
+        if self._spill:
+            self._spill.close()
+            self._spill = None
+
+    def ok(self):
+        if self._verdict_time is None:
+            return True
+        if time() - self._verdict_time < self.grace_period:
+            return True
+        dbg('Stopping the tool, the result is known')
+        return False
+
+def _set_affinity(cpus):
+    """
+    Return a function that binds a child process to the given CPUs
+    (to be used as preexec_fn of Popen). It runs in the forked child,
+    so it must only make the system call.
+    """
+    cpus = frozenset(cpus)
+    def set_affinity():
+        os.sched_setaffinity(0, cpus)
+    return set_affinity
+
+def _is_definitive(res):
+    sw = res.lower().startswith
+    return sw('true') or sw('false')
+
 class SymbioticVerifier(object):
     """
     Instance of symbiotic tool. Instruments, prepares, compiles and runs
@@ -68,57 +184,202 @@ class SymbioticVerifier(object):
         runcmd(cmd, DbgWatch('all'), 'Running opt failed')
         self.curfile = output
 
-    def _run_tool(self, tool, prp, params, timeout):
+    def _tool_cmd(self, tool, params, timeout, rlimits={}):
         cmd = []
         if timeout:
             cmd = ['timeout', str(int(timeout))]
-        cmd += tool.cmdline(tool.executable(), params,
-                            [self.curfile], prp, [])
-        watch = ToolWatch(tool)
-        process = ProcessRunner()
+        prp = self.options.property.getPrpFile()
+        return cmd + tool.cmdline(tool.executable(), params,
+                                  [self.curfile], prp, rlimits)
 
-        returncode = process.run(cmd, watch)
-        if returncode != 0:
+    def _tool_result(self, tool, returncode, watch):
+        if returncode is None and watch.verdict:
+            # we stopped the tool because we knew the result,
+            # determine it as if the tool finished on its own
+            returncode = 0
+        elif returncode != 0:
             dbg('The verifier return non-0 return status')
 
+        watch.finish()
         res = tool.determine_result(returncode, 0,
-                                    map(str, watch.getLines()),
+                                    [line.decode('utf-8', 'replace')
+                                     for line in watch.getLines()],
                                     False)
         if res.lower().startswith('error'):
-            for line in watch.getLines():
+            for line in watch.getTail():
                 print_stderr(line.decode('utf-8', 'replace'),
                              color='RED', print_nl=False)
         return res
 
-    def _run_verifier(self, tool, addparams, timeout):
-        # prepare the bitcode
+    def _prepare_verifier(self, tool, addparams):
+        """
+        Prepare the bitcode for the tool and return the parameters for it
+        """
         if hasattr(tool, 'passes_before_verification'):
             self._run_opt(tool.passes_before_verification())
 
         params = self.override_params or self.options.tool_params
         if addparams:
             params = params + addparams
-        prp = self.options.property.getPrpFile()
-        return self._run_tool(tool, prp, params, timeout)
+        return params
 
-    def run_verification(self):
-        print_stdout('INFO: Starting verification', color='WHITE')
-        restart_counting_time()
+    def _tool_watch(self, tool, directory):
+        spill = None
+        if self.options.spill_tool_output:
+            fd, spill = mkstemp(prefix='{0}-output-'.format(tool.name()),
+                                suffix='.log.gz', dir=directory)
+            os.close(fd)
+        return ToolWatch(tool, spill)
+
+    def _run_verifier(self, tool, addparams, timeout):
+        params = self._prepare_verifier(tool, addparams)
+        watch = self._tool_watch(tool,
+                                 os.path.dirname(os.path.abspath(self.curfile)))
+        process = ProcessRunner()
+
+        returncode = process.run(self._tool_cmd(tool, params, timeout), watch)
+        return self._tool_result(tool, returncode, watch)
+
+    def _run_verifiers(self, verifiers, res='unknown'):
+        """
+        Run the verifiers one by one until one of them gives an answer.
+        \return the pair (result, the tool that decided it or None)
+        """
         orig_bitcode = self.curfile
-        for verifiertool, addparams, verifiertimeout in self._tool.verifiers():
+        for verifiertool, addparams, verifiertimeout in verifiers:
             self.curfile = orig_bitcode
             res = self._run_verifier(verifiertool, addparams, verifiertimeout)
-            sw = res.lower().startswith
             # we got an answer, we can finish
-            if sw('true') or sw('false'):
+            if _is_definitive(res):
                 return res, verifiertool
             print(f"{verifiertool.name()} answered {res}")
         self.curfile = orig_bitcode # restore the original bitcode
-        print_elapsed_time("INFO: Verification time", color='WHITE')
         return res, None
 
+    def run_verification(self):
+        print_stdout('INFO: Starting verification', color='WHITE')
+        restart_counting_time()
+        res, tool = self._run_verifiers(self._tool.verifiers())
+        if tool is None:
+            print_elapsed_time("INFO: Verification time", color='WHITE')
+        return res, tool
+
+    def _portfolio(self):
+        """
+        Get the pair (members, fallbacks): the verifiers that run
+        in parallel and the verifiers that run one by one after them
+        if none of the members gives an answer
+        """
+        if hasattr(self._tool, 'portfolio'):
+            return self._tool.portfolio()
+        return self._tool.verifiers(), ()
+
+    def _portfolio_limits(self, count):
+        """
+        Get the pairs (preexec_fn, rlimits) for the members of the portfolio.
+        The memory limit is not set on the processes (the solvers reserve
+        much more address space than they use), it is passed to the tools
+        in rlimits, so that they can limit themselves.
+        """
+        cpus, memory = None, None
+        if hasattr(self._tool, 'portfolio_limits'):
+            cpus, memory = self._tool.portfolio_limits(count)
+
+        rlimits = {}
+        if memory:
+            # in bytes as in BenchExec
+            rlimits['memlimit'] = memory * 1024 * 1024
+
+        limits = []
+        available = sorted(os.sched_getaffinity(0))
+        for n in range(count):
+            preexec_fn = None
+            if cpus:
+                # give the members disjoint sets of CPUs if possible
+                preexec_fn = _set_affinity(available[(n * cpus + i) % len(available)]
+                                           for i in range(cpus))
+            limits.append((preexec_fn, rlimits))
+        return limits
+
+    def _use_results_of(self, bitcode, orig_bitcode):
+        """
+        Make the results of the member of the portfolio that worked
+        on 'bitcode' available as if it run on the original bitcode
+        """
+        src = os.path.join(os.path.dirname(bitcode), 'klee-last')
+        if not os.path.lexists(src):
+            return
+        dst = os.path.join(os.path.dirname(os.path.abspath(orig_bitcode)),
+                           'klee-last')
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        os.symlink(os.path.realpath(src), dst)
+
+    def run_portfolio(self):
+        """
+        Run the independent verifiers of the tool concurrently, every
+        verifier on its own copy of the bitcode in its own directory.
+        The first true/false answer wins and the other verifiers are killed.
+        If there is no answer, run the fallbacks one by one.
+        """
+        print_stdout('INFO: Starting verification (parallel portfolio)',
+                     color='WHITE')
+        restart_counting_time()
+        orig_bitcode = self.curfile
+        workdir = os.path.dirname(os.path.abspath(orig_bitcode))
+        members, fallbacks = self._portfolio()
+        members = list(members)
+        limits = self._portfolio_limits(len(members))
+
+        jobs, bitcodes = [], []
+        for n, (tool, addparams, timeout) in enumerate(members):
+            tooldir = mkdtemp(prefix='portfolio-{0}-{1}-'.format(n, tool.name()),
+                              dir=workdir)
+            self.curfile = os.path.join(tooldir, os.path.basename(orig_bitcode))
+            copyfile(orig_bitcode, self.curfile)
+
+            params = self._prepare_verifier(tool, addparams)
+            bitcodes.append(self.curfile)
+            preexec_fn, rlimits = limits[n]
+            jobs.append((self._tool_cmd(tool, params, timeout, rlimits),
+                         self._tool_watch(tool, tooldir),
+                         {'cwd' : tooldir, 'preexec_fn' : preexec_fn}))
+        self.curfile = orig_bitcode # restore the original bitcode
+
+        results = [None] * len(members)
+        winner = []
+
+        def stop(idx, retval):
+            if winner or (retval is None and not jobs[idx][1].verdict):
+                # killed process
+                return bool(winner)
+            tool = members[idx][0]
+            res = self._tool_result(tool, retval, jobs[idx][1])
+            results[idx] = res
+            print(f"{tool.name()} answered {res}")
+            if _is_definitive(res):
+                winner.append(idx)
+                return True
+            return False
+
+        run_parallel(jobs, stop=stop)
+        for job in jobs:
+            # the watches of the killed tools
+            job[1].finish()
+        print_elapsed_time("INFO: Verification time", color='WHITE')
+
+        if winner:
+            idx = winner[0]
+            self._use_results_of(bitcodes[idx], orig_bitcode)
+            return results[idx], members[idx][0]
+
+        res = [r for r in results if r is not None]
+        return self._run_verifiers(fallbacks, res[-1] if res else 'unknown')
+
     def run(self):
         try:
+            if self.options.parallel_portfolio:
+                return self.run_portfolio()
             return self.run_verification()
         except KeyboardInterrupt as e:
             raise SymbioticException('interrupted')
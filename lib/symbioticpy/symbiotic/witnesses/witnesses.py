@@ -1,10 +1,11 @@
 #!/usr/bin/python
 
 from os.path import basename
-from hashlib import sha256 as hashfunc
 import datetime
 import re
 
+from symbiotic.utils.fingerprint import file_hash
+
 no_lxml = False
 try:
     from lxml import etree as ET
@@ -14,118 +15,191 @@ if no_lxml:
     # if this fails, then we're screwed, so let the script die
     from xml.etree import ElementTree as ET
 
-def get_hash(source):
-    f = open(source, 'r', encoding='utf-8')
-    hsh = hashfunc()
-    for l in f:
-        hsh.update(l.encode('utf-8'))
-
-    f.close()
-    return hsh.hexdigest()
-
-def _add_edge_key(root, name):
-    e = ET.SubElement(root, 'key', id=name)
-    e.set('for', 'edge')
-    e.set('attr.type', 'string')
-    e.set('attr.name', name)
-
-def _add_node_key(root, name):
-    e = ET.SubElement(root, 'key', id=name)
-    e.set('for', 'node')
-    e.set('attr.type', 'string')
-    e.set('attr.name', name)
-
-def _add_graph_key(root, name):
-    e = ET.SubElement(root, 'key', id=name)
-    e.set('for', 'graph')
-    e.set('attr.type', 'string')
-    e.set('attr.name', name)
+_graphml_ns = 'http://graphml.graphdrawing.org/xmlns'
+_xsi_ns = 'http://www.w3.org/2001/XMLSchema-instance'
+
+# (id, for, attr.type, default)
+_keys = [('witness-type', 'graph', 'string', None),
+         ('specification', 'graph', 'string', None),
+         ('programfile', 'graph', 'string', None),
+         ('sourcecodelang', 'graph', 'string', None),
+         ('producer', 'graph', 'string', None),
+         ('creationtime', 'graph', 'string', None),
+         ('architecture', 'graph', 'string', None),
+         ('programhash', 'graph', 'string', None),
+         ('entry', 'node', 'string', None),
+         ('violation', 'node', 'string', None),
+         ('assumption', 'edge', 'string', None),
+         ('assumption.resultfunction', 'edge', 'string', None),
+         ('startline', 'edge', 'string', None),
+         ('cyclehead', 'node', 'boolean', 'false'),
+         ('enterLoopHead', 'edge', 'boolean', 'false')]
+
+_needs_escape = re.compile('[&<>"\n\r\t]').search
+
+def _escape_text(text):
+    if not _needs_escape(text):
+        return text
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def _escape_attrib(text):
+    if not _needs_escape(text):
+        return text
+    text = _escape_text(text).replace('"', '&quot;')
+    return text.replace('\n', '&#10;').replace('\r', '&#13;').replace('\t', '&#9;')
+
+class _XMLStream(object):
+    """
+    Write XML elements one by one (indented by their depth)
+    """
+
+    def __init__(self, out):
+        self._out = out
+        # namespace URI -> prefix
+        self._prefixes = {_graphml_ns : '', _xsi_ns : 'xsi'}
+        # (qualified) tag -> name in the output
+        self._names = {}
+        # (tag, attributes) -> the start and end tag of leaf elements
+        self._leaves = {}
+
+    def add_namespace(self, prefix, uri):
+        self._prefixes.setdefault(uri, prefix)
+
+    def namespaces(self):
+        return [('xmlns:{0}'.format(prefix) if prefix else 'xmlns', uri)
+                for uri, prefix in self._prefixes.items()]
+
+    def name(self, tag):
+        name = self._names.get(tag)
+        if name is not None:
+            return name
+
+        name = tag
+        if tag[0] == '{':
+            uri, local = tag[1:].split('}', 1)
+            prefix = self._prefixes.get(uri)
+            name = '{0}:{1}'.format(prefix, local) if prefix else local
+        self._names[tag] = name
+        return name
+
+    def _tag(self, tag, attrib):
+        name = self.name
+        if not attrib:
+            return name(tag)
+        return name(tag) + ''.join([' {0}="{1}"'.format(name(k), _escape_attrib(v))
+                                    for k, v in attrib])
+
+    def start(self, tag, attrib, depth):
+        self._out.write('{0}<{1}>\n'.format('  ' * depth, self._tag(tag, attrib)))
+
+    def end(self, tag, depth):
+        self._out.write('{0}</{1}>\n'.format('  ' * depth, self.name(tag)))
+
+    def leaf(self, tag, attrib, text, depth):
+        indent = '  ' * depth
+        if text is None:
+            self._out.write('{0}<{1}/>\n'.format(indent, self._tag(tag, attrib)))
+        else:
+            self._out.write('{0}<{1}>{2}</{3}>\n'.format(indent, self._tag(tag, attrib),
+                                                       _escape_text(text),
+                                                       self.name(tag)))
+
+    def _leaf(self, elem):
+        key = (elem.tag, tuple(elem.attrib.items()))
+        tags = self._leaves.get(key)
+        if tags is None:
+            tags = ('<' + self._tag(*key), '</{0}>\n'.format(self.name(elem.tag)))
+            # the data elements repeat a lot, but do not cache the nodes
+            if len(self._leaves) < 1024:
+                self._leaves[key] = tags
+
+        text = elem.text
+        if text is None or not text.strip():
+            return tags[0] + '/>\n'
+        return tags[0] + '>' + _escape_text(text.strip()) + tags[1]
+
+    def _serialize(self, elem, indent, parts):
+        if len(elem) == 0:
+            parts.append(indent + self._leaf(elem))
+            return
+
+        parts.append('{0}<{1}>\n'.format(indent, self._tag(elem.tag, elem.attrib.items())))
+        childindent = indent + '  '
+        for child in elem:
+            if len(child) == 0:
+                parts.append(childindent + self._leaf(child))
+            else:
+                self._serialize(child, childindent, parts)
+        parts.append('{0}</{1}>\n'.format(indent, self.name(elem.tag)))
+
+    def element(self, elem, depth):
+        """ Write the whole element (with its children) """
+        parts = []
+        self._serialize(elem, '  ' * depth, parts)
+        self._out.write(''.join(parts))
 
 class GraphMLWriter(object):
+    """
+    Writer of witnesses. The violation witnesses are created from the witness
+    generated by KLEE that is streamed from the input to the output
+    (only the elements of the graph that are being copied are in memory),
+    so the memory does not depend on the length of the path.
+    """
+
     def __init__(self, source, prps, is32bit, is_correctness_wit):
         self._source = source
         self._prps = prps
         self._is32bit = is32bit
         self._correctness_wit = is_correctness_wit
 
-        self._root = None
-        self._graph = None
-
-        # this prevents adding ns0 prefix to all tags
-        ET.register_namespace("xsi",
-                              "http://www.w3.org/2001/XMLSchema-instance")
-
-    def _addKeys(self):
-        root = self._root
-        _add_graph_key(root, "witness-type")
-        _add_graph_key(root, "specification")
-        _add_graph_key(root, "programfile")
-        _add_graph_key(root, "sourcecodelang")
-        _add_graph_key(root, "producer")
-        _add_graph_key(root, "creationtime")
-        _add_graph_key(root, "architecture")
-        _add_graph_key(root, "programhash")
-        _add_node_key(root, "entry")
-        _add_node_key(root, "violation")
-        _add_edge_key(root, "assumption")
-        _add_edge_key(root, "assumption.resultfunction")
-        _add_edge_key(root, "startline")
-
-        e = ET.SubElement(root, 'key', id="cyclehead")
-        e.set('for', 'node')
-        e.set('attr.type', 'boolean')
-        e.set('attr.name', "cyclehead")
-        se = ET.SubElement(e, 'default').text = 'false'
-
-        e = ET.SubElement(root, 'key', id="enterLoopHead")
-        e.set('for', 'edge')
-        e.set('attr.type', 'boolean')
-        e.set('attr.name', "enterLoopHead")
-        se = ET.SubElement(e, 'default').text = 'false'
-
-
-    def _addCInfo(self):
-        assert self._root is not None
+        # the witness from KLEE
+        self._input = None
+        self._trivial = False
+
+    def _keys(self, out, skip):
+        for key, domain, attrtype, default in _keys:
+            if key in skip:
+                continue
+            attrib = [('id', key), ('for', domain),
+                      ('attr.type', attrtype), ('attr.name', key)]
+            if default is None:
+                out.leaf('key', attrib, None, 1)
+            else:
+                out.start('key', attrib, 1)
+                out.leaf('default', [], default, 2)
+                out.end('key', 1)
 
+    def _graphData(self):
         if self._is32bit:
             arch = '32bit'
         else:
             arch = '64bit'
 
         # add the description
+        data = []
         if self._correctness_wit:
-            ET.SubElement(self._graph, 'data',
-                          key='witness-type').text = 'correctness_witness'
+            data.append(('witness-type', 'correctness_witness'))
         else:
-            ET.SubElement(self._graph, 'data',
-                          key='witness-type').text = 'violation_witness'
-        ET.SubElement(self._graph, 'data', key='sourcecodelang').text = 'C'
-        ET.SubElement(self._graph, 'data', key='producer').text = 'Symbiotic'
+            data.append(('witness-type', 'violation_witness'))
+        data.append(('sourcecodelang', 'C'))
+        data.append(('producer', 'Symbiotic'))
         for p in self._prps:
-            ET.SubElement(self._graph, 'data', key='specification').text = p
-        ET.SubElement(self._graph, 'data', key='programfile').text = self._source
-        ET.SubElement(self._graph, 'data',
-                      key='programhash').text = get_hash(self._source)
-        ET.SubElement(self._graph, 'data', key='architecture').text = arch
-        ET.SubElement(self._graph, 'data', key='creationtime').text =\
-            '{date:%Y-%m-%dT%T}'.format(date=datetime.datetime.utcnow())
+            data.append(('specification', p))
+        data.append(('programfile', self._source))
+        data.append(('programhash', file_hash(self._source)))
+        data.append(('architecture', arch))
+        data.append(('creationtime',
+                     '{date:%Y-%m-%dT%T}'.format(date=datetime.datetime.utcnow())))
+        return data
 
-        self._addKeys()
+    def _startGraph(self, out, attrib, skipkeys):
+        self._keys(out, skipkeys)
+        out.start('graph', attrib, 1)
+        for key, text in self._graphData():
+            out.leaf('data', [('key', key)], text, 2)
 
     def createTrivialWitness(self):
-        if no_lxml:
-            self._root = ET.Element('graphml')
-        else:
-            ns = {None: 'http://graphml.graphdrawing.org/xmlns',
-                  "xsi": "http://www.w3.org/2001/XMLSchema-instance"}
-            self._root = ET.Element('graphml', nsmap=ns)
-
-        self._graphml = ET.ElementTree(self._root)
-        self._graph = ET.SubElement(self._root, 'graph', edgedefault="directed")
-        entry = ET.SubElement(self._graph, 'node', id='0')
-        ET.SubElement(entry, 'data', key='entry').text = 'true'
-
-        self._addCInfo()
+        self._trivial = True
 
     def parseError(self, ktest, is_termination):
         """
@@ -137,27 +211,72 @@ class GraphMLWriter(object):
         """
         assert not self._correctness_wit
 
-        # parse the graphml file from KLEE
-        self._graphml = ET.parse('{0}graphml'.format(ktest[:ktest.rfind('.')+1]))
-        assert self._graphml, "Failed parsing witness from KLEE" 
-        self._root = self._graphml.getroot()
+        # the graphml file from KLEE, it is read when writing the witness
+        self._input = '{0}graphml'.format(ktest[:ktest.rfind('.')+1])
 
-        assert len(self._root.getchildren()) == 1
-        self._graph = list(self._root.getchildren())[0]
-        self._addCInfo()
+    def _writeTrivial(self, out):
+        xml = _XMLStream(out)
+        out.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+        xml.start('graphml', xml.namespaces(), 0)
+        self._startGraph(xml, [('edgedefault', 'directed')], ())
+        xml.start('node', [('id', '0')], 2)
+        xml.leaf('data', [('key', 'entry')], 'true', 3)
+        xml.end('node', 2)
+        xml.end('graph', 1)
+        xml.end('graphml', 0)
 
-    def dump(self):
-        if no_lxml:
-            print(ET.tostring(self._root).decode('utf-8'))
-        else:
-            print(ET.tostring(self._root, pretty_print=True).decode('utf-8'))
+    def _writeFromKLEE(self, out):
+        xml = _XMLStream(out)
+        out.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+        # the ids of keys defined by KLEE
+        keys = set()
+        stack = []
+        graph = None
+        for event, elem in ET.iterparse(self._input,
+                                        events=('start-ns', 'start', 'end')):
+            if event == 'start-ns':
+                xml.add_namespace(*elem)
+                continue
 
-    def write(self, to):
-        et = self._graphml
-        if no_lxml:
-            et.write(to, encoding='UTF-8', method="xml",
-                     xml_declaration=True)
+            if event == 'start':
+                stack.append(elem)
+                depth = len(stack) - 1
+                if depth == 0:
+                    xml.start(elem.tag, xml.namespaces() +
+                              [a for a in elem.attrib.items()
+                               if not a[0].startswith('xmlns')], 0)
+                elif depth == 1 and xml.name(elem.tag) == 'graph':
+                    graph = elem
+                    self._startGraph(xml, elem.attrib.items(), keys)
+                continue
+
+            stack.pop()
+            depth = len(stack)
+            if depth == 0:
+                xml.end(elem.tag, 0)
+            elif depth == 1 and xml.name(elem.tag) == 'graph':
+                xml.end(elem.tag, 1)
+            elif depth == 1 or (depth == 2 and stack[-1] is graph):
+                # a whole node, edge, or key is parsed, copy it
+                # and throw it away
+                if depth == 1 and xml.name(elem.tag) == 'key':
+                    keys.add(elem.get('id'))
+                xml.element(elem, depth)
+                stack[-1].remove(elem)
+
+        assert not stack, "Failed parsing witness from KLEE"
+
+    def _write(self, out):
+        if self._input:
+            self._writeFromKLEE(out)
         else:
-            et.write(to, encoding='UTF-8', method="xml",
-                     pretty_print=True, xml_declaration=True)
+            assert self._trivial
+            self._writeTrivial(out)
+
+    def dump(self):
+        import sys
+        self._write(sys.stdout)
 
+    def write(self, to):
+        with open(to, 'w', encoding='utf-8') as f:
+            self._write(f)
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+"""
+Microbenchmark of classifying the output of KLEE:
+the old way (matching the repr of every line against every regex)
+against OutputMatcher (matching the bytes with one prefilter scan).
+Run from Symbiotic's root directory, optionally with the number of lines.
+"""
+
+import re
+import sys
+from os.path import dirname, abspath, join
+from random import Random
+from time import time
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'lib', 'symbioticpy'))
+
+from symbiotic.options import SymbioticOptions
+from symbiotic.targets.klee import SymbioticTool as KleeTool
+
+
+def synthetic_log(num):
+    rnd = Random(0)
+    common = [
+        b'KLEE: WARNING ONCE: calling external: printf(94371840)\n',
+        b'KLEE: WARNING: undefined reference to function: __VERIFIER_nondet_int\n',
+        b'KLEE: output directory is "/tmp/sym/klee-out-0"\n',
+        b'KLEE: Using STP solver backend\n',
+        b'KLEE: done: total instructions = 123456789\n',
+    ]
+    rare = [
+        b'KLEE: ERROR: main.c:12: ASSERTION FAIL: 0\n',
+        b'KLEE: WARNING: silently concretizing (reason: floating point)\n',
+        b'KLEE: ERROR: unable to load symbol(foo) while initializing globals.\n',
+        b'KLEE: NOTE: found huge malloc, returning 0\n',
+    ]
+    lines = []
+    for n in range(num):
+        if n % 10000 == 0:
+            lines.append(rare[rnd.randrange(len(rare))])
+        else:
+            lines.append(common[rnd.randrange(len(common))])
+    return lines
+
+
+def old_parse(patterns, line):
+    for (key, pattern) in patterns:
+        if pattern.match(line):
+            return key
+    return None
+
+
+def main():
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    lines = synthetic_log(num)
+
+    opts = SymbioticOptions()
+    tool = KleeTool(opts)
+    # the regular expressions as they were compiled before
+    patterns = [(key, re.compile(pattern)) for key, pattern in
+                zip(tool._matcher._keys,
+                    (p.pattern for p in tool._matcher._str.patterns))]
+
+    start = time()
+    old = [k for k in (old_parse(patterns, str(l)) for l in lines) if k]
+    old_time = time() - start
+
+    start = time()
+    new = tool._matcher.findall(lines)
+    new_time = time() - start
+
+    print('lines: {0}, matched: {1} (old: {2})'.format(num, len(new), len(old)))
+    print('old: {0:.2f} s, new: {1:.2f} s, speedup: {2:.1f}x'.format(
+          old_time, new_time, old_time / new_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,27 @@
 #!/usr/bin/python3
+import os
+import re
+import selectors
+import sys
+from hashlib import sha256
+from heapq import heappush, heappop
+from math import ceil
+from os.path import join, dirname, abspath
+from shutil import move, rmtree
+from struct import pack
 from subprocess import Popen, PIPE, STDOUT
-from time import sleep
 from sys import stderr
+from tempfile import mkdtemp
+from time import monotonic
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'lib', 'symbioticpy'))
+
+from symbiotic.exceptions import SymbioticException
+from symbiotic.utils.ktest import KTest
+from symbiotic.utils.utils import available_memory
+
+# symbiotic may convert the tests into the test-suite by itself
+write_testcases = True
 
 def runcmd(cmd):
     print("[kleetester] {0}".format(" ".join(cmd)), file=stderr)
@@ -15,19 +35,32 @@ def runcmd(cmd):
 
     return p
 
-def gentest(bitcode, outdir, prp, suffix=None, params=None):
+# how often (in seconds) the main KLEE writes its coverage in coverage mode
+COVERAGE_INTERVAL = 10
+
+# the time (in seconds) for a generator in coverage mode if there is no budget
+GENERATOR_TIME = 840
+
+def gentest(bitcode, outdir, prp, suffix=None, params=None, istats=60,
+            max_time=None):
     options = ['-use-forked-solver=0', '--use-call-paths=0',
-               '--output-stats=0', '-istats-write-interval=60s',
+               '--output-stats=0', f'-istats-write-interval={istats}s',
                '-timer-interval=10', '-external-calls=pure',
-               '-write-testcases', '-malloc-symbolic-contents',
+               '-malloc-symbolic-contents',
                '-max-memory=8000', '-output-source=false']
+    if write_testcases:
+        options.append('-write-testcases')
     if prp != 'coverage':
         options.append(f'-error-fn={prp}')
         options.append('-exit-on-error-type=Assert')
         options.append('-dump-states-on-halt=0')
     else:
         options.append('-only-output-states-covering-new=1')
-        options.append('-max-time=840')
+        if max_time is None:
+            max_time = GENERATOR_TIME
+    if max_time is not None:
+        # KLEE takes -max-time=0 as no limit
+        options.append(f'-max-time={max(1, max_time)}')
 
     if params:
         options.extend(params)
@@ -40,184 +73,871 @@ def gentest(bitcode, outdir, prp, suffix=None, params=None):
 
     return runcmd(cmd)
 
-def find_criterions(bitcode):
+# the line that KLEE prints when it finds an error
+ERROR_MARKER = b'ASSERTION FAIL: '
+# how long (in seconds) we wait for the generator that found an error
+# to write the test and exit
+ERROR_WAIT = 60
+# estimate of the memory (in MB) taken by one generator
+GENERATOR_MEMORY = 1000
+
+def generators_limit():
+    """
+    How many generators can run at once. KLEE spends a lot of time
+    in the solver, so we run two generators per core if there is memory
+    for them, but always at least the main and one side generator.
+    """
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    limit = 2 * cores
+    memory = available_memory()
+    if memory is not None:
+        limit = min(limit, memory // GENERATOR_MEMORY)
+    return max(2, limit)
+
+def _pidfd(process):
+    try:
+        return os.pidfd_open(process.pid)
+    except (AttributeError, OSError):
+        # old python or kernel, we get the exit from the end of the output
+        return None
+
+class Child(object):
+    """ A process whose output and exit we wait for in the Scheduler """
+
+    def __init__(self, process, generator, collect, callback=None,
+                 on_line=None):
+        self.process = process
+        self.generator = generator
+        # called when the process finished
+        self.callback = callback
+        # called with every line of the output as soon as we read it
+        self.on_line = on_line
+        # the incomplete last line of the output
+        self.line = b''
+        # the output of the process if we want to keep it
+        self.output = bytearray() if collect else None
+        # the end of the last chunk of the output (the marker can be split)
+        self.tail = b''
+        self.pidfd = _pidfd(process)
+        self.eof = False
+        self.exited = False
+
+    def done(self):
+        return self.eof and self.exited
+
+class Scheduler(object):
+    """
+    Runs the test generators (and the helper processes like the slicer).
+    All processes are waited for in one event loop: the outputs are drained
+    with non-blocking reads as soon as there is some (so the pipes never
+    fill and block KLEE) and the exits of processes are events too
+    (pidfd), so we react to errors and finished generators immediately.
+    At most 'limit' processes (generators and helpers) should run at once.
+    """
+
+    def __init__(self, prp, limit=None):
+        self.prp = prp
+        self.limit = limit or generators_limit()
+        # called before exiting when an error is found
+        self.on_error = None
+        # the generator that found an error
+        self._error = None
+        self._selector = selectors.DefaultSelector()
+        self._children = {}
+
+    def add(self, process, generator=True, collect=False, callback=None,
+            on_line=None):
+        child = Child(process, generator, collect, callback, on_line)
+        fd = process.stdout.fileno()
+        os.set_blocking(fd, False)
+        self._selector.register(fd, selectors.EVENT_READ, (child, 'output'))
+        if child.pidfd is not None:
+            self._selector.register(child.pidfd, selectors.EVENT_READ,
+                                    (child, 'exit'))
+        self._children[process] = child
+        return child
+
+    def generators(self):
+        return [c.process for c in self._children.values() if c.generator]
+
+    def running(self):
+        return len(self.generators())
+
+    def has_slot(self):
+        """ Can we start another process? """
+        return len(self._children) < self.limit
+
+    def poll(self, timeout=None):
+        """ Handle the events that come in 'timeout' seconds """
+        if not self._children:
+            return
+        for key, _ in self._selector.select(timeout):
+            child, what = key.data
+            if what == 'output':
+                self._read(child)
+            else:
+                self._exited(child)
+
+    def run(self, cmd):
+        """
+        Run a helper process, handle the events of generators meanwhile.
+        Returns the pair (return code, output) or (None, None)
+        if the process cannot be started.
+        """
+        process = runcmd(cmd)
+        if process is None:
+            return None, None
+        child = self.add(process, generator=False, collect=True)
+        while not child.done():
+            self.poll()
+        return process.returncode, bytes(child.output)
+
+    def start(self, cmd, callback, on_line=None):
+        """
+        Start a helper process in the background, 'callback' gets
+        the return code and the output of the process once it finishes,
+        'on_line' (if given) gets the lines of the output as they come.
+        Returns False if the process cannot be started.
+        """
+        process = runcmd(cmd)
+        if process is None:
+            return False
+        self.add(process, generator=False, collect=True,
+                 callback=lambda child: callback(child.process.returncode,
+                                                 bytes(child.output)),
+                 on_line=on_line)
+        return True
+
+    def wait_all(self):
+        while self._children:
+            self.poll()
+
+    def kill_all(self):
+        for child in list(self._children.values()):
+            if child.process.poll() is None:
+                child.process.kill()
+            child.process.wait()
+            self._close(child)
+
+    def kill_helpers(self):
+        for child in list(self._children.values()):
+            if not child.generator and child.process.poll() is None:
+                child.process.kill()
+
+    def _read(self, child):
+        fd = child.process.stdout.fileno()
+        while True:
+            try:
+                data = os.read(fd, 1 << 16)
+            except BlockingIOError:
+                return
+            if not data:
+                self._selector.unregister(fd)
+                child.eof = True
+                if child.on_line and child.line:
+                    child.on_line(child.line)
+                if child.pidfd is None:
+                    # the process closed the output, it is going to exit
+                    child.process.wait()
+                    child.exited = True
+                self._check_done(child)
+                return
+
+            if child.output is not None:
+                child.output += data
+            if child.on_line:
+                lines = (child.line + data).split(b'\n')
+                child.line = lines.pop()
+                for line in lines:
+                    child.on_line(line)
+            if child.generator and self.prp != 'coverage' and\
+               self._error is None:
+                if ERROR_MARKER in child.tail + data:
+                    self._error_found(child)
+                child.tail = data[-len(ERROR_MARKER):]
+
+    def _exited(self, child):
+        self._selector.unregister(child.pidfd)
+        os.close(child.pidfd)
+        child.pidfd = None
+        child.process.wait()
+        child.exited = True
+        if not child.eof:
+            # get the rest of the output
+            self._read(child)
+        self._check_done(child)
+
+    def _check_done(self, child):
+        if not child.done():
+            return
+        self._close(child)
+        if child.callback:
+            child.callback(child)
+
+    def _close(self, child):
+        """ Stop watching the child and close its descriptors """
+        registered = self._selector.get_map()
+        for fd in (child.process.stdout.fileno(), child.pidfd):
+            if fd is not None and fd in registered:
+                self._selector.unregister(fd)
+        if child.pidfd is not None:
+            os.close(child.pidfd)
+            child.pidfd = None
+        child.process.stdout.close()
+        del self._children[child.process]
+
+    def _error_found(self, child):
+        """
+        KLEE prints the error before it writes the test, so kill
+        the other processes, but wait until the generator that found
+        the error exits by itself (-exit-on-error-type=Assert)
+        """
+        print('Found ERROR!', file=stderr)
+        stderr.flush()
+        self._error = child
+        for other in list(self._children.values()):
+            if other is not child and other.process.poll() is None:
+                other.process.kill()
+
+        deadline = monotonic() + ERROR_WAIT
+        while not child.done() and monotonic() < deadline:
+            self.poll(deadline - monotonic())
+
+        self.kill_all()
+        if self.on_error:
+            self.on_error()
+        exit(0)
+
+
+def ktest_inputs_hash(path):
+    """
+    Get the hash of the objects (the inputs) in the .ktest file,
+    or None if the file is not complete (or not a ktest file)
+    """
+    hsh = sha256()
+    try:
+        with KTest(path) as ktest:
+            for obj in ktest:
+                name = obj.name
+                hsh.update(pack('>i', len(name)))
+                hsh.update(name)
+                hsh.update(pack('>i', obj.size))
+                hsh.update(obj.data)
+    except (OSError, SymbioticException):
+        return None
+    return hsh.digest()
+
+class Merger(object):
+    """
+    Every side generator writes into its own directory (in a temporary
+    directory), the merger moves the tests from there into the output
+    directory where the main KLEE writes its tests. Tests with the same
+    inputs as a test that is already in the output directory are removed
+    (unless they cover an error). The tests of a running generator
+    are moved once it starts writing the next test (KLEE writes the tests
+    one by one), the rest when the generator finishes.
+    """
+
+    def __init__(self, outdir, interval=1):
+        self.outdir = outdir
+        self.interval = interval
+        self.workdir = mkdtemp(prefix='kleetester-', dir='.')
+        # the directories of running generators
+        self._running = set()
+        self._hashes = set()
+        # the .ktest files in the output directory that we know about
+        self._known = set()
+        self._merged = monotonic()
+        self.moved = 0
+        self.duplicate = 0
+
+    def directory(self, n):
+        """ The output directory for a new generator """
+        directory = join(self.workdir, str(n))
+        self._running.add(directory)
+        return directory
+
+    def finished(self, directory):
+        self._running.discard(directory)
+        self._scan_outdir()
+        self._merge_dir(directory, everything=True)
+        rmtree(directory, ignore_errors=True)
+
+    def merge(self):
+        """ Move the finished tests of running generators (from time to time) """
+        if monotonic() - self._merged < self.interval:
+            return
+        self._merged = monotonic()
+        self._scan_outdir()
+        for directory in self._running:
+            self._merge_dir(directory)
+
+    def close(self):
+        """ Move the rest of tests and remove the temporary files """
+        self._scan_outdir()
+        for directory in self._running:
+            self._merge_dir(directory, everything=True)
+        self._running = set()
+        rmtree(self.workdir, ignore_errors=True)
+        print(f"Merged {self.moved} tests from side generators, "
+              f"removed {self.duplicate} duplicate tests", file=stderr)
+
+    def _scan_outdir(self):
+        for name in os.listdir(self.outdir):
+            if name.endswith('.ktest') and name not in self._known:
+                hsh = ktest_inputs_hash(join(self.outdir, name))
+                # the test may be being written, try it the next time
+                if hsh is not None:
+                    self._known.add(name)
+                    self._hashes.add(hsh)
+
+    def _merge_dir(self, directory, everything=False):
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            # the generator did not start yet
+            return
+
+        tests = {}
+        for name in names:
+            if name.startswith('test'):
+                tests.setdefault(name.split('.', 1)[0], []).append(name)
+        stems = sorted(stem for stem, files in tests.items()
+                       if any(f.endswith('.ktest') for f in files))
+        if not everything:
+            # the last test may not be complete yet
+            stems = stems[:-1]
+        for stem in stems:
+            self._merge_test(directory, tests[stem])
+
+    def _merge_test(self, directory, files):
+        ktest = next(f for f in files if f.endswith('.ktest'))
+        hsh = ktest_inputs_hash(join(directory, ktest))
+        if hsh is None:
+            # broken test of a killed generator
+            return
+        covers_error = any(f.endswith('.err') for f in files)
+        if hsh in self._hashes and not covers_error:
+            for f in files:
+                os.unlink(join(directory, f))
+            self.duplicate += 1
+            return
+
+        self._hashes.add(hsh)
+        self._known.add(ktest)
+        # the .ktest file goes last, the tests are exported
+        # once the .ktest file appears
+        files.sort(key=lambda f: f.endswith('.ktest'))
+        for f in files:
+            move(join(directory, f), join(self.outdir, f))
+        self.moved += 1
+
+def find_criterions(sched, bitcode):
     newbitcode = f"{bitcode}.tpr.bc"
     # FIXME: generate it directly from slicer (multiple slices)
-    # FIXME: modify the code also such that any path that avoids the criterion
-    # is aborted
     cmd = ['opt', '-load', 'LLVMsbt.so', '-get-test-targets',
            '-o', newbitcode, bitcode]
-    p = runcmd(cmd)
-    if p is None:
+    ret, out = sched.run(cmd)
+    if ret is None:
         return None, None
-    out, errs = p.communicate()
-    if p.poll() != 0:
-        print(errs)
+    if ret != 0:
         print(out)
         return None, None
     if out and out != '':
         return newbitcode, (crit.decode('utf-8', 'ignore') for crit in out.splitlines())
     return None, None
 
-def constrain_to_target(bitcode, target):
-    newbitcode = f"{bitcode}.opt.bc"
+def constrain_to_target(bitcode, target, n):
+    newbitcode = f"{bitcode}.{n}.opt.bc"
     cmd = ['opt', '-load', 'LLVMsbt.so', '-constraint-to-target',
            f'-ctt-target={target}', '-O3', '-o', newbitcode, bitcode]
-    p = runcmd(cmd)
-    if p is None:
-        return None
-    ret = p.wait()
-    if ret != 0:
-        out, errs = p.communicate()
-        print(out, file=stderr)
-        print(errs, file=stderr)
-        return None
-    return newbitcode
+    return cmd, newbitcode
 
-def sliceprocess(bitcode, crit):
-    bitcode = constrain_to_target(bitcode, crit)
-    if bitcode is None:
-        return None, None
-        
+def constrain_to_targets(bitcode):
+    """
+    Constrain the program to every target in one run, the targets
+    are processed from the last one and the lines "<target> <bitcode>"
+    are printed as the modules are created
+    """
+    prefix = f"{bitcode}."
+    cmd = ['opt', '-load', 'LLVMsbt.so', '-constraint-to-targets',
+           f'-ctt-output={prefix}', '-disable-output', bitcode]
+    return cmd
+
+def sliceprocess(bitcode, crit, timeout=120):
     slbitcode = f"{bitcode}-{crit}.bc"
-    cmd = ['timeout', '120', 'llvm-slicer', '-c', crit,
+    cmd = ['timeout', str(timeout), 'llvm-slicer', '-c', crit,
            '-o', slbitcode, bitcode]
-    return runcmd(cmd), slbitcode
+    return cmd, slbitcode
 
 def optimize(bitcode):
     newbitcode = f"{bitcode}.opt.bc"
     cmd = ['opt', '-load', 'LLVMsbt.so', '-O3', '-remove-infinite-loops',
            '-O2', '-o', newbitcode, bitcode]
-    p = runcmd(cmd)
-    ret = p.wait()
-    return newbitcode
+    return cmd, newbitcode
+
+def disassemble(bitcode):
+    llfile = f"{bitcode}.ll"
+    cmd = ['llvm-dis', '-o', llfile, bitcode]
+    return cmd, llfile
+
+_define = re.compile(r'^define .*@"?([^"(]+)"?\(')
+_target_call = re.compile(r'call void @(__SYMBIOTIC_test_target\d+)\(\).*!dbg !(\d+)')
+_location = re.compile(r'^!(\d+) = (?:distinct )?!DILocation\(line: (\d+)')
+
+def target_locations(llfile):
+    """
+    Get the mapping target -> (function, line) from the disassembled
+    bitcode with the targets (targets without debug info are left out)
+    """
+    calls, lines = {}, {}
+    fun = None
+    with open(llfile, 'r', errors='ignore') as f:
+        for line in f:
+            m = _define.match(line)
+            if m:
+                fun = m.group(1)
+                continue
+            m = _target_call.search(line)
+            if m:
+                calls[m.group(1)] = (fun, m.group(2))
+                continue
+            m = _location.match(line)
+            if m:
+                lines[m.group(1)] = int(m.group(2))
+    return {target : (fun, lines[dbg]) for target, (fun, dbg) in calls.items()
+            if lines.get(dbg)}
+
+class Coverage(object):
+    """
+    Targets covered by the main KLEE. KLEE writes the coverage
+    of instructions (with their lines) into run.istats periodically,
+    a target is covered if some instruction on its line (in its function)
+    is covered.
+    """
+
+    def __init__(self, outdir, interval=COVERAGE_INTERVAL):
+        self.istats = os.path.join(outdir, 'run.istats')
+        self.interval = interval
+        # function -> line -> targets
+        self._targets = {}
+        self.covered = set()
+        self._mtime = None
+        self._checked = monotonic()
+
+    def set_targets(self, locations):
+        for target, (fun, line) in locations.items():
+            self._targets.setdefault(fun, {}).setdefault(line, []).append(target)
+
+    def update(self):
+        """
+        Re-read the coverage if it is time to and it changed.
+        Returns the set of newly covered targets.
+        """
+        if not self._targets or monotonic() - self._checked < self.interval:
+            return set()
+        self._checked = monotonic()
+        try:
+            mtime = os.stat(self.istats).st_mtime_ns
+        except OSError:
+            return set()
+        if mtime == self._mtime:
+            return set()
+        self._mtime = mtime
+
+        try:
+            covered = self._read()
+        except OSError:
+            return set()
+        covered -= self.covered
+        self.covered |= covered
+        return covered
 
-def check_error(outs, errs):
-    for line in outs.splitlines():
-        if b'ASSERTION FAIL: ' in line:
-            print('Found ERROR!', file=stderr)
-            return True
-    return False
+    def _read(self):
+        covered = set()
+        icov = None
+        lines = None
+        skip = False
+        with open(self.istats, 'r', errors='ignore') as f:
+            for line in f:
+                if line[0].isdigit():
+                    if skip:
+                        # the cost of a call
+                        skip = False
+                        continue
+                    if lines is None or icov is None:
+                        continue
+                    parts = line.split()
+                    # the file may be just being written, check the length
+                    if len(parts) > icov + 2 and parts[icov + 2] != '0':
+                        targets = lines.get(int(parts[1]))
+                        if targets:
+                            covered.update(targets)
+                elif line.startswith('fn='):
+                    lines = self._targets.get(line[3:].strip())
+                elif line.startswith('calls='):
+                    skip = True
+                elif line.startswith('events:'):
+                    events = line.split()[1:]
+                    if 'Icov' in events:
+                        icov = events.index('Icov')
+        return covered
+
+# the time (in seconds) kept for KLEE to write the tests after it is stopped
+BUDGET_RESERVE = 5
+# do not start generators (and slicing) that would have less time than this
+MIN_GENERATOR_TIME = 10
+
+class Budget(object):
+    """
+    Splits the time that remains till the deadline among the targets.
+    The generators for targets run in 'slots' slots at once, so every
+    generator gets the remaining time divided by the number of rounds
+    that the targets that are left need. The time is computed when
+    a generator starts, so the time that generators finishing early
+    did not use goes to the later targets.
+    Without a deadline (seconds is None), the budget is unlimited.
+    """
+
+    def __init__(self, seconds, slots):
+        self.deadline = None
+        if seconds is not None:
+            self.deadline = monotonic() + seconds - BUDGET_RESERVE
+        self.slots = max(1, slots)
+
+    def remaining(self):
+        """ The remaining time in seconds (or None if there is no deadline) """
+        if self.deadline is None:
+            return None
+        return max(0, int(self.deadline - monotonic()))
+
+    def exhausted(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining < MIN_GENERATOR_TIME
+
+    def generator_time(self, targets):
+        """
+        The time for a generator for one of 'targets' targets
+        that are left (or None if there is no deadline)
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return None
+        return remaining // ceil(max(1, targets) / self.slots)
+
+    def slicer_timeout(self, timeout=120):
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        # leave some time for the generator
+        return max(1, min(timeout, remaining - MIN_GENERATOR_TIME))
+
+class Targets(object):
+    """
+    Prepares the bitcode for the targets (constraining to the target,
+    slicing and optimizing) in a pipeline that runs concurrently
+    with the generators, and starts the generators for the prepared
+    targets -- the deepest targets first. The program is constrained
+    to all targets in one run of opt and the targets are sliced as their
+    modules come out of it (if that fails, the program is constrained
+    to the targets one by one). All the processes share the slots
+    of the scheduler and the time budget. In coverage mode, the targets
+    covered by the main KLEE are dropped (and their generators killed),
+    so that the budget goes to the targets that are not covered yet.
+    """
+
+    def __init__(self, sched, bitcode, crits, merger, prp, coverage=None,
+                 budget=None):
+        self.sched = sched
+        self.budget = budget or Budget(None, sched.limit)
+        self.bitcode = bitcode
+        self.merger = merger
+        self.prp = prp
+        self.coverage = coverage
+        # target -> its running generator
+        self.generators = {}
+        # (depth, number, target), the later targets are likely deeper
+        # in the code, start with those
+        self.pending = [(depth, n, crit) for n, (depth, crit) in
+                        enumerate(reversed(list(enumerate(crits))))]
+        self.pending.reverse()
+        # target -> (depth, number) of targets that the batch works on
+        self.batched = {}
+        self.batching = False
+        # constrain to all targets at once
+        self.batch = True
+        # heap of (-depth, number, target, bitcode) of constrained targets
+        self.constrained = []
+        # heap of (-depth, number, target, bitcode) of targets ready
+        # for generating tests
+        self.ready = []
+        # targets in the pipeline
+        self.preparing = 0
+        self.stopped = False
+
+        if coverage:
+            cmd, llfile = disassemble(bitcode)
+            def done(ret, out):
+                if ret != 0:
+                    print(out, file=stderr)
+                    print("Failed getting locations of targets", file=stderr)
+                    return
+                coverage.set_targets(target_locations(llfile))
+            sched.start(cmd, done)
+
+    def busy(self):
+        return self.preparing > 0 or self.ready or\
+               (not self.stopped and (self.batching or self.pending or
+                                      self.constrained))
+
+    def stop(self):
+        self.stopped = True
+        self.sched.kill_helpers()
+
+    def covered(self, crit):
+        return self.coverage is not None and crit in self.coverage.covered
+
+    def update_coverage(self):
+        """ Kill the generators for the targets that got covered """
+        if self.coverage is None:
+            return
+        for crit in self.coverage.update():
+            print(f"Target {crit} is covered", file=stderr)
+            p = self.generators.pop(crit, None)
+            if p is not None and p.poll() is None:
+                print(f"Killing the generator for {crit}", file=stderr)
+                p.kill()
+
+    def left(self):
+        """ The number of targets for which no generator started yet """
+        n = len(self.ready) + self.preparing
+        if not self.stopped:
+            n += len(self.constrained)
+            n += sum(1 for _, _, crit in self.pending if not self.covered(crit))
+            n += sum(1 for crit in self.batched if not self.covered(crit))
+        return n
+
+    def schedule(self):
+        """ Start what we can in the budget, the generators first """
+        if self.budget.exhausted():
+            if self.busy():
+                print("The time budget is exhausted", file=stderr)
+            self.stop()
+            self.ready = []
+            return
+
+        params = ['--search=dfs', '--use-batching-search']
+        if self.coverage:
+            # we follow only the coverage of the main KLEE
+            params.append('--output-istats=0')
+        while self.ready and self.sched.has_slot():
+            _, n, crit, bitcode = heappop(self.ready)
+            if self.covered(crit):
+                continue
+            max_time = self.budget.generator_time(self.left() + 1)
+            outdir = self.merger.directory(n)
+            p = gentest(bitcode, outdir, self.prp, suffix=str(n),
+                        params=params, max_time=max_time)
+            if p is None:
+                self.merger.finished(outdir)
+                continue
+            def done(_, crit=crit, outdir=outdir):
+                self.generators.pop(crit, None)
+                self.merger.finished(outdir)
+            self.sched.add(p, callback=done)
+            self.generators[crit] = p
+
+        while self.constrained and not self.stopped and self.sched.has_slot():
+            depth, n, crit, bitcode = heappop(self.constrained)
+            if self.covered(crit):
+                continue
+            self._slice(-depth, n, crit, bitcode)
+
+        if self.batch:
+            if self.pending and not self.stopped and self.sched.has_slot():
+                self._constrain_all()
+            return
+
+        while self.pending and not self.stopped and self.sched.has_slot():
+            depth, n, crit = self.pending.pop()
+            if self.covered(crit):
+                continue
+            print(f"\n--- Targeting at {crit} target --- ", file=stderr)
+            self._constrain(depth, n, crit)
+
+    def _run(self, crit, cmd, callback):
+        self.preparing += 1
+        def done(ret, out):
+            self.preparing -= 1
+            if not self.stopped and not self.covered(crit):
+                callback(ret, out)
+        if not self.sched.start(cmd, done):
+            self.preparing -= 1
+            return False
+        return True
+
+    def _constrain(self, depth, n, crit):
+        cmd, bitcode = constrain_to_target(self.bitcode, crit, n)
+        def done(ret, out):
+            if ret != 0:
+                print(out, file=stderr)
+                print(f'Slicing w.r.t {crit} FAILED', file=stderr)
+                return
+            self._slice(depth, n, crit, bitcode)
+        if not self._run(crit, cmd, done):
+            print(f'Slicing w.r.t {crit} FAILED', file=stderr)
+
+    def _constrain_all(self):
+        self.batched = {crit : (depth, n) for depth, n, crit in self.pending}
+        self.pending = []
+        self.batching = True
+
+        def on_line(line):
+            parts = line.decode('utf-8', 'ignore').split()
+            if len(parts) != 2 or parts[0] not in self.batched:
+                return
+            crit, bitcode = parts
+            depth, n = self.batched.pop(crit)
+            if self.stopped or self.covered(crit):
+                return
+            print(f"\n--- Targeting at {crit} target --- ", file=stderr)
+            heappush(self.constrained, (-depth, n, crit, bitcode))
+
+        def done(ret, out):
+            self.batching = False
+            if self.stopped:
+                return
+            if ret != 0:
+                print(out, file=stderr)
+                print('Constraining to all targets FAILED, '
+                      'constraining to targets one by one', file=stderr)
+                self.batch = False
+            for crit, (depth, n) in self.batched.items():
+                if ret == 0:
+                    print(f'Slicing w.r.t {crit} FAILED', file=stderr)
+                else:
+                    self.pending.append((depth, n, crit))
+            self.pending.sort()
+            self.batched = {}
+
+        if not self.sched.start(constrain_to_targets(self.bitcode), done,
+                                on_line):
+            self.batching = False
+            self.batch = False
+            self.pending = sorted((depth, n, crit) for crit, (depth, n)
+                                  in self.batched.items())
+            self.batched = {}
+
+    def _slice(self, depth, n, crit, bitcode):
+        cmd, slbitcode = sliceprocess(bitcode, crit,
+                                      self.budget.slicer_timeout())
+        def done(ret, out):
+            if ret != 0:
+                print(f'Slicing w.r.t {crit} FAILED', file=stderr)
+                if ret == 124:
+                    # one timeouted, others will too...
+                    self.stopped = True
+                    return
+                print(out, file=stderr)
+                return
+            print(f'Slicing w.r.t {crit} done', file=stderr)
+            self._optimize(depth, n, crit, slbitcode)
+        print(f'Starget slicing w.r.t {crit}', file=stderr)
+        if not self._run(crit, cmd, done):
+            print(f'Slicing w.r.t {crit} FAILED', file=stderr)
+
+    def _optimize(self, depth, n, crit, bitcode):
+        cmd, optbitcode = optimize(bitcode)
+        def done(ret, out):
+            if ret != 0:
+                print("Optimizing failed", file=stderr)
+                return
+            heappush(self.ready, (-depth, n, crit, optbitcode))
+        if not self._run(crit, cmd, done):
+            print("Optimizing failed", file=stderr)
 
 def main(argv):
+    global write_testcases
+    # the time (in seconds) that we have
+    seconds = None
+    args = argv[:1]
+    for arg in argv[1:]:
+        if arg == '--no-write-testcases':
+            write_testcases = False
+        elif arg.startswith('--time-budget='):
+            seconds = int(arg.split('=', 1)[1])
+        else:
+            args.append(arg)
+    argv = args
     if len(argv) != 4:
         exit(1)
     prp = argv[1]
     outdir = argv[2]
     bitcode = argv[3]
 
-    generators = []
+    sched = Scheduler(prp)
+    print(f"Running at most {sched.limit} processes at once", file=stderr)
+    # the main KLEE takes one slot for the whole time
+    budget = Budget(seconds, sched.limit - 1)
+    if seconds is not None:
+        print(f"Have {budget.remaining()} seconds", file=stderr)
+
+    # in coverage mode, we follow what the main KLEE covers
+    coverage = Coverage(outdir) if prp == 'coverage' else None
 
     # run KLEE on the original bitcode
     print("\n--- Running the main KLEE --- ", file=stderr)
-    maingen = gentest(bitcode, outdir, prp)
+    maingen = gentest(bitcode, outdir, prp,
+                      istats=COVERAGE_INTERVAL if coverage else 60,
+                      max_time=budget.remaining())
     if maingen:
-        generators.append(maingen)
+        sched.add(maingen)
 
-    bitcodewithcrits, crits = find_criterions(bitcode)
-    if bitcodewithcrits:
-        # The later crits are likely deeper in the code.
-        # Since run use only part of them, use those.
-        crits = list(crits)
-        crits.reverse()
-        for n, crit in enumerate(crits):
-            print(f"\n--- Targeting at {crit} target --- ", file=stderr)
-            if prp == 'coverage' and maingen and maingen.poll() is not None:
-                break # the main process finished, we can finish too
+    def main_finished():
+        # the main process finished, we can finish too
+        return prp == 'coverage' and maingen and maingen.poll() is not None
 
-            # slice bitcode
-            p, slicedcode = sliceprocess(bitcodewithcrits, crit)
-            if p is None:
-                print(f'Slicing w.r.t {crit} FAILED', file=stderr)
-                continue
-            print(f'Starget slicing w.r.t {crit}, waiting for the job...', file=stderr)
-            ret = p.wait()
-            if ret != 0:
-                out, errs = p.communicate()
-                print(f'Slicing w.r.t {crit} FAILED', file=stderr)
-                if ret == 124:
-                    break # one timeouted, others will too...
-                print(out, file=stderr)
-                print(errs, file=stderr)
-                continue
-            print(f'Slicing w.r.t {crit} done', file=stderr)
+    # wake up to check the coverage even if nothing else happens
+    timeout = coverage.interval if coverage else None
 
-            slicedcode = optimize(slicedcode)
-            if slicedcode is None:
-                print("Optimizing failed", file=stderr)
-                continue
+    # the side generators write into their own directories
+    merger = Merger(outdir)
+    sched.on_error = merger.close
 
-            # generate tests
-            if prp == 'coverage' and maingen and maingen.poll() is not None:
-                break # the main process finished, we can finish too
-            p = gentest(slicedcode, outdir, prp, suffix=str(n),
-                        params=['--search=dfs', '--use-batching-search'])
-            if p is None:
-                continue
-            generators.append(p)
-
-            newgens = []
-            for p in generators:
-                if p.poll() is not None:
-                    if prp != 'coverage':
-                        if check_error(*p.communicate()):
-                            for gen in generators:
-                                if gen.poll() is not None:
-                                    gen.kill()
-                            exit(0)
-                else:
-                    newgens.append(p)
-            generators = newgens
-
-            # run atmost 8 at once
-            while len(generators) >= 8:
-                if prp == 'coverage' and maingen and maingen.poll() is not None:
-                    break # the main process finished, we can finish too
-
-                print("Got enough test generators, waiting for some to finish...",
-                      file=stderr)
-                sleep(2) # sleep 2 seconds
-                for p in generators:
-                    if p.poll() is not None:
-                        if prp != 'coverage':
-                            if check_error(*p.communicate()):
-                                for gen in generators:
-                                    if gen.poll() is not None:
-                                        gen.kill()
-                                exit(0)
-                    else:
-                        newgens.append(p)
-                # some processes finished
-                generators = newgens
+    targets = None
+    bitcodewithcrits, crits = find_criterions(sched, bitcode)
+    if bitcodewithcrits:
+        targets = Targets(sched, bitcodewithcrits, list(crits), merger, prp,
+                          coverage, budget)
+        while targets.busy():
+            if main_finished():
+                targets.stop()
+                break
+            targets.schedule()
+            sched.poll(timeout or merger.interval)
+            targets.update_coverage()
+            merger.merge()
 
     print(f"\n--- All targets running --- ", file=stderr)
     stderr.flush()
 
-    while generators:
-        print(f"Have {len(generators)} test generators running", file=stderr)
-        stderr.flush()
-        newgens = []
-        for p in generators:
-            if p.poll() is not None:
-                if prp != 'coverage':
-                    if check_error(*p.communicate()):
-                        for gen in generators:
-                            if gen.poll() is not None:
-                                gen.kill()
-                        exit(0)
-            else:
-                newgens.append(p)
-        generators = newgens
-        if generators:
-            sleep(2) # sleep 2 seconds
+    running = None
+    while sched.running():
+        if running != sched.running():
+            running = sched.running()
+            print(f"Have {running} test generators running", file=stderr)
+            stderr.flush()
+        sched.poll(timeout or merger.interval)
+        if targets:
+            targets.update_coverage()
+        merger.merge()
 
     print(f"\n--- All KLEE finished --- ", file=stderr)
 
-    if prp == 'coverage':
-        # if all finished, then also the main KLEE finished,
-        # and we can remove the files from side KLEE's -- those
-        # are superfluous
-        runcmd(['rm', '-f', f"{outdir}/test*.*.xml"])
+    merger.close()
 
 if __name__ == "__main__":
     from sys import argv
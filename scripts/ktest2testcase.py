@@ -0,0 +1,28 @@
+#!/usr/bin/python3
+"""
+Convert the .ktest files generated by KLEE into Test-Comp testcase XML files.
+Usage: ktest2testcase.py [-j JOBS] klee-out-dir output-dir
+"""
+
+import sys
+from os.path import dirname, abspath, join
+from argparse import ArgumentParser
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'lib', 'symbioticpy'))
+
+from symbiotic.testsuits.testcases import convert_ktests
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='number of processes (default: the number of CPUs)')
+    parser.add_argument('directory', help='directory with .ktest files')
+    parser.add_argument('outdir', help='directory for the testcase XML files')
+    args = parser.parse_args()
+
+    convert_ktests(args.directory, args.outdir, args.jobs)
+
+
+if __name__ == '__main__':
+    main()
@@ -35,6 +35,12 @@ for LLVM in $PREFIX/llvm-*; do
 	LLVM_VERSION=${LLVM#*llvm-*}
 	INCLUDE_DIR="$LLVM/lib/clang/${LLVM_VERSION}/include/"
 	CPPFLAGS="-I ${INCLUDE_DIR} -Iinclude/ $ORIG_CPPFLAGS"
+	# index of the precompiled models (one 'path: undefined symbols' per line,
+	# the path is relative to lib/ or lib32/), symbiotic uses it to find models
+	# of undefined functions and the models that these models need
+	mkdir -p "$LLVM/lib" "$LLVM/lib32"
+	: > "$LLVM/lib/models.index"
+	: > "$LLVM/lib32/models.index"
 	for F in `find $LIBS -name '*.c'`; do
 		NAME=`basename $F`
 		OUT="${F#*/}" # strip the lib/ prefix
@@ -47,7 +53,11 @@ for LLVM in $PREFIX/llvm-*; do
 		mkdir -p "$(dirname $LLVM/lib32/$OUT)"
 		$CLANG $CPPFLAGS -O3 -emit-llvm -c $F -m32 -o $LLVM/lib32/$OUT $CPPFLAGS $CFLAGS $LDFLAGS
 		FILES="$FILES ${LLVM#install/}/lib32/$OUT"
+
+		echo "$OUT:" $($LLVM/bin/llvm-nm -undefined-only -just-symbol-name $LLVM/lib/$OUT) >> "$LLVM/lib/models.index"
+		echo "$OUT:" $($LLVM/bin/llvm-nm -undefined-only -just-symbol-name $LLVM/lib32/$OUT) >> "$LLVM/lib32/models.index"
 	done
+	FILES="$FILES ${LLVM#install/}/lib/models.index ${LLVM#install/}/lib32/models.index"
 done
 
 
@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+"""
+Streaming of the output of processes: the output is read in chunks
+that must be split into the same lines as reading the pipe line by line.
+"""
+
+import signal
+import sys
+import unittest
+from os.path import dirname, abspath, join
+from subprocess import Popen, PIPE
+from time import monotonic
+
+sys.path.insert(0, join(dirname(dirname(dirname(abspath(__file__)))),
+                        'lib', 'symbioticpy'))
+
+from symbiotic.utils import aioprocess
+from symbiotic.utils.watch import ProcessWatch
+
+# a process that ignores SIGTERM, so it must be killed
+IGNORE_TERM = 'import signal; signal.signal(signal.SIGTERM, signal.SIG_IGN)\n'
+
+
+# the output that the chunks split in various places
+CHUNKED_LINES = ('[b"x" * ({0} + 10) + b"\\n", b"\\n"]'
+                 ' + [b"%d\\n" % n * (n % 7) for n in range(20000)]'
+                 ' + [b"y" * (2 * {0})]').format(aioprocess.CHUNK_SIZE)
+
+
+def python(code):
+    return Popen([sys.executable, '-c', code], stdout=PIPE)
+
+
+class LinesWatch(ProcessWatch):
+    def __init__(self):
+        ProcessWatch.__init__(self, None)
+
+
+class SilenceWatch(ProcessWatch):
+    """ Stops the process once it has been silent for a while """
+
+    poll_interval = 0.05
+    stop_timeout = 0.3
+
+    def __init__(self, silence=0.2):
+        ProcessWatch.__init__(self, None)
+        self.silence = silence
+        self.last = None
+        self.polls = 0
+
+    def putLine(self, line):
+        ProcessWatch.putLine(self, line)
+        self.last = monotonic()
+
+    def ok(self):
+        self.polls += 1
+        return self.last is None or monotonic() - self.last < self.silence
+
+
+class TestStream(unittest.TestCase):
+    def lines(self, code):
+        watch = LinesWatch()
+        process = python(code)
+        self.assertEqual(aioprocess.wait(process, watch), 0)
+        return watch.getLines()
+
+    def test_last_line(self):
+        self.assertEqual(self.lines('print("a"); print("b", end="")'),
+                         [b'a\n', b'b'])
+        self.assertEqual(self.lines('print("a")'), [b'a\n'])
+        self.assertEqual(self.lines('pass'), [])
+
+    def test_chunks(self):
+        # lines longer than a chunk and lines across the chunks
+        code = ('import sys\n'
+                'lines = {0}\n'
+                'data = b"".join(lines)\n'
+                'for n in range(0, len(data), 10000):\n'
+                '    sys.stdout.buffer.write(data[n:n + 10000])\n'
+                '    sys.stdout.flush()\n').format(CHUNKED_LINES)
+        data = b''.join(eval(CHUNKED_LINES))
+        self.assertEqual(self.lines(code), data.splitlines(keepends=True))
+
+    def test_silent_process(self):
+        watch = SilenceWatch()
+        process = python(IGNORE_TERM + 'import time\n'
+                         'print("started", flush=True)\n'
+                         'time.sleep(30)\n')
+        start = monotonic()
+        self.assertIsNone(aioprocess.wait(process, watch))
+        elapsed = monotonic() - start
+        # ok() was asked while the process printed nothing
+        self.assertEqual(watch.getLines(), [b'started\n'])
+        self.assertGreater(watch.polls, 2)
+        # terminated, then killed after stop_timeout
+        self.assertEqual(process.returncode, -signal.SIGKILL)
+        self.assertGreaterEqual(elapsed, watch.silence + watch.stop_timeout)
+        self.assertLess(elapsed, 10)
+
+    def test_terminated(self):
+        watch = SilenceWatch()
+        watch.stop_timeout = 10
+        process = python('import time\n'
+                         'print("started", flush=True)\n'
+                         'time.sleep(30)\n')
+        start = monotonic()
+        self.assertIsNone(aioprocess.wait(process, watch))
+        # the process finished on SIGTERM, it was not waited for stop_timeout
+        self.assertEqual(process.returncode, -signal.SIGTERM)
+        self.assertLess(monotonic() - start, 5)
+
+
+class TestStreamMany(unittest.TestCase):
+    def test_stop(self):
+        # the first process finishes once the others are set up
+        codes = ['import time; time.sleep(0.5); print("done")',
+                 IGNORE_TERM + 'import time; time.sleep(30)',
+                 'import time; time.sleep(30)',
+                 'print("not started")']
+        processes, stops = {}, []
+
+        def start(idx):
+            processes[idx] = python(codes[idx])
+            return processes[idx], LinesWatch()
+
+        def stop(idx, retval):
+            stops.append((idx, retval))
+            return True
+
+        begin = monotonic()
+        retvals = aioprocess.run_many(start, len(codes), maxjobs=3, stop=stop)
+        self.assertLess(monotonic() - begin, 10)
+        self.assertEqual(retvals, [0, None, None, None])
+        self.assertEqual(stops, [(0, 0)])
+        # the other processes were killed, no new process was started
+        self.assertEqual(sorted(processes), [0, 1, 2])
+        self.assertEqual(processes[1].wait(), -signal.SIGKILL)
+        self.assertIsNotNone(processes[2].poll())
+
+    def test_all(self):
+        codes = ['print({0}); exit({0})'.format(n) for n in range(5)]
+        watches = {}
+
+        def start(idx):
+            watches[idx] = LinesWatch()
+            return python(codes[idx]), watches[idx]
+
+        self.assertEqual(aioprocess.run_many(start, len(codes), maxjobs=2),
+                         list(range(5)))
+        self.assertEqual([watches[n].getLines() for n in range(5)],
+                         [[b'%d\n' % n] for n in range(5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+"""
+The zip archive with the test-suite is complete under its final
+name only once it is closed (it is written into a .part file).
+"""
+
+import os
+import sys
+import unittest
+import zipfile
+from os.path import dirname, abspath, exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+sys.path.insert(0, join(dirname(dirname(dirname(abspath(__file__)))),
+                        'lib', 'symbioticpy'))
+
+from symbiotic.testsuits import archive as zips
+
+
+class TestTestSuiteZip(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.path = join(self.dir, 'test-suite.zip')
+
+    def tearDown(self):
+        rmtree(self.dir)
+
+    def test_finalize(self):
+        archive = zips.TestSuiteZip(self.path)
+        self.assertTrue(archive.add('metadata.xml', b'<test-metadata/>'))
+        self.assertTrue(archive.add('test000001.xml', b'<testcase/>'))
+        # nothing under the final name until the archive is closed
+        self.assertFalse(exists(self.path))
+        self.assertTrue(exists(self.path + '.part'))
+
+        archive.close()
+        self.assertTrue(exists(self.path))
+        self.assertFalse(exists(self.path + '.part'))
+        with zipfile.ZipFile(self.path) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(sorted(zf.namelist()),
+                             ['test-suite/metadata.xml',
+                              'test-suite/test000001.xml'])
+            self.assertEqual(zf.read('test-suite/test000001.xml'), b'<testcase/>')
+        # closing again does nothing
+        archive.close()
+        self.assertTrue(exists(self.path))
+
+    def test_duplicates(self):
+        archive = zips.TestSuiteZip(self.path, 'tests')
+        self.assertTrue(archive.add('test000001.xml', b'first'))
+        self.assertFalse(archive.add('test000001.xml', b'second'))
+        self.assertEqual(len(archive), 1)
+        archive.close()
+        with zipfile.ZipFile(self.path) as zf:
+            self.assertEqual(zf.read('tests/test000001.xml'), b'first')
+
+    def test_add_directory(self):
+        suite = join(self.dir, 'suite')
+        os.mkdir(suite)
+        for name in ('test000002.xml', 'test000001.xml', 'test000001.ktest'):
+            with open(join(suite, name), 'wb') as f:
+                f.write(name.encode())
+
+        archive = zips.TestSuiteZip(self.path)
+        archive.add('test000001.xml', b'exported before')
+        archive.add_directory(suite)
+        archive.close()
+        with zipfile.ZipFile(self.path) as zf:
+            self.assertEqual(sorted(zf.namelist()),
+                             ['test-suite/test000001.xml',
+                              'test-suite/test000002.xml'])
+            self.assertEqual(zf.read('test-suite/test000001.xml'),
+                             b'exported before')
+
+
+if __name__ == '__main__':
+    unittest.main()
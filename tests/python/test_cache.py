@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+"""
+The persistent cache of the outputs of symbiotic-cc stages:
+the keys, invalidation by dependencies and the eviction.
+"""
+
+import os
+import sys
+import unittest
+from os.path import dirname, abspath, exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+sys.path.insert(0, join(dirname(dirname(dirname(abspath(__file__)))),
+                        'lib', 'symbioticpy'))
+
+from symbiotic.utils.cache import StageCache, parse_deps_file
+
+
+class TestStageCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.cachedir = join(self.dir, 'cache')
+        self.cache = StageCache(self.cachedir, 1 << 20, 'clang 10.0.1')
+        self.mtime = 10**9
+
+    def tearDown(self):
+        rmtree(self.dir)
+
+    def write(self, name, data):
+        path = join(self.dir, name)
+        with open(path, 'w') as f:
+            f.write(data)
+        # the file changes even if it is written in the same second
+        self.mtime += 10
+        os.utime(path, (self.mtime, self.mtime))
+        return path
+
+    def read(self, path):
+        with open(path, 'r') as f:
+            return f.read()
+
+    def entry(self, key):
+        return join(self.cachedir, key[:2], key)
+
+    def test_key(self):
+        source = self.write('main.c', 'int main(void) { return 0; }')
+        cmd = ['clang', '-c', '-emit-llvm', source, '-o']
+        key = self.cache.key(cmd + ['main.bc'], 'main.bc')
+        # the time limit and the output file do not matter
+        self.assertEqual(self.cache.key(['timeout', '30'] + cmd + ['other.bc'],
+                                        'other.bc'), key)
+        # the name of the input file does not matter, its content does
+        self.assertEqual(self.cache.key(['clang', '-c', '-emit-llvm',
+                                         self.write('copy.c', self.read(source)),
+                                         '-o', 'main.bc'], 'main.bc'), key)
+        self.write('main.c', 'int main(void) { return 1; }')
+        self.assertNotEqual(self.cache.key(cmd + ['main.bc'], 'main.bc'), key)
+        # the options and the versions of tools do matter
+        self.assertNotEqual(self.cache.key(['clang', '-O2'] + cmd[1:] + ['main.bc'],
+                                           'main.bc'), key)
+        other = StageCache(self.cachedir, 1 << 20, 'clang 11.0.0')
+        self.assertNotEqual(other.key(cmd + ['main.bc'], 'main.bc'), key)
+
+    def test_restore(self):
+        output = self.write('main.bc', 'bitcode')
+        restored = join(self.dir, 'restored.bc')
+        self.assertFalse(self.cache.restore('ab' * 32, restored))
+        self.cache.store('ab' * 32, output)
+        self.assertTrue(self.cache.restore('ab' * 32, restored))
+        self.assertEqual(self.read(restored), 'bitcode')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_deps(self):
+        header = self.write('header.h', '#define N 1')
+        output = self.write('main.bc', 'bitcode')
+        restored = join(self.dir, 'restored.bc')
+        key = 'cd' * 32
+        self.cache.store(key, output, [header])
+        self.assertTrue(self.cache.restore(key, restored))
+
+        # the header changed, the entry is stale
+        self.write('header.h', '#define N 2')
+        self.assertFalse(self.cache.restore(key, restored))
+        # the header is back, the entry is valid again
+        self.write('header.h', '#define N 1')
+        self.assertTrue(self.cache.restore(key, restored))
+        os.unlink(header)
+        self.assertFalse(self.cache.restore(key, restored))
+
+    def test_store_drops_stale_deps(self):
+        header = self.write('header.h', '#define N 1')
+        output = self.write('main.bc', 'bitcode')
+        restored = join(self.dir, 'restored.bc')
+        key = 'ef' * 32
+        self.cache.store(key, output, [header])
+        self.assertTrue(exists(self.entry(key) + '.deps'))
+        self.write('header.h', '#define N 2')
+
+        # the same key, but without dependencies now
+        self.cache.store(key, self.write('main.bc', 'other bitcode'))
+        self.assertFalse(exists(self.entry(key) + '.deps'))
+        self.assertTrue(self.cache.restore(key, restored))
+        self.assertEqual(self.read(restored), 'other bitcode')
+
+    def test_evict(self):
+        cache = StageCache(self.cachedir, 1000, '')
+        keys = ['{0:02d}'.format(n) * 32 for n in range(10)]
+        for n, key in enumerate(keys):
+            output = self.write('out.bc', 'x' * 100)
+            header = self.write('header.h', str(n))
+            cache.store(key, output, [header])
+            # the order of use (the stored entries are as old as their output)
+            os.utime(self.entry(key), (n, n))
+
+        # all fit (the .deps files are not counted)
+        self.assertTrue(all(exists(self.entry(key)) for key in keys))
+        self.assertEqual(cache._size, 1000)
+
+        # the least recently used entries are removed,
+        # down to 90 % of the limit
+        cache.store('aa' * 32, self.write('out.bc', 'x' * 150))
+        remaining = [key for key in keys if exists(self.entry(key))]
+        self.assertEqual(remaining, keys[3:])
+        for key in keys[:3]:
+            self.assertFalse(exists(self.entry(key) + '.deps'))
+        self.assertTrue(exists(self.entry('aa' * 32)))
+        self.assertEqual(cache._size, 850)
+
+
+class TestParseDepsFile(unittest.TestCase):
+    def test_parse(self):
+        directory = mkdtemp()
+        try:
+            path = join(directory, 'main.d')
+            with open(path, 'w') as f:
+                f.write('main.o: main.c /usr/include/stdio.h \\\n'
+                        '  include/a.h\n')
+            self.assertEqual(parse_deps_file(path),
+                             ['main.c', '/usr/include/stdio.h', 'include/a.h'])
+        finally:
+            rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
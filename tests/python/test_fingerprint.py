@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+"""
+Fingerprints of files: the hash of the raw content, memoized
+until the file changes.
+"""
+
+import os
+import sys
+import unittest
+from hashlib import sha256
+from os.path import dirname, abspath, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import mock
+
+sys.path.insert(0, join(dirname(dirname(dirname(abspath(__file__)))),
+                        'lib', 'symbioticpy'))
+
+from symbiotic.utils import fingerprint
+from symbiotic.utils.fingerprint import file_hash
+
+
+class TestFileHash(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.path = join(self.dir, 'file.c')
+
+    def tearDown(self):
+        rmtree(self.dir)
+
+    def write(self, data, mtime=None):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        if mtime is not None:
+            os.utime(self.path, ns=(mtime, mtime))
+
+    def test_content(self):
+        for data in (b'', b'int main() {}\n', b'\r\n\xff' * 100000):
+            self.write(data)
+            self.assertEqual(file_hash(self.path), sha256(data).hexdigest())
+
+    def test_blocks(self):
+        # the fallback when the file cannot be mapped
+        data = b'x' * (fingerprint.BLOCK_SIZE * 2 + 3)
+        self.write(data)
+        with mock.patch.object(fingerprint.mmap, 'mmap', side_effect=OSError):
+            self.assertEqual(fingerprint._hash(self.path), sha256(data).hexdigest())
+
+    def test_memoized(self):
+        self.write(b'first', mtime=10**18)
+        first = file_hash(self.path)
+        with mock.patch.object(fingerprint, '_hash') as rehash:
+            self.assertEqual(file_hash(self.path), first)
+            self.assertEqual(file_hash(join(self.dir, '.', 'file.c')), first)
+            rehash.assert_not_called()
+
+    def test_changed(self):
+        self.write(b'first', mtime=10**18)
+        self.assertEqual(file_hash(self.path), sha256(b'first').hexdigest())
+        # the same size, but a different modification time
+        self.write(b'other', mtime=2 * 10**18)
+        self.assertEqual(file_hash(self.path), sha256(b'other').hexdigest())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+"""
+The logic of kleetester that does not need KLEE and LLVM.
+"""
+
+import os
+import sys
+import unittest
+from os.path import dirname, abspath, exists, join
+from shutil import rmtree
+from struct import pack
+from tempfile import mkdtemp
+from unittest import mock
+
+sys.path.insert(0, join(dirname(dirname(dirname(abspath(__file__)))), 'scripts'))
+
+import kleetester
+from kleetester import Budget, BUDGET_RESERVE, MIN_GENERATOR_TIME
+from kleetester import Scheduler, Merger, ERROR_MARKER
+
+from test_ktest import ktest_bytes
+
+
+def python(code):
+    return [sys.executable, '-c', code]
+
+
+class TestBudget(unittest.TestCase):
+    def budget(self, seconds, slots, now=1000.0):
+        with mock.patch.object(kleetester, 'monotonic', return_value=now):
+            return Budget(seconds, slots)
+
+    def at(self, now):
+        return mock.patch.object(kleetester, 'monotonic', return_value=now)
+
+    def test_unlimited(self):
+        budget = self.budget(None, 3)
+        self.assertIsNone(budget.remaining())
+        self.assertFalse(budget.exhausted())
+        self.assertIsNone(budget.generator_time(10))
+        self.assertEqual(budget.slicer_timeout(), 120)
+
+    def test_generator_time(self):
+        budget = self.budget(100 + BUDGET_RESERVE, 3)
+        with self.at(1000.0):
+            self.assertEqual(budget.remaining(), 100)
+            # 6 targets in 3 slots need two rounds
+            self.assertEqual(budget.generator_time(6), 50)
+            self.assertEqual(budget.generator_time(7), 33)
+            self.assertEqual(budget.generator_time(3), 100)
+            self.assertEqual(budget.generator_time(1), 100)
+            self.assertEqual(budget.generator_time(0), 100)
+        # the time that was not used goes to the later targets
+        with self.at(1040.0):
+            self.assertEqual(budget.generator_time(3), 60)
+
+    def test_one_slot(self):
+        budget = self.budget(100 + BUDGET_RESERVE, 0)
+        with self.at(1000.0):
+            self.assertEqual(budget.generator_time(4), 25)
+
+    def test_exhausted(self):
+        budget = self.budget(100 + BUDGET_RESERVE, 2)
+        with self.at(1000.0 + 100 - MIN_GENERATOR_TIME):
+            self.assertFalse(budget.exhausted())
+        with self.at(1000.0 + 101 - MIN_GENERATOR_TIME):
+            self.assertTrue(budget.exhausted())
+        with self.at(2000.0):
+            self.assertEqual(budget.remaining(), 0)
+            self.assertEqual(budget.slicer_timeout(), 1)
+
+    def test_zero(self):
+        # no time left is not the same as no deadline
+        for seconds in (0, BUDGET_RESERVE):
+            budget = self.budget(seconds, 3)
+            with self.at(1000.0):
+                self.assertEqual(budget.remaining(), 0)
+                self.assertTrue(budget.exhausted())
+                self.assertEqual(budget.generator_time(3), 0)
+
+    def test_slicer_timeout(self):
+        budget = self.budget(100 + BUDGET_RESERVE, 2)
+        with self.at(1000.0):
+            self.assertEqual(budget.slicer_timeout(), 100 - MIN_GENERATOR_TIME)
+            self.assertEqual(budget.slicer_timeout(30), 30)
+
+    def test_no_zero_max_time(self):
+        # KLEE takes -max-time=0 as no limit
+        with mock.patch.object(kleetester, 'runcmd', lambda cmd: cmd):
+            cmd = kleetester.gentest('prog.bc', 'out', 'reach_error', max_time=0)
+            self.assertIn('-max-time=1', cmd)
+            cmd = kleetester.gentest('prog.bc', 'out', 'coverage')
+            self.assertIn('-max-time={0}'.format(kleetester.GENERATOR_TIME), cmd)
+            cmd = kleetester.gentest('prog.bc', 'out', 'reach_error')
+            self.assertFalse([a for a in cmd if a.startswith('-max-time')])
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.sched = Scheduler('reach_error', limit=4)
+
+    def tearDown(self):
+        self.sched.kill_all()
+        rmtree(self.dir)
+
+    def generator(self, code):
+        return self.sched.add(kleetester.runcmd(python(code)))
+
+    def test_run(self):
+        # a generator with a lot of output must not block the helper
+        self.generator('import sys; sys.stdout.write("x" * (1 << 20))')
+        ret, out = self.sched.run(python('print("helper"); exit(3)'))
+        self.assertEqual((ret, out), (3, b'helper\n'))
+        self.sched.wait_all()
+        self.assertEqual(self.sched.running(), 0)
+        self.assertEqual(self.sched.run(['/nonexistent/binary']), (None, None))
+
+    def test_start(self):
+        lines, done = [], []
+        self.assertTrue(self.sched.start(python('print("a"); print("b", end="")'),
+                                         lambda ret, out: done.append((ret, out)),
+                                         on_line=lines.append))
+        # helpers take a slot, but they are not generators
+        self.assertEqual(self.sched.running(), 0)
+        self.sched.wait_all()
+        self.assertEqual(lines, [b'a', b'b'])
+        self.assertEqual(done, [(0, b'a\nb')])
+
+    def test_has_slot(self):
+        for _ in range(4):
+            self.assertTrue(self.sched.has_slot())
+            self.generator('import time; time.sleep(30)')
+        self.assertFalse(self.sched.has_slot())
+        self.assertEqual(self.sched.running(), 4)
+
+    def test_kill_all(self):
+        children = [self.generator('import time; time.sleep(30)')
+                    for _ in range(2)]
+        self.sched.kill_all()
+        self.assertEqual(self.sched.running(), 0)
+        self.assertTrue(self.sched.has_slot())
+        for child in children:
+            self.assertTrue(child.process.stdout.closed)
+            self.assertIsNone(child.pidfd)
+
+    def test_error_waits_for_the_generator(self):
+        test = join(self.dir, 'test000001.ktest')
+        other = self.generator('import time; time.sleep(30)')
+        # split the marker between two writes
+        half = len(ERROR_MARKER) // 2
+        erroring = self.generator(
+            'import sys, time\n'
+            'sys.stdout.buffer.write({0!r}); sys.stdout.flush(); time.sleep(0.2)\n'
+            'sys.stdout.buffer.write({1!r} + b"0\\n"); sys.stdout.flush()\n'
+            'time.sleep(0.5)\n'
+            'open({2!r}, "w").write("test")\n'.format(
+                ERROR_MARKER[:half], ERROR_MARKER[half:], test))
+
+        def on_error():
+            # the test is written before we merge the tests
+            self.assertTrue(exists(test))
+            self.assertEqual(erroring.process.returncode, 0)
+            self.assertIsNotNone(other.process.poll())
+            calls.append(on_error)
+        calls = []
+        self.sched.on_error = on_error
+        with self.assertRaises(SystemExit):
+            while True:
+                self.sched.poll()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.sched.running(), 0)
+
+    def test_no_error_in_coverage_mode(self):
+        sched = Scheduler('coverage', limit=2)
+        sched.add(kleetester.runcmd(python('print({0!r})'.format(ERROR_MARKER))))
+        sched.wait_all()
+        self.assertEqual(sched.running(), 0)
+
+
+class TestMerger(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.outdir = join(self.dir, 'out')
+        os.mkdir(self.outdir)
+        # the merger creates its directory in the current directory
+        self.cwd = os.getcwd()
+        os.chdir(self.dir)
+        self.merger = Merger(self.outdir, interval=0)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        rmtree(self.dir)
+
+    def write_test(self, directory, name, value, err=False, data=None):
+        os.makedirs(directory, exist_ok=True)
+        if data is None:
+            data = ktest_bytes([(b'main:x:3:0', pack('<i', value))])
+        with open(join(directory, name + '.ktest'), 'wb') as f:
+            f.write(data)
+        with open(join(directory, name + '.xml'), 'w') as f:
+            f.write('<testcase>{0}</testcase>'.format(value))
+        if err:
+            with open(join(directory, name + '.assert.err'), 'w') as f:
+                f.write('error')
+
+    def outfiles(self):
+        return sorted(os.listdir(self.outdir))
+
+    def test_merge_finished(self):
+        self.write_test(self.outdir, 'test000001', 1)
+        side = self.merger.directory(1)
+        self.write_test(side, 'test000001.1', 1)
+        self.write_test(side, 'test000002.1', 2)
+        # the same inputs, but it covers an error
+        self.write_test(side, 'test000003.1', 1, err=True)
+        self.merger.finished(side)
+
+        self.assertEqual(self.outfiles(),
+                         ['test000001.ktest', 'test000001.xml',
+                          'test000002.1.ktest', 'test000002.1.xml',
+                          'test000003.1.assert.err', 'test000003.1.ktest',
+                          'test000003.1.xml'])
+        self.assertEqual((self.merger.moved, self.merger.duplicate), (2, 1))
+        self.assertFalse(exists(side))
+
+    def test_running_generator(self):
+        side = self.merger.directory(2)
+        self.write_test(side, 'test000001.2', 1)
+        self.merger.merge()
+        # the last test may be being written
+        self.assertEqual(self.outfiles(), [])
+
+        self.write_test(side, 'test000002.2', 2)
+        self.merger.merge()
+        self.assertEqual(self.outfiles(), ['test000001.2.ktest', 'test000001.2.xml'])
+
+        # duplicates among the side generators
+        other = self.merger.directory(3)
+        self.write_test(other, 'test000001.3', 2)
+        self.merger.finished(other)
+        self.assertEqual(self.merger.duplicate, 0)
+        self.merger.close()
+        self.assertEqual(len(self.outfiles()), 4)
+        self.assertEqual((self.merger.moved, self.merger.duplicate), (2, 1))
+        self.assertFalse(exists(self.merger.workdir))
+
+    def test_broken_test(self):
+        side = self.merger.directory(1)
+        # the generator was killed while writing the test
+        self.write_test(side, 'test000001.1', 1, data=b'KTEST\0\0')
+        self.merger.close()
+        self.assertEqual(self.outfiles(), [])
+        self.assertEqual(self.merger.moved, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+"""
+Reading .ktest files: the files are written here in the format
+of KLEE (as ktest-tool reads it) and read back.
+"""
+
+import sys
+import unittest
+from os.path import dirname, abspath, join
+from shutil import rmtree
+from struct import pack
+from tempfile import mkdtemp
+
+sys.path.insert(0, join(dirname(dirname(dirname(abspath(__file__)))),
+                        'lib', 'symbioticpy'))
+
+from symbiotic.exceptions import SymbioticException
+from symbiotic.utils.ktest import KTest, read_ktests
+
+
+def ktest_bytes(objects, args=(b'prog.bc',), version=3):
+    def blob(data):
+        return pack('>i', len(data)) + data
+
+    data = b'KTEST' + pack('>i', version) + pack('>i', len(args))
+    data += b''.join(blob(arg) for arg in args)
+    if version >= 2:
+        # sym_argvs and sym_argv_len
+        data += pack('>ii', 0, 0)
+    data += pack('>i', len(objects))
+    for name, value in objects:
+        data += blob(name) + blob(value)
+    return data
+
+
+class TestKTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.dir)
+
+    def write(self, name, data):
+        path = join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_round_trip(self):
+        objects = [(b'x', pack('<i', -5)), (b'c', b'\x07'),
+                   (b'l', pack('<q', 1 << 40)), (b'arr', b'\x00\x01\x02')]
+        path = self.write('test000001.ktest', ktest_bytes(objects))
+        with KTest(path) as ktest:
+            self.assertEqual(ktest.version, 3)
+            self.assertEqual(ktest.args, [b'prog.bc'])
+            self.assertEqual(len(ktest), len(objects))
+            self.assertEqual([(o.name, o.data.tobytes()) for o in ktest], objects)
+            self.assertEqual([o.value() for o in ktest], [-5, 7, 1 << 40, None])
+            self.assertEqual([o.size for o in ktest], [4, 1, 8, 3])
+            self.assertEqual(list(ktest.objects[3].cast('B')), [0, 1, 2])
+            self.assertFalse(ktest.objects[3].is_zero())
+        # the objects are released with the file
+        self.assertEqual(ktest.objects, [])
+
+    def test_old_version(self):
+        path = self.write('old.ktest', ktest_bytes([(b'x', b'\x00' * 4)], version=1))
+        with KTest(path) as ktest:
+            self.assertEqual(ktest.version, 1)
+            self.assertEqual(ktest.objects[0].value(), 0)
+            self.assertTrue(ktest.objects[0].is_zero())
+
+    def test_truncated(self):
+        data = ktest_bytes([(b'x', pack('<i', 1)), (b'y', pack('<i', 2))])
+        for size in range(len(data)):
+            path = self.write('truncated.ktest', data[:size])
+            with self.assertRaises(SymbioticException, msg=str(size)):
+                KTest(path).close()
+
+    def test_not_ktest(self):
+        path = self.write('bad.ktest', b'NOT A KTEST FILE')
+        with self.assertRaises(SymbioticException):
+            KTest(path)
+        path = self.write('new.ktest', ktest_bytes([], version=4))
+        with self.assertRaises(SymbioticException):
+            KTest(path)
+
+    def test_read_ktests(self):
+        for n in (2, 1, 3):
+            self.write('test{0:06d}.ktest'.format(n),
+                       ktest_bytes([(b'n', pack('<i', n))]))
+        self.write('test000001.xml', b'<testcase/>')
+        values = [ktest.objects[0].value() for ktest in read_ktests(self.dir)]
+        self.assertEqual(values, [1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
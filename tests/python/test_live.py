@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+"""
+Exporting the tests while KLEE runs: the exporter is driven
+by scan() here, so the tests do not depend on timing.
+"""
+
+import os
+import sys
+import unittest
+import zipfile
+from os.path import dirname, abspath, exists, join
+from shutil import rmtree
+from struct import pack
+from tempfile import mkdtemp
+
+sys.path.insert(0, join(dirname(dirname(dirname(abspath(__file__)))),
+                        'lib', 'symbioticpy'))
+
+from symbiotic.testsuits import archive as zips
+from symbiotic.testsuits.live import LiveTestExporter
+
+from test_ktest import ktest_bytes
+
+
+class TestLiveTestExporter(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.klee = join(self.dir, 'klee-out')
+        os.mkdir(self.klee)
+
+    def tearDown(self):
+        rmtree(self.dir)
+
+    def write(self, name, data):
+        with open(join(self.klee, name), 'wb') as f:
+            f.write(data)
+
+    def write_test(self, n, value):
+        data = ktest_bytes([(b'main:x:3:0', pack('<i', value))])
+        self.write('test{0:06d}.ktest'.format(n), data)
+        return data
+
+    def read(self, name):
+        with open(join(self.klee, name), 'rb') as f:
+            return f.read()
+
+    def test_export(self):
+        exporter = LiveTestExporter(self.klee)
+        self.write_test(1, 42)
+        # KLEE is still writing the second test
+        self.write('test000002.ktest', self.write_test(2, 7)[:-3])
+        exporter.scan()
+        self.assertEqual(exporter.exported(), 1)
+        self.assertIn(b'<input variable="x">42</input>', self.read('test000001.xml'))
+        self.assertFalse(exists(join(self.klee, 'test000002.xml')))
+
+        self.write_test(2, 7)
+        exporter.scan()
+        self.assertEqual(exporter.exported(), 2)
+        self.assertIn(b'>7</input>', self.read('test000002.xml'))
+        self.assertNotIn(b'coverError', self.read('test000002.xml'))
+
+    def test_error_after_export(self):
+        exporter = LiveTestExporter(self.klee)
+        self.write_test(1, 1)
+        exporter.scan()
+        self.assertNotIn(b'coverError', self.read('test000001.xml'))
+        # the .err file comes after the test was exported
+        self.write('test000001.assert.err', b'Error: ASSERTION FAIL')
+        exporter.scan()
+        self.assertIn(b'key="coverError"', self.read('test000001.xml'))
+
+    def test_archive(self):
+        path = join(self.dir, 'suite.zip')
+        archive = zips.TestSuiteZip(path)
+        exporter = LiveTestExporter(self.klee, archive=archive)
+        self.write_test(1, 1)
+        self.write_test(2, 2)
+        self.write('test000002.assert.err', b'')
+        exporter.scan()
+        # the test with an error is final, the other may still get an error
+        self.assertEqual(len(archive), 1)
+
+        exporter.stop()
+        archive.close()
+        with zipfile.ZipFile(path) as zf:
+            self.assertEqual(sorted(zf.namelist()),
+                             ['test-suite/test000001.xml',
+                              'test-suite/test000002.xml'])
+            self.assertIn(b'coverError', zf.read('test-suite/test000002.xml'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+"""
+OutputMatcher must classify the lines exactly like matching
+the (key, regex) lists one by one with re.match did before.
+"""
+
+import re
+import sys
+import unittest
+from os.path import dirname, abspath, join
+from random import Random
+
+sys.path.insert(0, join(dirname(dirname(dirname(abspath(__file__)))),
+                        'lib', 'symbioticpy'))
+
+from symbiotic.options import SymbioticOptions
+from symbiotic.utils.matcher import OutputMatcher, _required_literal, _trie_regex
+
+
+def old_match(patterns, line):
+    for key, pattern in patterns:
+        if pattern.match(line):
+            return key
+    return None
+
+
+def tool_matchers():
+    from symbiotic.targets import ikos, nidhugg, slowbeast, cbmc
+    from symbiotic.targets.klee import SymbioticTool as KleeTool
+    from symbiotic.targets.klee import KleeToolFullInstrumentation
+
+    opts = SymbioticOptions()
+    return {
+        'klee': KleeTool(opts)._matcher,
+        'klee-full-instr': KleeToolFullInstrumentation(opts)._matcher,
+        'ikos': ikos._output_matcher,
+        'nidhugg': nidhugg._output_matcher,
+        'slowbeast': slowbeast._output_matcher,
+        'cbmc': cbmc._svcomp_matcher,
+    }
+
+
+def sample_lines(patterns, rnd):
+    """ Lines that (nearly) match the patterns and some noise """
+    lines = ['', 'KLEE: done: total instructions = 1234',
+             'KLEE: WARNING ONCE: calling external: printf(94371840)',
+             'KLEE: output directory is "/tmp/klee-out-0"']
+    for pattern in patterns:
+        line = re.sub(r'\.\*', ' x ', pattern).replace('\\', '')
+        line = line.replace('(', '').replace(')', '')
+        lines.append(line)
+        lines.append(line.strip())
+        lines.append('prefix ' + line + ' suffix')
+        # the same line with a character missing or changed
+        for _ in range(5):
+            pos = rnd.randrange(max(1, len(line)))
+            lines.append(line[:pos] + line[pos + 1:])
+            lines.append(line[:pos] + rnd.choice('aZ:. ') + line[pos + 1:])
+    return lines
+
+
+class TestOutputMatcher(unittest.TestCase):
+    def test_same_as_regex_lists(self):
+        rnd = Random(0)
+        for name, matcher in tool_matchers().items():
+            sources = [p.pattern for p in matcher._str.patterns]
+            patterns = list(zip(matcher._keys, map(re.compile, sources)))
+            lines = sample_lines(sources, rnd)
+            matched = 0
+            for line in lines:
+                expected = old_match(patterns, line)
+                matched += expected is not None
+                self.assertEqual(matcher.match(line), expected,
+                                 '{0}: {1!r}'.format(name, line))
+                self.assertEqual(matcher.match(line.encode('utf-8')),
+                                 expected, '{0}: {1!r}'.format(name, line))
+            # the sample lines really exercise the patterns
+            self.assertGreater(matched, len(sources) // 2, name)
+
+    def test_priority(self):
+        matcher = OutputMatcher([('SPECIFIC', '.*ASSERTION FAIL: 0 && "double free".*'),
+                                 ('GENERIC', '.*ASSERTION FAIL:.*')])
+        self.assertEqual(matcher.match('ASSERTION FAIL: 0 && "double free"'), 'SPECIFIC')
+        self.assertEqual(matcher.match(b'KLEE: ASSERTION FAIL: 0'), 'GENERIC')
+        self.assertIsNone(matcher.match('ASSERTION PASSED'))
+
+    def test_anchored_pattern(self):
+        # patterns without the leading .* match only at the start
+        matcher = OutputMatcher([('A', 'ab'), ('B', '.Assertion .* failed.*')])
+        self.assertEqual(matcher.match('abc'), 'A')
+        self.assertIsNone(matcher.match('cab'))
+        self.assertEqual(matcher.match('xAssertion x failed'), 'B')
+        self.assertIsNone(matcher.match('Assertion x failed'))
+
+    def test_first_and_findall(self):
+        matcher = OutputMatcher([('A', '.*aaa.*'), ('B', '.*bbb.*')])
+        lines = ['x', 'bbb', 'aaa', 'y', 'bbb']
+        self.assertEqual(matcher.first(lines), 'B')
+        self.assertEqual(matcher.findall(lines), ['B', 'A', 'B'])
+        self.assertIsNone(matcher.first(['x', 'y']))
+
+    def test_required_literal(self):
+        self.assertEqual(_required_literal('.*ASSERTION FAIL:.*'), 'ASSERTION FAIL:')
+        self.assertEqual(_required_literal('.*klee: .*Assertion .* failed.*'),
+                         'Assertion ')
+        self.assertEqual(_required_literal('.*'), '')
+
+    def test_trie_regex(self):
+        words = ['abc', 'ab', 'abd', 'b', 'x.y']
+        regex = re.compile('^(?:{0})$'.format(_trie_regex(words)))
+        for w in words:
+            self.assertTrue(regex.match(w), w)
+        for w in ['a', 'abe', 'xzy', '']:
+            self.assertFalse(regex.match(w), w)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+"""
+Minimization of the test-suite: the greedy set cover and reading
+of the testcases (replaying the tests needs clang and is not tested here).
+"""
+
+import sys
+import unittest
+from os.path import dirname, abspath, join
+from random import Random
+from shutil import rmtree
+from tempfile import mkdtemp
+
+sys.path.insert(0, join(dirname(dirname(dirname(abspath(__file__)))),
+                        'lib', 'symbioticpy'))
+
+from symbiotic.testsuits.minimize import greedy_cover, read_testcase
+
+
+def naive_greedy_cover(coverage):
+    """ Recompute the gains of all sets in every step """
+    covered, selected = 0, []
+    while True:
+        gains = [bin(c & ~covered).count('1') for c in coverage]
+        best = max(gains, default=0)
+        if best == 0:
+            return selected
+        n = gains.index(best)
+        selected.append(n)
+        covered |= coverage[n]
+
+
+class TestGreedyCover(unittest.TestCase):
+    def test_simple(self):
+        self.assertEqual(greedy_cover([]), [])
+        self.assertEqual(greedy_cover([0, 0]), [])
+        # {0,1,2}, {0}, {3}, {1,2}
+        self.assertEqual(greedy_cover([0b0111, 0b0001, 0b1000, 0b0110]), [0, 2])
+        # the same coverage, the first test wins
+        self.assertEqual(greedy_cover([0b11, 0b11]), [0])
+
+    def test_lazy_gains(self):
+        # once {0..3,6} is taken, {0..3} gains nothing although it was
+        # larger than {4,5} at the start
+        self.assertEqual(greedy_cover([0b1111, 0b1001111, 0b110000]), [1, 2])
+
+    def test_same_as_naive(self):
+        rnd = Random(0)
+        for _ in range(300):
+            elems = rnd.randrange(1, 40)
+            coverage = [rnd.getrandbits(elems) & rnd.getrandbits(elems)
+                        for _ in range(rnd.randrange(1, 30))]
+            selected = greedy_cover(coverage)
+            self.assertEqual(selected, naive_greedy_cover(coverage), coverage)
+
+            total, covered = 0, 0
+            for c in coverage:
+                total |= c
+            for n in selected:
+                covered |= coverage[n]
+            self.assertEqual(covered, total)
+
+
+class TestReadTestcase(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.dir)
+
+    def read(self, content):
+        path = join(self.dir, 'test.xml')
+        with open(path, 'w') as f:
+            f.write(content)
+        return read_testcase(path)
+
+    def test_inputs(self):
+        self.assertEqual(self.read('<testcase><input variable="x">1</input>'
+                                   '<input> -2 </input><input/></testcase>'),
+                         (['1', '-2', ''], False))
+        self.assertEqual(self.read('<testcase/>'), ([], False))
+
+    def test_covers_error(self):
+        self.assertEqual(self.read('<testcase key="coverError">'
+                                   '<input>0</input></testcase>'),
+                         (['0'], True))
+        self.assertEqual(self.read('<testcase coverError="true"/>'), ([], True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+"""
+The testcase XML files written without building the XML tree must be
+the same (byte by byte) as the files written by TestCaseWriter with
+the XML library that is installed (lxml or ElementTree).
+"""
+
+import os
+import sys
+import unittest
+from os.path import dirname, abspath, join
+from shutil import rmtree
+from struct import pack
+from tempfile import mkdtemp
+from unittest import mock
+
+sys.path.insert(0, join(dirname(dirname(dirname(abspath(__file__)))),
+                        'lib', 'symbioticpy'))
+
+# not imported by name, pytest would collect them as tests
+from symbiotic.testsuits import testcases
+from symbiotic.utils.ktest import KTest
+
+from test_ktest import ktest_bytes
+
+
+class TestTestcaseXml(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.dir)
+
+    def written(self, objects, covers_error):
+        """ The file written by TestCaseWriter """
+        path = join(self.dir, 'writer.xml')
+        writer = testcases.TestCaseWriter('main.c', covers_error)
+        writer._dumpKTestObjects(objects)
+        writer.write(path)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def ktest(self, objects):
+        path = join(self.dir, 'test000001.ktest')
+        with open(path, 'wb') as f:
+            f.write(ktest_bytes(objects))
+        return path
+
+    def check(self, objects):
+        for covers_error in (False, True):
+            with self.subTest(covers_error=covers_error):
+                self.assertEqual(
+                    testcases.testcase_xml(testcases.testcase_inputs(objects),
+                                           covers_error),
+                    self.written(objects, covers_error))
+
+    def test_no_inputs(self):
+        self.check([])
+
+    def test_ktest_inputs(self):
+        path = self.ktest([(b'main:x:3:0', pack('<i', -5)),
+                           (b'main:c:1:0', b'\x07'),
+                           (b'main:arr:4:0', b'\x00\x01\x02'),
+                           # not in main, not a scalar variable
+                           (b'foo:y:2:0', pack('<i', 1)),
+                           (b'main:a[1]:5:0', pack('<i', 1))])
+        with KTest(path) as ktest:
+            inputs = testcases.testcase_inputs(ktest.objects)
+            self.assertEqual([var for var, _ in inputs],
+                             ['c', 'x', 'arr'])
+            self.check(ktest.objects)
+
+    def test_escaping(self):
+        # the names and values from KLEE do not need escaping now,
+        # but the writers must agree on them anyway
+        inputs = [('a<b>&"c"', '<&> "\'"'), ('tab\there', 'new\nline\r'),
+                  ('x', ']]>'), ('ž', 'ü€')]
+        for covers_error in (False, True):
+            with mock.patch.object(testcases, 'testcase_inputs',
+                                   return_value=inputs):
+                written = self.written([], covers_error)
+            self.assertEqual(testcases.testcase_xml(inputs, covers_error), written,
+                             covers_error)
+
+    def test_convert_ktests(self):
+        klee = join(self.dir, 'klee-out')
+        outdir = join(self.dir, 'out')
+        objects = [(b'main:x:3:0', pack('<i', 42))]
+        os.mkdir(klee)
+        for n in (1, 2):
+            with open(join(klee, 'test00000{0}.ktest'.format(n)), 'wb') as f:
+                f.write(ktest_bytes(objects))
+        with open(join(klee, 'test000002.assert.err'), 'w') as f:
+            f.write('error')
+
+        self.assertEqual(testcases.convert_ktests(klee, outdir, jobs=1), 2)
+        with KTest(join(klee, 'test000001.ktest')) as ktest:
+            for n, covers_error in ((1, False), (2, True)):
+                with open(join(outdir, 'test00000{0}.xml'.format(n)), 'rb') as f:
+                    self.assertEqual(f.read(),
+                                     self.written(ktest.objects, covers_error))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+"""
+The output of verifiers: which lines are kept for determine_result()
+and stopping the verifier once its result is known.
+"""
+
+import sys
+import unittest
+from os.path import dirname, abspath, join
+from time import monotonic
+
+sys.path.insert(0, join(dirname(dirname(dirname(abspath(__file__)))),
+                        'lib', 'symbioticpy'))
+
+from symbiotic.utils.process import ProcessRunner
+from symbiotic.verifier import ToolWatch, SymbioticVerifier
+
+
+class FakeTool(object):
+    def name(self):
+        return 'fake'
+
+
+class ClassifyingTool(FakeTool):
+    def classify_output_line(self, line):
+        if line.startswith(b'ERR'):
+            return line.split()[0]
+        return None
+
+
+class SmallWatch(ToolWatch):
+    tail_lines = 5
+    relevant_limit = 3
+
+
+class VerdictTool(FakeTool):
+    """ The result is known from the line 'RESULT: ...' """
+
+    def final_result(self, line):
+        if line.startswith(b'RESULT: '):
+            return line.split()[1].decode()
+        return None
+
+    def determine_result(self, returncode, returnsignal, output, isTimeout):
+        if returncode != 0:
+            return 'ERROR'
+        for line in output:
+            if line.startswith('RESULT: '):
+                return line.split()[1]
+        return 'unknown'
+
+
+class GraceWatch(ToolWatch):
+    grace_period = 0.5
+    stop_timeout = 0.5
+
+
+def lines(*names):
+    return [name.encode() + b'\n' for name in names]
+
+
+class TestToolWatch(unittest.TestCase):
+    def watch(self, output, tool=ClassifyingTool()):
+        watch = SmallWatch(tool)
+        for line in output:
+            watch.putLine(line)
+        watch.finish()
+        return watch
+
+    def test_no_classify(self):
+        # the tool cannot classify the lines, we keep everything
+        output = lines(*map(str, range(20)))
+        self.assertEqual(self.watch(output, FakeTool()).getLines(), output)
+
+    def test_tail(self):
+        output = lines(*map(str, range(20)))
+        watch = self.watch(output)
+        self.assertEqual(watch.getLines(), output[-5:])
+        self.assertEqual(watch.getTail(), output[-5:])
+
+    def test_relevant_limit(self):
+        output = lines(*['ERRA {0}'.format(n) for n in range(10)])
+        output += lines('ERRB 0', 'x')
+        output += lines(*['ERRA {0}'.format(n) for n in range(10, 12)])
+        output += lines(*map(str, range(20)))
+        # at most three lines of every class and the tail
+        self.assertEqual(self.watch(output).getLines(),
+                         lines('ERRA 0', 'ERRA 1', 'ERRA 2', 'ERRB 0',
+                               '15', '16', '17', '18', '19'))
+
+    def test_relevant_in_tail(self):
+        output = lines('ERRA 0', *map(str, range(10)))
+        output += lines('1', 'ERRA 1', '2', 'ERRB 0', '3')
+        # the relevant lines in the tail are there once, in the order
+        self.assertEqual(self.watch(output).getLines(),
+                         lines('ERRA 0', '1', 'ERRA 1', '2', 'ERRB 0', '3'))
+        # equal lines are still different lines of the output
+        output = lines('ERRA 0', *map(str, range(10)), 'ERRA 0', 'ERRA 0')
+        self.assertEqual(self.watch(output).getLines(),
+                         lines('ERRA 0', '7', '8', '9', 'ERRA 0', 'ERRA 0'))
+
+
+class TestVerdict(unittest.TestCase):
+    def run_tool(self, code):
+        tool = VerdictTool()
+        watch = GraceWatch(tool)
+        watch.poll_interval = 0.05
+        start = monotonic()
+        returncode = ProcessRunner().run([sys.executable, '-c', code], watch)
+        elapsed = monotonic() - start
+        verifier = SymbioticVerifier.__new__(SymbioticVerifier)
+        return returncode, elapsed, verifier._tool_result(tool, returncode, watch)
+
+    def test_silent(self):
+        # the tool writes the witness for a long time
+        returncode, elapsed, res = self.run_tool(
+            'import time\n'
+            'print("RESULT: false(unreach-call)", flush=True)\n'
+            'time.sleep(30)\n')
+        self.assertIsNone(returncode)
+        self.assertGreaterEqual(elapsed, GraceWatch.grace_period)
+        self.assertLess(elapsed, 10)
+        self.assertEqual(res, 'false(unreach-call)')
+
+    def test_printing(self):
+        returncode, elapsed, res = self.run_tool(
+            'import time\n'
+            'print("RESULT: true", flush=True)\n'
+            'for n in range(3000):\n'
+            '    print("line", n, flush=True)\n'
+            '    time.sleep(0.01)\n')
+        self.assertIsNone(returncode)
+        self.assertGreaterEqual(elapsed, GraceWatch.grace_period)
+        self.assertLess(elapsed, 10)
+        self.assertEqual(res, 'true')
+
+    def test_finished_in_grace_period(self):
+        returncode, elapsed, res = self.run_tool(
+            'print("RESULT: true"); exit(0)')
+        self.assertEqual(returncode, 0)
+        self.assertEqual(res, 'true')
+
+    def test_no_verdict(self):
+        # a process that was not stopped because of the verdict
+        # is not taken as finished
+        returncode, _, res = self.run_tool('print("nothing"); exit(1)')
+        self.assertEqual(returncode, 1)
+        self.assertEqual(res, 'ERROR')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+"""
+The violation witness is streamed from the witness generated by KLEE:
+the graph must be copied as it is and our keys and graph data added.
+"""
+
+import sys
+import unittest
+from os.path import dirname, abspath, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from xml.etree import ElementTree as ET
+
+sys.path.insert(0, join(dirname(dirname(dirname(abspath(__file__)))),
+                        'lib', 'symbioticpy'))
+
+from symbiotic.utils.fingerprint import file_hash
+from symbiotic.witnesses.witnesses import GraphMLWriter
+
+NS = '{http://graphml.graphdrawing.org/xmlns}'
+
+KLEE_WITNESS = """<?xml version="1.0" encoding="UTF-8"?>
+<graphml xmlns="http://graphml.graphdrawing.org/xmlns" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+ <key id="originfile" for="edge" attr.name="originfile" attr.type="string"><default>&lt;cmd&gt;</default></key>
+ <key id="startline" for="edge" attr.name="startline" attr.type="int"/>
+<graph edgedefault="directed">
+<node id="A0"><data key="entry">true</data></node>
+<node id="A1"/>
+<edge source="A0" target="A1"><data key="startline">3</data><data key="assumption">x == 0 &amp;&amp; y &lt; "3";</data></edge>
+<node id="A2"><data key="violation">true</data></node>
+<edge source="A1" target="A2"><data key="startline">4</data></edge>
+</graph>
+</graphml>
+"""
+
+
+def graph_elements(graph):
+    """ The nodes and edges with their data """
+    return [(e.tag, sorted(e.attrib.items()),
+             [(d.get('key'), d.text) for d in e])
+            for e in graph if e.tag in (NS + 'node', NS + 'edge')]
+
+
+class TestGraphMLWriter(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.source = join(self.dir, 'main.c')
+        with open(self.source, 'w') as f:
+            f.write('int main(void) { return 0; }\n')
+        self.output = join(self.dir, 'witness.graphml')
+
+    def tearDown(self):
+        rmtree(self.dir)
+
+    def test_violation_witness(self):
+        with open(join(self.dir, 'test000001.graphml'), 'w') as f:
+            f.write(KLEE_WITNESS)
+        writer = GraphMLWriter(self.source, ['CHECK( LTL(G ! call(reach_error())) )'],
+                               False, False)
+        writer.parseError(join(self.dir, 'test000001.ktest'), False)
+        writer.write(self.output)
+
+        root = ET.parse(self.output).getroot()
+        self.assertEqual(root.tag, NS + 'graphml')
+        children = list(root)
+        # the keys are defined before the graph, every key once
+        self.assertEqual(children[-1].tag, NS + 'graph')
+        keys = [k.get('id') for k in children[:-1]]
+        self.assertTrue(all(k.tag == NS + 'key' for k in children[:-1]))
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertIn('assumption', keys)
+        # the keys of KLEE are kept as they are
+        originfile = children[keys.index('originfile')]
+        self.assertEqual(originfile.find(NS + 'default').text, '<cmd>')
+        self.assertEqual(children[keys.index('startline')].get('attr.type'), 'int')
+
+        graph = children[-1]
+        self.assertEqual(graph.get('edgedefault'), 'directed')
+        data = {}
+        for d in graph:
+            if d.tag != NS + 'data':
+                break
+            data[d.get('key')] = d.text
+        self.assertEqual(data['witness-type'], 'violation_witness')
+        self.assertEqual(data['architecture'], '64bit')
+        self.assertEqual(data['programhash'], file_hash(self.source))
+        self.assertEqual(data['specification'],
+                         'CHECK( LTL(G ! call(reach_error())) )')
+
+        klee_graph = ET.fromstring(KLEE_WITNESS).find(NS + 'graph')
+        self.assertEqual(graph_elements(graph), graph_elements(klee_graph))
+        self.assertEqual(graph_elements(graph)[2][2][1],
+                         ('assumption', 'x == 0 && y < "3";'))
+
+    def test_trivial_witness(self):
+        writer = GraphMLWriter(self.source, [], True, True)
+        writer.createTrivialWitness()
+        writer.write(self.output)
+
+        graph = ET.parse(self.output).getroot().find(NS + 'graph')
+        data = {d.get('key'): d.text for d in graph.findall(NS + 'data')}
+        self.assertEqual(data['witness-type'], 'correctness_witness')
+        self.assertEqual(data['architecture'], '32bit')
+        self.assertEqual(graph_elements(graph),
+                         [(NS + 'node', [('id', '0')], [('entry', 'true')])])
+
+
+if __name__ == '__main__':
+    unittest.main()
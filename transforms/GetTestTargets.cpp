@@ -3,17 +3,32 @@
 // This file is distributed under the University of Illinois Open Source
 // License. See LICENSE.TXT for details.
 
+#include <algorithm>
 #include <cassert>
 #include <set>
 #include <stack>
+#include <string>
+#include <vector>
 
+#include "llvm/ADT/Triple.h"
+#include "llvm/Analysis/TargetLibraryInfo.h"
 #include "llvm/IR/BasicBlock.h"
 #include "llvm/IR/Instructions.h"
+#include "llvm/IR/LegacyPassManager.h"
 #include "llvm/IR/Module.h"
 #include "llvm/IR/CFG.h"
 #include "llvm/Pass.h"
 #include "llvm/Support/raw_os_ostream.h"
 #include "llvm/Support/CommandLine.h"
+#include "llvm/Support/FileSystem.h"
+#include "llvm/Transforms/IPO.h"
+#include "llvm/Transforms/IPO/PassManagerBuilder.h"
+#include "llvm/Transforms/Utils/Cloning.h"
+#if LLVM_VERSION_MAJOR >= 4
+#include "llvm/Bitcode/BitcodeWriter.h"
+#else
+#include "llvm/Bitcode/ReaderWriter.h"
+#endif
 
 using namespace llvm;
 
@@ -114,19 +129,13 @@ static RegisterPass<ConstraintToTarget> CTT("constraint-to-target",
 
 char ConstraintToTarget::ID;
 
-bool ConstraintToTarget::runOnModule(Module& M) {
+// make the paths that cannot reach the call of the target exit silently
+static bool constraintToTarget(Module& M, Function *mf) {
     bool changed = false;
     std::set<BasicBlock*> relevant;
     std::set<BasicBlock*> visited;
     std::stack<BasicBlock*> queue; // not efficient...
     auto& Ctx = M.getContext();
-    unsigned n = 0;
-
-    auto *mf = M.getFunction(TheTarget);
-    if (!mf) {
-        llvm::errs() << "ERROR: did not find the target" << TheTarget << "\n";
-        return false;
-    }
 
     for (auto use_it = mf->use_begin(), use_end = mf->use_end();
          use_it != use_end; ++use_it) {
@@ -205,5 +214,129 @@ bool ConstraintToTarget::runOnModule(Module& M) {
   return changed;
 }
 
+bool ConstraintToTarget::runOnModule(Module& M) {
+    auto *mf = M.getFunction(TheTarget);
+    if (!mf) {
+        llvm::errs() << "ERROR: did not find the target" << TheTarget << "\n";
+        return false;
+    }
+
+    return constraintToTarget(M, mf);
+}
+
+// Constraint the program to every target in one run: for each target
+// (by default from the last one, those are likely the deepest ones),
+// a copy of the module is constrained to the target, optimized (like
+// with -constraint-to-target -O3) and written into the file
+// <ctt-output><target>.bc. The line "<target> <file>" is printed
+// once the file is written, so that the caller can work with the module
+// while the others are being created.
+class ConstraintToTargets : public ModulePass {
+public:
+  static char ID;
+
+  ConstraintToTargets() : ModulePass(ID) {}
+
+  bool runOnModule(Module& M) override;
+};
+
+static cl::list<std::string> TheTargets("ctt-targets",
+        llvm::cl::desc("The targets for -constraint-to-targets in the order "
+                       "in which to process them (default: all targets "
+                       "from the last one)\n"),
+        llvm::cl::CommaSeparated);
+
+static cl::opt<std::string> TargetsOutput("ctt-output",
+        llvm::cl::desc("Prefix of the files created by -constraint-to-targets\n"),
+        llvm::cl::init("target-"));
+
+static RegisterPass<ConstraintToTargets> CTTS("constraint-to-targets",
+                                       "Constraint the program to each of the "
+                                       "targets for tests generation");
+
+char ConstraintToTargets::ID;
+
+static void optimize(Module& M) {
+    PassManagerBuilder Builder;
+    Builder.OptLevel = 3;
+    Builder.Inliner = createFunctionInliningPass(3, 0
+#if LLVM_VERSION_MAJOR >= 5
+                                                 , false
+#endif
+                                                 );
+    Builder.LibraryInfo = new TargetLibraryInfoImpl(Triple(M.getTargetTriple()));
+
+    legacy::FunctionPassManager FPM(&M);
+    legacy::PassManager MPM;
+    Builder.populateFunctionPassManager(FPM);
+    Builder.populateModulePassManager(MPM);
+
+    FPM.doInitialization();
+    for (auto& F : M)
+      FPM.run(F);
+    FPM.doFinalization();
+    MPM.run(M);
+}
+
+static bool writeModule(Module& M, const std::string& path) {
+    std::error_code EC;
+#if LLVM_VERSION_MAJOR >= 9
+    raw_fd_ostream out(path, EC, sys::fs::OF_None);
+#else
+    raw_fd_ostream out(path, EC, sys::fs::F_None);
+#endif
+    if (EC) {
+      llvm::errs() << "ERROR: failed opening " << path << ": "
+                   << EC.message() << "\n";
+      return false;
+    }
+
+#if LLVM_VERSION_MAJOR >= 7
+    WriteBitcodeToFile(M, out);
+#else
+    WriteBitcodeToFile(&M, out);
+#endif
+    return true;
+}
+
+bool ConstraintToTargets::runOnModule(Module& M) {
+    std::vector<std::string> targets(TheTargets.begin(), TheTargets.end());
+    if (targets.empty()) {
+      for (auto& F : M) {
+        if (F.getName().startswith("__SYMBIOTIC_test_target"))
+          targets.push_back(F.getName().str());
+      }
+      std::reverse(targets.begin(), targets.end());
+    }
+
+    for (auto& target : targets) {
+      if (!M.getFunction(target)) {
+        llvm::errs() << "ERROR: did not find the target" << target << "\n";
+        continue;
+      }
+
+#if LLVM_VERSION_MAJOR >= 7
+      auto clone = CloneModule(M);
+#else
+      auto clone = CloneModule(&M);
+#endif
+      // if every block can reach the target, the module stays unchanged,
+      // but we still write it (like -constraint-to-target does)
+      constraintToTarget(*clone, clone->getFunction(target));
+
+      optimize(*clone);
+
+      std::string path = TargetsOutput + target + ".bc";
+      if (!writeModule(*clone, path))
+        continue;
+
+      llvm::outs() << target << " " << path << "\n";
+      llvm::outs().flush();
+    }
+
+    // the module itself is not changed
+    return false;
+}
+
 
 